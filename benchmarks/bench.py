@@ -0,0 +1,631 @@
+#!/usr/bin/env python3
+
+"""
+Benchmark the stages of piaware2influx.py with synthetic BaseStation traffic,
+or Beast binary traffic with --input-format beast.
+
+Each stage is run in its own process, so its peak RSS is its own:
+
+framing: splitting received data into lines or Beast frames
+         (per read of --recv-size bytes)
+parse:   parsing lines into messages, including timestamps, or decoding
+         Beast frames into messages (per line or frame)
+state:   updating the state database from parsed messages (per message)
+encode:  encoding points as line protocol (per point)
+send:    sending batches of line protocol to a stub, standing in for
+         Telegraf or InfluxDB (see --sink) (per batch)
+e2e:     the whole pipeline, from received data to the stub
+         (per read of --recv-size bytes)
+
+Throughput is measured over an untimed pass, and latency percentiles over a
+second pass timing each operation. Results can be saved as JSON, and
+compared against a previous run.
+"""
+
+import os
+import sys
+import json
+import time
+import datetime
+import socket
+import argparse
+import platform
+import resource
+import threading
+import tempfile
+import subprocess
+import http.server
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'rootfs'))
+
+import piaware2influx as p2i    # noqa: E402
+from sbs_generator import SBSGenerator, DEFAULT_MIX    # noqa: E402
+
+
+STAGES = ('framing', 'parse', 'state', 'encode', 'send', 'e2e')
+
+
+class StubHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Accepts line protocol as Telegraf's inputs.http_listener or InfluxDB's
+    /write API would.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub():
+    """
+    Start an HTTP stub in a background thread, and return its URL.
+    """
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    server.daemon_threads = True
+    stub_thread = threading.Thread(target=server.serve_forever)
+    stub_thread.daemon = True
+    stub_thread.start()
+    return "http://127.0.0.1:%d" % (server.server_address[1])
+
+
+def start_socket_stub(sink):
+    """
+    Start a UDP or Unix socket stub in a background thread, reading and
+    discarding line protocol as Telegraf's inputs.socket_listener would.
+    Returns its URL.
+
+    Parameters:
+    sink (str): 'udp' or 'unix'
+    """
+    if sink == 'udp':
+        server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+        server.bind(('127.0.0.1', 0))
+        url = "udp://127.0.0.1:%d" % (server.getsockname()[1])
+
+        def serve():
+            while True:
+                server.recv(65536)
+    else:
+        path = os.path.join(tempfile.mkdtemp(), 'telegraf.sock')
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(path)
+        server.listen(8)
+        url = "unix://" + path
+
+        def discard(connection):
+            while connection.recv(1 << 20):
+                pass
+
+        def serve():
+            while True:
+                connection, _ = server.accept()
+                reader = threading.Thread(target=discard, args=(connection,))
+                reader.daemon = True
+                reader.start()
+    stub_thread = threading.Thread(target=serve)
+    stub_thread.daemon = True
+    stub_thread.start()
+    return url
+
+
+def start_sink_stub(sink):
+    """
+    Start a stub for the sink being benchmarked, and return its URL.
+
+    Parameters:
+    sink (str): Sink being benchmarked, as given to --sink
+    """
+    if sink in ('udp', 'unix'):
+        return start_socket_stub(sink)
+    return start_stub()
+
+
+def percentile(ordered, fraction):
+    """
+    Return a percentile of a sorted list.
+
+    Parameters:
+    ordered (list): Sorted values
+    fraction (float): Percentile, from 0 to 1
+    """
+    if not ordered:
+        return 0.0
+    return ordered[int(round(fraction * (len(ordered) - 1)))]
+
+
+def measure(setup):
+    """
+    Measure a stage.
+
+    'setup' is called before each pass, and returns (op, items, count):
+    op is called once per item, and count is how many of the stage's units
+    (messages, points or lines) the items hold.
+
+    Returns a dict of results.
+
+    Parameters:
+    setup (callable): Prepares a pass of the stage
+    """
+    op, items, count = setup()
+    started = time.perf_counter()
+    for item in items:
+        op(item)
+    elapsed = time.perf_counter() - started
+
+    op, items, _ = setup()
+    latencies = []
+    clock = time.perf_counter
+    for item in items:
+        op_started = clock()
+        op(item)
+        latencies.append(clock() - op_started)
+    latencies.sort()
+
+    return {
+        'count': count,
+        'ops': len(items),
+        'seconds': elapsed,
+        'rate': count / elapsed if elapsed else 0.0,
+        'p50_us': percentile(latencies, 0.50) * 1e6,
+        'p99_us': percentile(latencies, 0.99) * 1e6,
+        }
+
+
+def new_sink(args):
+    """
+    Return a sink sending to the stub.
+
+    Parameters:
+    args (argparse.Namespace): Benchmark options
+    """
+    if args.sink in ('udp', 'unix'):
+        return p2i.socket_sink(args.telegraf_url)
+    if args.sink == 'influxdb':
+        return p2i.InfluxDBSink(args.telegraf_url, 'piaware')
+    return p2i.TelegrafSink(args.telegraf_url + '/write')
+
+
+def new_processor(args, **options):
+    """
+    Return an ADSB_Processor that doesn't start its writer.
+
+    Parameters:
+    args (argparse.Namespace): Benchmark options
+    options: Passed through to ADSB_Processor
+    """
+    return p2i.ADSB_Processor(
+        None, start_writer=False, sink=new_sink(args),
+        input_format=args.input_format, **options)
+
+
+def generate(args):
+    """
+    Return the benchmark's traffic as bytes.
+
+    Parameters:
+    args (argparse.Namespace): Benchmark options
+    """
+    generator = SBSGenerator(
+        seed=args.seed,
+        aircraft=args.aircraft,
+        mix=args.mix,
+        start=datetime.datetime(2026, 1, 1),
+        output_format=args.input_format,
+        )
+    return generator.data(args.messages)
+
+
+def chunks(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def bench_framing(args, data):
+    def setup():
+        processor = new_processor(args)
+        feed = processor.feed
+
+        def op(chunk):
+            feed.buffer.extend(chunk)
+            processor.frame(feed)
+        return op, chunks(data, args.recv_size), args.messages
+    return measure(setup), 'msgs/s', 'read'
+
+
+def bench_parse(args, data):
+    if args.input_format == 'beast':
+        frames = p2i.split_beast_frames(bytearray(data))
+
+        def setup():
+            decoder = p2i.BeastDecoder()
+            decoder.receive(frames, int(time.time() * 1e9))
+            return decoder.decode, frames, len(frames)
+        return measure(setup), 'msgs/s', 'message'
+
+    lines = data.decode('UTF-8').splitlines()
+
+    def setup():
+        timestamps = p2i.SBSTimestampParser(p2i.dateutil.tz.gettz())
+
+        def op(line):
+            message, _ = p2i.parse_sbs_message(line)
+            if message is not None:
+                message.timestamp = timestamps.parse(
+                    message.date, message.time)
+        return op, lines, len(lines)
+    return measure(setup), 'msgs/s', 'message'
+
+
+def parse_all(args, data):
+    """
+    Return the valid messages in the benchmark's traffic.
+
+    Parameters:
+    args (argparse.Namespace): Benchmark options
+    data (bytes): Benchmark traffic
+    """
+    if args.input_format == 'beast':
+        decoder = p2i.BeastDecoder()
+        frames = p2i.split_beast_frames(bytearray(data))
+        decoder.receive(frames, int(time.time() * 1e9))
+        messages = []
+        for frame in frames:
+            message, _ = decoder.decode(frame)
+            if message is not None:
+                messages.append(message)
+        return messages
+
+    timestamps = p2i.SBSTimestampParser(p2i.dateutil.tz.gettz())
+    messages = []
+    for line in data.decode('UTF-8').splitlines():
+        message, _ = p2i.parse_sbs_message(line)
+        if message is not None:
+            message.timestamp = timestamps.parse(message.date, message.time)
+            messages.append(message)
+    return messages
+
+
+def bench_state(args, data):
+    messages = parse_all(args, data)
+
+    def setup():
+        processor = new_processor(args)
+
+        def op(message):
+            processor.update_state(message)
+            del processor.database[message.hexident].data_to_send[:]
+            processor.clean_database()
+        return op, messages, len(messages)
+    return measure(setup), 'msgs/s', 'message'
+
+
+def bench_encode(args, data):
+    processor = new_processor(args)
+    points = []
+    for message in parse_all(args, data):
+        processor.update_state(message)
+        vessel = processor.database[message.hexident]
+        for timestamp, fields, _ in vessel.data_to_send:
+            points.append((vessel, timestamp, fields))
+        del vessel.data_to_send[:]
+    encode = processor.encoder.encode
+    tags = processor.feed.tags
+
+    def setup():
+        def op(point):
+            encode(point[0], point[1], point[2], tags)
+        return op, points, len(points)
+    return measure(setup), 'points/s', 'point'
+
+
+def encode_all(args, data):
+    """
+    Return the line protocol encoded from the benchmark's traffic.
+
+    Parameters:
+    args (argparse.Namespace): Benchmark options
+    data (bytes): Benchmark traffic
+    """
+    processor = new_processor(args)
+    processor.write_q = p2i.LineList()
+    processor.add_data_to_buffer(data)
+    return processor.write_q
+
+
+def bench_send(args, data):
+    lines = encode_all(args, data)
+    payloads = [
+        "\n".join(lines[i:i + args.batch_lines]).encode('UTF-8')
+        for i in range(0, len(lines), args.batch_lines)
+        ]
+    sink = new_sink(args)
+
+    def setup():
+        def op(payload):
+            if not sink.send(payload):
+                raise RuntimeError("Stub rejected a batch")
+        return op, payloads, len(lines)
+    results = measure(setup)
+    sink.close()
+    encode = getattr(sink, 'encode', bytes)
+    results['bytes_per_point'] = sum(
+        len(encode(payload)) for payload in payloads) / len(lines)
+    return results, 'points/s', 'batch'
+
+
+def bench_e2e(args, data):
+    reads = chunks(data, args.recv_size)
+    results = {}
+    for timed in (False, True):
+        processor = new_processor(
+            args,
+            batch_max_lines=args.batch_lines,
+            queue_policy='block',
+            )
+        processor.writer.start()
+        latencies = []
+        clock = time.perf_counter
+        started = clock()
+        for chunk in reads:
+            if timed:
+                op_started = clock()
+                processor.add_data_to_buffer(chunk)
+                latencies.append(clock() - op_started)
+            else:
+                processor.add_data_to_buffer(chunk)
+        processor.writer.stop()
+        elapsed = clock() - started
+        if not timed:
+            results = {
+                'count': args.messages,
+                'ops': len(reads),
+                'seconds': elapsed,
+                'rate': args.messages / elapsed,
+                'points': processor.points_sent,
+                }
+    latencies.sort()
+    results['p50_us'] = percentile(latencies, 0.50) * 1e6
+    results['p99_us'] = percentile(latencies, 0.99) * 1e6
+    return results, 'msgs/s', 'read'
+
+
+def run_stage(args):
+    """
+    Run a single stage in this process, printing its results as JSON.
+
+    Parameters:
+    args (argparse.Namespace): Benchmark options
+    """
+    if args.telegraf_url is None:
+        args.telegraf_url = start_sink_stub(args.sink)
+    data = generate(args)
+    results, rate_unit, op_unit = globals()['bench_' + args.stage](args, data)
+    results['rate_unit'] = rate_unit
+    results['op_unit'] = op_unit
+    # ru_maxrss is in kilobytes on Linux, and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        peak_rss //= 1024
+    results['peak_rss_kib'] = peak_rss
+    print(json.dumps(results))
+
+
+def git_commit():
+    """
+    Return the current git commit, or None if it can't be found.
+    """
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+            ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_change(new, old, lower_is_better=False):
+    """
+    Format the change from 'old' to 'new' as a percentage, marking
+    regressions with '!'.
+    """
+    if not old:
+        return ""
+    change = (new - old) / old * 100
+    worse = change > 0 if lower_is_better else change < 0
+    return " (%+.1f%%%s)" % (change, "!" if worse and abs(change) >= 5 else "")
+
+
+def report(results, baseline=None):
+    """
+    Print a table of results, compared against a baseline if given.
+
+    Parameters:
+    results (dict): Results of this run
+    baseline (dict): Results of a previous run
+    """
+    if baseline is not None:
+        print("Compared against %s (commit %s)" % (
+            baseline['created'], baseline.get('commit')))
+    print("%-8s %24s %22s %22s %22s" % (
+        "stage", "rate", "p50 (us/op)", "p99 (us/op)", "peak RSS (KiB)"))
+    for stage, result in results['stages'].items():
+        old = {}
+        if baseline is not None:
+            old = baseline['stages'].get(stage, {})
+        print("%-8s %24s %22s %22s %22s" % (
+            stage,
+            "%.0f %s%s" % (
+                result['rate'], result['rate_unit'],
+                format_change(result['rate'], old.get('rate'))),
+            "%.1f%s" % (
+                result['p50_us'],
+                format_change(result['p50_us'], old.get('p50_us'), True)),
+            "%.1f%s" % (
+                result['p99_us'],
+                format_change(result['p99_us'], old.get('p99_us'), True)),
+            "%d%s" % (
+                result['peak_rss_kib'],
+                format_change(
+                    result['peak_rss_kib'], old.get('peak_rss_kib'), True)),
+            ))
+
+
+def run(args):
+    """
+    Run each stage in its own process, then report and save the results.
+
+    Parameters:
+    args (argparse.Namespace): Benchmark options
+    """
+    stages = args.stages.split(',')
+    for stage in stages:
+        if stage not in STAGES:
+            sys.exit("Unknown stage '%s', expected one of: %s" % (
+                stage, ", ".join(STAGES)))
+    if args.telegraf_url is None:
+        args.telegraf_url = start_sink_stub(args.sink)
+
+    options = [
+        '--messages', str(args.messages),
+        '--aircraft', str(args.aircraft),
+        '--mix', args.mix,
+        '--seed', str(args.seed),
+        '--recv-size', str(args.recv_size),
+        '--batch-lines', str(args.batch_lines),
+        '--sink', args.sink,
+        '--input-format', args.input_format,
+        '--telegraf-url', args.telegraf_url,
+        ]
+    results = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'options': {
+            'messages': args.messages,
+            'aircraft': args.aircraft,
+            'mix': args.mix,
+            'seed': args.seed,
+            'recv_size': args.recv_size,
+            'batch_lines': args.batch_lines,
+            'sink': args.sink,
+            'input_format': args.input_format,
+            },
+        'stages': {},
+        }
+    for stage in stages:
+        output = subprocess.check_output(
+            [sys.executable, os.path.abspath(__file__), '--stage', stage] +
+            options)
+        results['stages'][stage] = json.loads(output.decode().splitlines()[-1])
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('options') != results['options']:
+            print("WARNING: baseline was run with different options: %r" % (
+                baseline.get('options')))
+    report(results, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write("\n")
+        print("Results saved to %s" % (args.output))
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description=__doc__.strip(),
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        )
+    parser.add_argument(
+        '--stages',
+        default=",".join(STAGES),
+        help="Comma separated stages to run [%s]" % (",".join(STAGES))
+        )
+    parser.add_argument(
+        '--messages',
+        default=200000,
+        type=int,
+        help="Number of messages to generate [200000]"
+        )
+    parser.add_argument(
+        '--aircraft',
+        default=200,
+        type=int,
+        help="Number of aircraft [200]"
+        )
+    parser.add_argument(
+        '--mix',
+        default=DEFAULT_MIX,
+        help="Mix of transmission types, as type:weight,... [%s]" % (
+            DEFAULT_MIX)
+        )
+    parser.add_argument(
+        '--seed',
+        default=1,
+        type=int,
+        help="Random seed [1]"
+        )
+    parser.add_argument(
+        '--recv-size',
+        default=16384,
+        type=int,
+        help="Bytes per read for the framing and e2e stages [16384]"
+        )
+    parser.add_argument(
+        '--batch-lines',
+        default=5000,
+        type=int,
+        help="Lines per batch for the send and e2e stages [5000]"
+        )
+    parser.add_argument(
+        '--sink',
+        default='telegraf',
+        choices=('telegraf', 'influxdb', 'udp', 'unix'),
+        help="Send as to Telegraf over HTTP, as to InfluxDB with "
+             "--influxdb-url, or as to Telegraf with --output udp:// or "
+             "unix:// [telegraf]"
+        )
+    parser.add_argument(
+        '--input-format',
+        default='sbs',
+        choices=('sbs', 'beast'),
+        help="Benchmark with BaseStation (sbs) or Beast binary (beast) "
+             "traffic [sbs]"
+        )
+    parser.add_argument(
+        '--output', '-o',
+        help="Save results as JSON to this file"
+        )
+    parser.add_argument(
+        '--compare', '-c',
+        help="Compare against results previously saved with --output"
+        )
+    parser.add_argument(
+        '--telegraf-url',
+        help=argparse.SUPPRESS
+        )
+    parser.add_argument(
+        '--stage',
+        choices=STAGES,
+        help=argparse.SUPPRESS
+        )
+    args = parser.parse_args()
+
+    if args.stage:
+        run_stage(args)
+    else:
+        run(args)
@@ -0,0 +1,491 @@
+#!/usr/bin/env python3
+
+"""
+Generate synthetic dump1090 TCP BaseStation (SBS) or Beast binary traffic.
+
+Aircraft fly drifting tracks around a receiver, and messages are drawn from
+a configurable mix of transmission types. Types 2 and 3 are both drawn as
+positions, and sent as type 2 (surface) for aircraft on the ground and
+type 3 (airborne) otherwise, as dump1090 would. Output is reproducible for a
+given seed, so it can be used to benchmark piaware2influx.py, or written to
+a file and replayed with 'piaware2influx.py --replay'.
+
+In Beast output, each transmission type is sent as the Mode S message
+dump1090 would have decoded it from: 1, 2, 3 and 4 as DF17 identification,
+surface position, airborne position and airborne velocity, 5 as DF4, 6 as
+DF5, 7 as DF0 and 8 as DF11.
+"""
+
+import sys
+import math
+import random
+import datetime
+import argparse
+
+
+# Default mix of transmission types, roughly as seen from a busy receiver
+DEFAULT_MIX = "1:3,2:1,3:35,4:30,5:15,6:2,7:6,8:8"
+
+
+def parse_mix(spec):
+    """
+    Parse a mix of transmission types given as 'type:weight,...'.
+
+    Returns a list of (type, weight).
+
+    Parameters:
+    spec (str): Mix specification
+    """
+    mix = []
+    for item in spec.split(','):
+        transmission_type, _, weight = item.partition(':')
+        transmission_type = int(transmission_type)
+        if not 1 <= transmission_type <= 8:
+            raise ValueError(
+                "Transmission type %d is not 1 to 8" % (transmission_type))
+        mix.append((transmission_type, float(weight or 1)))
+    return mix
+
+
+def _crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 16
+        for _ in range(8):
+            crc <<= 1
+            if crc & 0x1000000:
+                crc ^= 0x1fff409
+        table.append(crc)
+    return table
+
+
+CRC_TABLE = _crc_table()
+
+
+def crc(data):
+    """
+    Return the Mode S CRC-24 of 'data'.
+
+    Parameters:
+    data (bytes): Mode S message, without its parity bytes
+    """
+    value = 0
+    for byte in data:
+        value = ((value << 8) & 0xffffff) ^ CRC_TABLE[(value >> 16) ^ byte]
+    return value
+
+
+def cpr_nl(latitude):
+    """
+    Return the number of CPR longitude zones at a latitude.
+
+    Parameters:
+    latitude (float): Latitude
+    """
+    if abs(latitude) >= 87:
+        return 2 if abs(latitude) == 87 else 1
+    ratio = ((1 - math.cos(math.pi / 30)) /
+             math.cos(math.radians(latitude)) ** 2)
+    return min(59, int(2 * math.pi / math.acos(1 - ratio)))
+
+
+def cpr_encode(latitude, longitude, odd, surface=False):
+    """
+    Return a position CPR encoded as (latitude, longitude), 17 bits each.
+
+    Parameters:
+    latitude (float): Latitude
+    longitude (float): Longitude
+    odd (int): 1 for an odd frame, 0 for an even frame
+    surface (bool): Encode as a surface position
+    """
+    span = 90.0 if surface else 360.0
+    dlat = span / (60 - odd)
+    yz = math.floor(131072 * (latitude % dlat) / dlat + 0.5)
+    rlat = dlat * (yz / 131072.0 + math.floor(latitude / dlat))
+    dlon = span / max(cpr_nl(rlat) - odd, 1)
+    xz = math.floor(131072 * (longitude % dlon) / dlon + 0.5)
+    return yz & 0x1ffff, xz & 0x1ffff
+
+
+# Bits of a 13 bit identity field for each bit of a squawk's octal digits
+ID13_BITS = (
+    (0x1000, 0x0010), (0x0800, 0x1000), (0x0400, 0x0020), (0x0200, 0x2000),
+    (0x0100, 0x0040), (0x0080, 0x4000), (0x0020, 0x0100), (0x0010, 0x0001),
+    (0x0008, 0x0200), (0x0004, 0x0002), (0x0002, 0x0400), (0x0001, 0x0004),
+    )
+
+
+def encode_id13(squawk):
+    """
+    Return a squawk as a 13 bit identity field.
+
+    Parameters:
+    squawk (str): Squawk, e.g.: '7700'
+    """
+    digits = int(squawk, 16)
+    return sum(bit for bit, digit in ID13_BITS if digits & digit)
+
+
+def altitude_code(altitude, bits):
+    """
+    Return an altitude as a 12 or 13 bit altitude code, in 25 ft steps.
+
+    Parameters:
+    altitude (int): Altitude in ft
+    bits (int): 12 (ADS-B) or 13 (surveillance replies)
+    """
+    n = max(0, int(altitude) + 1000) // 25
+    if bits == 12:
+        return ((n & 0x7f0) << 1) | 0x10 | (n & 0xf)
+    return ((n & 0x7e0) << 2) | ((n & 0x10) << 1) | 0x10 | (n & 0xf)
+
+
+# ADS-B identification characters, 6 bits each
+CHARSET = "#ABCDEFGHIJKLMNOPQRSTUVWXYZ##### ###############0123456789######"
+
+
+def surface_movement(speed):
+    """
+    Return the ADS-B surface movement code nearest to a speed.
+
+    Parameters:
+    speed (float): Speed in kt
+    """
+    if speed <= 0:
+        return 1
+    steps = ((2, 0.125, 0.125), (9, 1.25, 0.25), (13, 2.5, 0.5),
+             (39, 16, 1), (94, 72, 2), (109, 105, 5))
+    for code, base, step in reversed(steps):
+        if speed >= base:
+            return min(123, code + int(round((speed - base) / step)))
+    return 2
+
+
+def flag(value):
+    """
+    Format a flag as dump1090 does ('-1' for true, '0' for false).
+
+    Parameters:
+    value (bool): Flag
+    """
+    return '-1' if value else '0'
+
+
+class Aircraft():
+    """
+    State of a synthetic aircraft.
+    """
+
+    def __init__(self, rng, receiver_lat, receiver_lon):
+        """
+        Instantiate instance of Aircraft, somewhere near the receiver.
+
+        Parameters:
+        rng (random.Random): Random number generator
+        receiver_lat (float): Receiver latitude
+        receiver_lon (float): Receiver longitude
+        """
+        self.hexident = "%06X" % (rng.randrange(0x100000, 0xFFFFFF))
+        self.address = int(self.hexident, 16)
+        self.signal = rng.randrange(20, 250)
+        self.odd = 0
+        self.callsign = "%s%d" % (
+            rng.choice(("QFA", "VOZ", "JST", "RXA", "UAE", "SIA")),
+            rng.randrange(1, 2000))
+        self.squawk = "%04o" % (rng.randrange(0, 0o7777))
+        self.latitude = receiver_lat + rng.uniform(-2, 2)
+        self.longitude = receiver_lon + rng.uniform(-2, 2)
+        self.on_ground = rng.random() < 0.05
+        if self.on_ground:
+            self.altitude = 0
+            self.groundspeed = rng.uniform(0, 30)
+            self.verticalrate = 0
+        else:
+            self.altitude = rng.randrange(1000, 41000, 25)
+            self.groundspeed = rng.uniform(150, 520)
+            self.verticalrate = rng.choice((0, 0, 0, -1024, -640, 768, 1472))
+        self.track = rng.uniform(0, 360)
+
+    def drift(self, rng, seconds):
+        """
+        Move the aircraft along its track, drifting its heading, speed and
+        vertical rate.
+
+        Parameters:
+        rng (random.Random): Random number generator
+        seconds (float): Time since the aircraft last moved
+        """
+        self.track = (self.track + rng.gauss(0, 0.5)) % 360
+        if not self.on_ground:
+            self.groundspeed = max(100, self.groundspeed + rng.gauss(0, 0.5))
+            if rng.random() < 0.01:
+                self.verticalrate = rng.choice((0, -1024, -640, 768, 1472))
+            self.altitude = min(45000, max(
+                0, self.altitude + self.verticalrate * seconds / 60))
+        distance = self.groundspeed * seconds / 3600 / 60    # degrees
+        self.latitude += distance * math.cos(math.radians(self.track))
+        self.longitude += distance * math.sin(math.radians(self.track))
+
+
+class SBSGenerator():
+    """
+    Generates BaseStation messages from a fleet of synthetic aircraft.
+    """
+
+    def __init__(self, seed=1, aircraft=100, mix=DEFAULT_MIX, rate=1000,
+                 start=None, receiver_lat=-31.95, receiver_lon=115.86,
+                 garbage=0.0, output_format='sbs'):
+        """
+        Instantiate instance of SBSGenerator.
+
+        Parameters:
+        seed (int): Random seed
+        aircraft (int): Number of aircraft
+        mix (str): Mix of transmission types, as 'type:weight,...'
+        rate (float): Messages per second of message time
+        start (datetime.datetime): Time of the first message
+                                   (defaults to now)
+        receiver_lat (float): Receiver latitude
+        receiver_lon (float): Receiver longitude
+        garbage (float): Fraction of lines that are malformed
+        output_format (str): 'sbs' (BaseStation) or 'beast' (Beast binary)
+        """
+        self.rng = random.Random(seed)
+        self.fleet = [
+            Aircraft(self.rng, receiver_lat, receiver_lon)
+            for _ in range(aircraft)
+            ]
+        mix = parse_mix(mix)
+        self.types = [transmission_type for transmission_type, _ in mix]
+        self.weights = [weight for _, weight in mix]
+        self.interval = 1.0 / rate
+        self.now = start or datetime.datetime.now()
+        self.garbage = garbage
+        self.output_format = output_format
+
+    def transmission_type(self, aircraft):
+        """
+        Draw the transmission type of an aircraft's next message from the mix.
+
+        Parameters:
+        aircraft (Aircraft): Aircraft sending the message
+        """
+        transmission_type = self.rng.choices(self.types, self.weights)[0]
+        if transmission_type in (2, 3):
+            transmission_type = 2 if aircraft.on_ground else 3
+        return transmission_type
+
+    def message(self):
+        """
+        Return the next message, as a line without a line ending.
+        """
+        rng = self.rng
+        self.now += datetime.timedelta(seconds=self.interval)
+        if self.garbage and rng.random() < self.garbage:
+            return rng.choice((
+                "", "MSG,3,1,1", "garbage", "MSG,3,1,1,,1,,,,,,,,,,,,,,,,"))
+
+        aircraft = rng.choice(self.fleet)
+        aircraft.drift(rng, self.interval * len(self.fleet))
+        transmission_type = self.transmission_type(aircraft)
+
+        fields = [''] * 22
+        fields[0] = 'MSG'
+        fields[1] = str(transmission_type)
+        fields[2] = '1'
+        fields[3] = '1'
+        fields[4] = aircraft.hexident
+        fields[5] = '1'
+        date = self.now.strftime('%Y/%m/%d')
+        time_of_day = self.now.strftime('%H:%M:%S.%f')[:12]
+        fields[6] = fields[8] = date
+        fields[7] = fields[9] = time_of_day
+
+        altitude = str(int(aircraft.altitude) // 25 * 25)
+        if transmission_type == 1:
+            fields[10] = aircraft.callsign
+        elif transmission_type == 2:
+            fields[11] = '0'
+            fields[12] = "%.0f" % (aircraft.groundspeed)
+            fields[13] = "%.0f" % (aircraft.track)
+            fields[14] = "%.5f" % (aircraft.latitude)
+            fields[15] = "%.5f" % (aircraft.longitude)
+        elif transmission_type == 3:
+            fields[11] = altitude
+            fields[14] = "%.5f" % (aircraft.latitude)
+            fields[15] = "%.5f" % (aircraft.longitude)
+        elif transmission_type == 4:
+            fields[12] = "%.0f" % (aircraft.groundspeed)
+            fields[13] = "%.0f" % (aircraft.track)
+            fields[16] = str(aircraft.verticalrate)
+        elif transmission_type in (5, 6, 7):
+            fields[11] = altitude
+            if transmission_type == 6:
+                fields[17] = aircraft.squawk
+        if transmission_type in (3, 5, 6):
+            fields[18] = flag(False)
+            fields[20] = flag(False)
+        if transmission_type in (3, 6):
+            fields[19] = flag(False)
+        if transmission_type in (2, 3, 5, 6, 7, 8):
+            fields[21] = flag(aircraft.on_ground)
+        return ','.join(fields)
+
+    def beast_frame(self):
+        """
+        Return the next message, as an escaped Beast frame.
+        """
+        rng = self.rng
+        self.now += datetime.timedelta(seconds=self.interval)
+        if self.garbage and rng.random() < self.garbage:
+            return bytes(rng.randrange(256) for _ in range(rng.randrange(20)))
+
+        aircraft = rng.choice(self.fleet)
+        aircraft.drift(rng, self.interval * len(self.fleet))
+        transmission_type = self.transmission_type(aircraft)
+        address = aircraft.address
+
+        if transmission_type <= 4:
+            capability = 4 if aircraft.on_ground else 5
+            if transmission_type == 1:
+                chars = 0
+                for char in aircraft.callsign.ljust(8)[:8]:
+                    chars = (chars << 6) | CHARSET.index(char)
+                me = (4 << 51) | chars
+            elif transmission_type in (2, 3):
+                surface = transmission_type == 2
+                odd = aircraft.odd
+                aircraft.odd ^= 1
+                lat, lon = cpr_encode(
+                    aircraft.latitude, aircraft.longitude, odd, surface)
+                if surface:
+                    me = ((7 << 51) |
+                          (surface_movement(aircraft.groundspeed) << 44) |
+                          (1 << 43) |
+                          (int(aircraft.track * 128 / 360) % 128 << 36))
+                else:
+                    me = ((11 << 51) |
+                          (altitude_code(aircraft.altitude, 12) << 36))
+                me |= (odd << 34) | (lat << 17) | lon
+            else:
+                east = aircraft.groundspeed * math.sin(
+                    math.radians(aircraft.track))
+                north = aircraft.groundspeed * math.cos(
+                    math.radians(aircraft.track))
+                rate = aircraft.verticalrate
+                me = ((19 << 51) | (1 << 48) |
+                      ((east < 0) << 42) |
+                      (min(1023, int(round(abs(east))) + 1) << 32) |
+                      ((north < 0) << 31) |
+                      (min(1023, int(round(abs(north))) + 1) << 21) |
+                      ((rate < 0) << 19) |
+                      (min(511, abs(rate) // 64 + 1) << 10))
+            data = (bytes([(17 << 3) | capability]) +
+                    address.to_bytes(3, 'big') + me.to_bytes(7, 'big'))
+            message = data + crc(data).to_bytes(3, 'big')
+        elif transmission_type == 8:
+            data = (bytes([(11 << 3) | (4 if aircraft.on_ground else 5)]) +
+                    address.to_bytes(3, 'big'))
+            message = data + crc(data).to_bytes(3, 'big')
+        else:
+            if transmission_type == 6:
+                df = 5
+                field = encode_id13(aircraft.squawk)
+            else:
+                df = 0 if transmission_type == 7 else 4
+                field = altitude_code(aircraft.altitude, 13)
+            status = 1 if aircraft.on_ground else 0
+            if df == 0:
+                status <<= 2
+            data = ((df << 27) | (status << 24) | field).to_bytes(4, 'big')
+            message = data + (crc(data) ^ address).to_bytes(3, 'big')
+
+        # 12 MHz receiver clock, and the signal level
+        clock = int(self.now.timestamp() * 12000000) & 0xffffffffffff
+        signal = max(1, min(255, aircraft.signal + rng.randrange(-8, 9)))
+        body = clock.to_bytes(6, 'big') + bytes([signal]) + message
+        return (b'\x1a' + (b'3' if len(message) == 14 else b'2') +
+                body.replace(b'\x1a', b'\x1a\x1a'))
+
+    def lines(self, count):
+        """
+        Return a list of 'count' messages.
+
+        Parameters:
+        count (int): Number of messages
+        """
+        return [self.message() for _ in range(count)]
+
+    def data(self, count):
+        """
+        Return 'count' messages as bytes, as sent by dump1090.
+
+        Parameters:
+        count (int): Number of messages
+        """
+        if self.output_format == 'beast':
+            return b"".join(self.beast_frame() for _ in range(count))
+        return ("\r\n".join(self.lines(count)) + "\r\n").encode('UTF-8')
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument(
+        '--messages',
+        default=100000,
+        type=int,
+        help="Number of messages to generate [100000]"
+        )
+    parser.add_argument(
+        '--aircraft',
+        default=100,
+        type=int,
+        help="Number of aircraft [100]"
+        )
+    parser.add_argument(
+        '--mix',
+        default=DEFAULT_MIX,
+        help="Mix of transmission types, as type:weight,... [%s]" % (
+            DEFAULT_MIX)
+        )
+    parser.add_argument(
+        '--rate',
+        default=1000,
+        type=float,
+        help="Messages per second of message time [1000]"
+        )
+    parser.add_argument(
+        '--garbage',
+        default=0.0,
+        type=float,
+        help="Fraction of lines that are malformed [0.0]"
+        )
+    parser.add_argument(
+        '--seed',
+        default=1,
+        type=int,
+        help="Random seed [1]"
+        )
+    parser.add_argument(
+        '--format',
+        default='sbs',
+        choices=('sbs', 'beast'),
+        help="Output BaseStation (sbs) or Beast binary (beast) [sbs]"
+        )
+    args = parser.parse_args()
+
+    generator = SBSGenerator(
+        seed=args.seed,
+        aircraft=args.aircraft,
+        mix=args.mix,
+        rate=args.rate,
+        garbage=args.garbage,
+        output_format=args.format,
+        )
+    out = sys.stdout.buffer
+    for _ in range(args.messages // 1000):
+        out.write(generator.data(1000))
+    if args.messages % 1000:
+        out.write(generator.data(args.messages % 1000))
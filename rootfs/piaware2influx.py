@@ -1,762 +1,4658 @@
 #!/usr/bin/env python3
 
-__version__ = "2020-11-24"
+__version__ = "2026-10-17"
 
 # Protocol data from this URL:
 # http://woodair.net/sbs/article/barebones42_socket_data.htm
 
 import sys
 import os
+import math
 import socket
 import datetime
 import time
 import argparse
 import requests
-import inspect
+import requests.adapters
+import logging
+import logging.handlers
+import atexit
 import dateutil.tz
 import threading
 import queue
+import collections
+import functools
+import asyncio
+import concurrent.futures
+import multiprocessing
+import signal
+import gzip
+import bisect
+import http.server
+import socketserver
+import urllib.parse
+import cProfile
+import pstats
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+logger = logging.getLogger('piaware2influx')
+
+
+class CountersFilter(logging.Filter):
+    """
+    Adds an ADSB_Processor's RX, TX and V counters to log records.
+
+    Runs in the thread doing the logging, but only for records that pass
+    the logger's level, so disabled log levels cost nothing.
+    """
 
+    def __init__(self):
+        logging.Filter.__init__(self)
+        self.processor = None
 
-class ADSB_Processor():
+    def filter(self, record):
+        processor = self.processor
+        if processor is None:
+            record.rx = record.tx = record.vessels = '-'
+        else:
+            record.rx = processor.messages_processed
+            record.tx = processor.points_sent
+            record.vessels = processor.vessels
+        return True
+
+
+class LogFormatter(logging.Formatter):
     """
-    Receives ADSB information, converts to InfluxDB line protocol.
+    Formats log records as:
 
-    Sends line protocol data to InfluxDB via Telegraf.
+    Date Time [RX: n, TX: n, V: n] Information
 
-    As not all messages received contain sufficient data to send to InfluxDB,
-    this class keeps a small state database in memory so it is able to
-    construct a message to send to InfluxDB if insufficient data is received.
+    Verbose (debug) records also include the name of the function that
+    logged them.
+    """
 
-    Also, every message contains the vessel's "ident" information,
-    but not all messages contain the callsign.
+    def __init__(self):
+        logging.Formatter.__init__(
+            self,
+            "%(asctime)s [RX: %(rx)s, TX: %(tx)s, V: %(vessels)s] %(message)s",
+            "%Y-%m-%d %H:%M:%S")
 
-    Once a callsign is received, it is kept in the state tracking database.
+    def formatMessage(self, record):
+        if record.levelno == logging.DEBUG:
+            record.message = "<%s> %s" % (record.funcName, record.message)
+        return logging.Formatter.formatMessage(self, record)
 
-    To keep the state tracking memory footprint small,
-    and to ensure information is up-to-date,
-    if no messages have been received from a vessel for a period of 15 minutes
-    or more, the vessel is ejected from the state tracking database.
 
-    For this reason, it is important to have your hosts'
-    clocks synchronised with NTP, and to have the correct timezone set.
+class BufferedStreamHandler(logging.StreamHandler):
+    """
+    Stream handler that leaves flushing to BufferedQueueListener,
+    rather than flushing after every record.
+    """
+
+    def flush(self):
+        pass
+
+    def flush_stream(self):
+        logging.StreamHandler.flush(self)
+
+
+class BufferedQueueListener(logging.handlers.QueueListener):
+    """
+    Writes queued log records from a background thread.
+
+    Handlers are flushed whenever the queue has been drained, so at high
+    log rates output is written in large blocks rather than line by line,
+    and the threads doing the logging never wait on stdout.
+    """
+
+    def handle(self, record):
+        logging.handlers.QueueListener.handle(self, record)
+        if self.queue.empty():
+            self.flush()
+
+    def flush(self):
+        for handler in self.handlers:
+            handler.flush_stream()
+
+    def stop(self):
+        logging.handlers.QueueListener.stop(self)
+        self.flush()
+
+
+def setup_logging(verbose_logging=False, stream=None):
+    """
+    Send log records to stdout via a queue and a background thread.
+
+    Returns the CountersFilter, whose 'processor' should be set once the
+    ADSB_Processor has been created.
+
+    Parameters:
+    verbose_logging (bool): Enable verbose (debug) logging
+    stream (file): Stream to log to (defaults to stdout)
     """
+    handler = BufferedStreamHandler(stream or sys.stdout)
+    handler.setFormatter(LogFormatter())
+
+    log_queue = queue.Queue()
+    listener = BufferedQueueListener(log_queue, handler)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    counters = CountersFilter()
+    queue_handler.addFilter(counters)
+
+    logger.addHandler(queue_handler)
+    logger.setLevel(logging.DEBUG if verbose_logging else logging.INFO)
+    logger.propagate = False
+
+    listener.start()
+    atexit.register(listener.stop)
+    return counters
+
+
+class TelegrafSink():
+    """
+    Sends line protocol to Telegraf's inputs.http_listener.
+
+    Requests go through a single requests.Session, so TCP connections to
+    Telegraf are kept alive and reused rather than opened for every request.
+    The session's connection pool is sized for the number of writer threads
+    sharing it, and a semaphore caps the number of requests in flight.
+    Responses are counted by HTTP status code, and requests that got no
+    response at all are counted as errors.
+    """
+
+    # Name of the service sent to, for logging
+    name = 'telegraf'
 
-    def __init__(self, telegraf_url, verbose_logging=False):
+    # Query parameters and headers sent with each request
+    params = None
+    headers = None
+
+    def __init__(self, telegraf_url, verbose_logging=False,
+                 pool_size=1, max_in_flight=None, timeout=10):
         """
-        Instantiate instance of ADSB_Processor.
+        Instantiate instance of TelegrafSink.
 
         Parameters:
         telegraf_url (str): URL of Telegraf's inputs.http_listener
         verbose_logging (bool): Enable verbose logging
+        pool_size (int): Number of connections to keep open to Telegraf
+        max_in_flight (int): Maximum concurrent requests
+                             (defaults to pool_size)
+        timeout (float): Seconds to wait for Telegraf to respond
         """
-        self.buffer = bytearray()
-        self.database = {}
-        self.messages_processed = 0
-        self.points_sent = 0
         self.telegraf_url = telegraf_url
         self.verbose_logging = verbose_logging
-        self.tz = dateutil.tz.gettz()
-        self._clear_buffer()
-
-        # Start the Telegraf writer
-        self.write_q = queue.Queue()
-        self.write_thread = threading.Thread(target=self.write_loop)
-        self.write_thread.setDaemon(True)
-        self.write_thread.start()
-
-    def write_loop(self):
-        while True:
-            item = self.write_q.get()
-            if item is None:
-                break
-            self.send_line_protocol(item)
-
-    def send_line_protocol(self, line_protocol):
+        self.timeout = timeout
+        pool_size = max(1, pool_size)
+        if max_in_flight is None or max_in_flight < 1:
+            max_in_flight = pool_size
+        self.in_flight = threading.BoundedSemaphore(max_in_flight)
+        self.stats_lock = threading.Lock()
+        self.status_codes = collections.Counter()
+        self.request_errors = 0
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def send(self, line_protocol):
         """
         Send line protocol data to Telegraf.
 
+        Returns True if Telegraf accepted the data.
+
         Parameters:
-        line_protocol (str): Line protocol to be sent
+        line_protocol (bytes): Newline-separated line protocol to be sent
         """
 
         if self.verbose_logging:
-            self.log("Sending line protocol: '%s'" % (repr(line_protocol)))
+            logger.debug("Sending line protocol: %r", line_protocol)
 
         # url = "%s?precision=s"
         try:
-            telegraf_request = \
-                requests.post(self.telegraf_url, data=line_protocol)
-            self.points_sent += 1
-        except:
-            errormsg = "ERROR: could not submit line protocol! "
-            errormsg += repr(line_protocol)
-            self.log(errormsg)
+            with self.in_flight:
+                telegraf_request = self.session.post(
+                    self.telegraf_url,
+                    data=self.encode(line_protocol),
+                    params=self.params,
+                    headers=self.headers,
+                    timeout=self.timeout,
+                    )
+        except requests.exceptions.RequestException as e:
+            with self.stats_lock:
+                self.request_errors += 1
+            logger.error("ERROR: could not submit line protocol! %r", e)
+            return False
+        with self.stats_lock:
+            self.status_codes[telegraf_request.status_code] += 1
         if telegraf_request.status_code != 204:
-            errormsg = "ERROR: telegraf status code was '"
-            errormsg += str(telegraf_request.status_code)
-            errormsg += "' expected '204'!"
-            self.log(errormsg)
-
-    def log(self, text):
+            logger.error(
+                "ERROR: %s status code was '%s' expected '204'! %s",
+                self.name,
+                telegraf_request.status_code,
+                telegraf_request.text[:200].strip())
+            return False
+        return True
+
+    def encode(self, line_protocol):
         """
-        Log handler.
+        Return the body of a request sending 'line_protocol'.
 
         Parameters:
-        text (str): Log message
+        line_protocol (bytes): Newline-separated line protocol to be sent
         """
-        logmsg = "%s [RX: %s, TX: %s, V: %s] %s" % (
-            datetime.datetime.now().replace(tzinfo=self.tz).strftime("%Y-%m-%d %H:%M:%S"),
-            str(self.messages_processed),
-            str(self.points_sent),
-            str(len(self.database.keys())),
-            text)
-        print(logmsg)
-        sys.stdout.flush()
+        return line_protocol
 
-    def log_aircraft(self, hexident, text, no_backoff=False):
+    def close(self):
         """
-        Log a message relating to vessel.
+        Close any connections held open to Telegraf.
+        """
+        self.session.close()
+
+
+class InfluxDBSink(TelegrafSink):
+    """
+    Sends line protocol straight to InfluxDB's /write API, rather than via
+    Telegraf.
+
+    Requests are sent as TelegrafSink sends them, with the database,
+    retention policy and nanosecond precision as query parameters, and
+    the body gzip compressed. InfluxDB responds 204 once the points are
+    written, as Telegraf does.
+    """
 
-        Will only log an individual vessel once per minute.
+    name = 'influxdb'
+
+    def __init__(self, influxdb_url, database, retention_policy=None,
+                 username=None, password=None, gzip_level=1,
+                 verbose_logging=False, pool_size=1, max_in_flight=None,
+                 timeout=10):
+        """
+        Instantiate instance of InfluxDBSink.
 
         Parameters:
-        hexident (str): hexident of vessel
-        text (str): log message
-        no_backoff (bool): if true, ignore the once per minute rule
+        influxdb_url (str): URL of InfluxDB, e.g.: http://influxdb:8086
+        database (str): Database to write to
+        retention_policy (str): Retention policy to write to
+                                (None for the database's default)
+        username (str): User name to authenticate with (None for none)
+        password (str): Password to authenticate with
+        gzip_level (int): gzip compression level, 0 to send uncompressed
+        verbose_logging (bool): Enable verbose logging
+        pool_size (int): Number of connections to keep open to InfluxDB
+        max_in_flight (int): Maximum concurrent requests
+                             (defaults to pool_size)
+        timeout (float): Seconds to wait for InfluxDB to respond
+        """
+        self.influxdb_url = influxdb_url.rstrip('/')
+        if self.influxdb_url.endswith('/write'):
+            self.influxdb_url = self.influxdb_url[:-len('/write')]
+        TelegrafSink.__init__(
+            self,
+            self.influxdb_url + '/write',
+            verbose_logging=verbose_logging,
+            pool_size=pool_size,
+            max_in_flight=max_in_flight,
+            timeout=timeout,
+            )
+        self.database = database
+        self.params = {'db': database, 'precision': 'ns'}
+        if retention_policy:
+            self.params['rp'] = retention_policy
+        if username:
+            self.session.auth = (username, password or '')
+        self.gzip_level = gzip_level
+        if gzip_level > 0:
+            self.headers = {'Content-Encoding': 'gzip'}
+
+    def encode(self, line_protocol):
+        if self.gzip_level > 0:
+            return gzip.compress(line_protocol, self.gzip_level)
+        return line_protocol
+
+    def create_database(self):
+        """
+        Create the database if it doesn't already exist, as Telegraf does.
+
+        Returns True if the database exists. Failure is logged rather than
+        raised, as the user may not have permission to create databases.
         """
+        try:
+            response = self.session.post(
+                self.influxdb_url + '/query',
+                data={'q': 'CREATE DATABASE "%s"' % (
+                    self.database.replace('\\', '\\\\').replace(
+                        '"', '\\"'))},
+                timeout=self.timeout,
+                )
+        except requests.exceptions.RequestException as e:
+            logger.error(
+                "ERROR: could not create InfluxDB database '%s'! %r",
+                self.database, e)
+            return False
+        if response.status_code != 200:
+            logger.error(
+                "ERROR: could not create InfluxDB database '%s'! "
+                "status code was '%s' %s",
+                self.database,
+                response.status_code,
+                response.text[:200].strip())
+            return False
+        return True
+
+
+class FileSink():
+    """
+    Writes line protocol to a file, rather than sending it to Telegraf.
 
-        logstuff = self.verbose_logging
+    Files whose names end in '.gz' are gzip compressed.
+    """
 
-        # if this vessel hasn't been logged, set up 'lastlogged' info
-        if 'lastlogged' not in self.database[hexident].keys():
-            logstuff = True
-            self.database[hexident]['lastlogged'] = \
-                datetime.datetime.now().replace(tzinfo=self.tz)
-            if self.verbose_logging:
-                self.log("<%s> Setting lastlogged for '%s' to '%s'" % (inspect.currentframe().f_code.co_name, hexident, self.database[hexident]['lastlogged']))
+    def __init__(self, path):
+        """
+        Instantiate instance of FileSink.
 
-        # if the vessel has been logged
+        Parameters:
+        path (str): File to write line protocol to
+        """
+        if path.endswith('.gz'):
+            self.file = gzip.open(path, 'wb')
         else:
+            self.file = open(path, 'wb')
+        self.lock = threading.Lock()
 
-            # if we need to back off (ie: log once per minute)
-            if not no_backoff:
-                cutoff = datetime.datetime.now().replace(tzinfo=self.tz)
-                cutoff -= datetime.timedelta(seconds=60)
-                if self.database[hexident]['lastlogged'] > cutoff:
-                    logstuff = False
-
-        # log the message if required
-        if logstuff or self.verbose_logging or no_backoff:
-            logtext = "[Ident: "
-            logtext += hexident
-            if self.database[hexident]['callsign'] != "":
-                logtext += " Callsign: %s" % (
-                    self.database[hexident]['callsign'])
-            logtext += "] "
-            logtext += text
-            self.log(logtext)
-
-    def _clear_buffer(self):
-        self.buffer[:] = b''
-
-    def add_data_to_buffer(self, datareceived):
+    def send(self, line_protocol):
         """
-        Add raw ADSB data received to internal buffer.
+        Write line protocol data to the file.
 
         Parameters:
-        datareceived (str): raw data received
+        line_protocol (bytes): Newline-separated line protocol to be written
         """
-        self.buffer.extend(datareceived)
-        self.process_buffer()
+        with self.lock:
+            self.file.write(line_protocol)
+            self.file.write(b"\n")
+        return True
 
-    def process_buffer(self):
+    def close(self):
         """
-        Process the data buffer.
-
-        Checks to see if a full ADSB message has been received.
-        If so, process it.
+        Close the file.
         """
+        with self.lock:
+            self.file.close()
 
-        # Read buffer up to end of message.
-        # If any data is left in the buffer, leave it there
-        #   so when we receive the remainder of the data we can
-        #   assemble the message.
-        while len(self.buffer):
-            newline_pos = self.buffer.find(b'\r\n')
-            if newline_pos >= 0:
-                if self.verbose_logging:
-                    self.log("========== START PROCESSING MESSAGE ==========")
-                self.current_message_datetime = None
-                self.process_message(self.buffer[:newline_pos].decode('UTF-8'))
-                self.current_message_datetime = None
-                if self.verbose_logging:
-                    self.log("========== FINISH PROCESSING MESSAGE ==========")
-                del self.buffer[:newline_pos + 2]
-                self.messages_processed += 1
-            else:
-                break
 
-    def clean_database(self, minutes_inactivity=15):
-        """
-        Remove stale entries from vessel database.
+class SocketSink():
+    """
+    Base for sinks sending line protocol to Telegraf's
+    inputs.socket_listener, rather than over HTTP.
 
-        If a message hasn't been received from a vessel for
-        'minutes_inactivity', remove it from the state database.
+    Delivery is fire-and-forget: there is no response to wait for, so
+    there is no per-request round trip, and data that can't be sent is
+    dropped rather than retried. Packets (datagrams, or writes to a
+    stream) sent and dropped are counted.
+    """
 
-        Parameters:
-        minutes_older_than (int): Expire vessel after this many minutes
-                                  of inactivity
+    name = 'socket_listener'
+
+    def __init__(self, address, verbose_logging=False):
         """
-        hexidents_to_remove = set()
-        for hexident in self.database:
-            # work out what was 15 mins ago,
-            # and clean out entries older than 15 minutes
-            cutoff = datetime.datetime.now().replace(tzinfo=self.tz) - \
-                datetime.timedelta(minutes=minutes_inactivity)
+        Instantiate instance of SocketSink.
 
-            if self.database[hexident]['lastseen'] < cutoff:
-                if self.verbose_logging:
-                    self.log("<%s> Vessel '%s' lastseen: '%s', and cutoff: '%s'" % (inspect.currentframe().f_code.co_name, hexident, self.database[hexident]['lastseen'], cutoff))
-                self.log_aircraft(
-                    hexident,
-                    "Expiring inactive vessel from state database",
-                    no_backoff=True)
-                hexidents_to_remove.add(hexident)
+        Parameters:
+        address (str): Address of the socket_listener, for logging
+        verbose_logging (bool): Enable verbose logging
+        """
+        self.address = address
+        self.verbose_logging = verbose_logging
+        self.lock = threading.Lock()
+        self.sock = None
+        self.stats_lock = threading.Lock()
+        self.packets_sent = 0
+        self.packets_dropped = 0
 
-        for hexident in hexidents_to_remove:
-            del self.database[hexident]
+    def connect(self):
+        """
+        Return a new socket connected to the socket_listener.
+        """
+        raise NotImplementedError
 
-    def datetime_msg_generated(self, message):
+    def connected(self):
+        """
+        Return the socket, connecting it first if need be.
         """
-        Generate a datetime from ADSB message.
+        with self.lock:
+            if self.sock is None:
+                self.sock = self.connect()
+            return self.sock
 
-        Uses data from 'Date message generated' and 'Time message generated'
-        fields from the ADSB message and returns a datetime.
+    def dropped(self, packets, error):
+        """
+        Count and log packets that could not be sent.
 
         Parameters:
-        message (list): ADSB Message (split)
+        packets (int): Number of packets dropped
+        error (OSError): Why they could not be sent
         """
-        # Note, the [0:15] below is to prevent issues where timestamps
-        # have a higher resolution than what python can handle.
-        # The %f accepts from 1 to 6 digits.
-        # Some platforms are sending more than 6 digits, so this sets a limit.
-        msgdtstring = "%sT%s" % (message[6], message[7][0:15])
-        msgdt = datetime.datetime.strptime(
-            msgdtstring,
-            '%Y/%m/%dT%H:%M:%S.%f'
-            ).replace(tzinfo=self.tz)
-        if self.verbose_logging:
-            self.log("<%s> Datetime '%s' generated from string '%s'." % \
-                (inspect.currentframe().f_code.co_name,
-                msgdt, 
-                msgdtstring))
-        return msgdt
+        with self.stats_lock:
+            self.packets_dropped += packets
+        logger.error(
+            "ERROR: could not send line protocol to %s! %r",
+            self.address, error)
 
-    def add_vessel_to_db(self, message):
+    def close(self):
         """
-        Add a vessel to the state database.
-
-        Parameters:
-        message (list): ADSB Message (split)
+        Close the socket.
         """
-        self.database[message[4]] = dict()
-        self.database[message[4]]['hexident'] = \
-            message[4].strip()
-        self.database[message[4]]['data_to_send'] = \
-            list()
-        
-        if self.current_message_datetime == None:
-            self.current_message_datetime = self.datetime_msg_generated(message)
-        
-        self.database[message[4]]['lastseen'] = \
-            self.current_message_datetime
+        with self.lock:
+            if self.sock is not None:
+                self.sock.close()
+                self.sock = None
 
-        if self.verbose_logging:
-            self.log("<%s> Setting lastseen for '%s' to '%s'" % \
-                (inspect.currentframe().f_code.co_name,
-                self.database[message[4]]['hexident'], 
-                self.database[message[4]]['lastseen']))
-        
-        self.database[message[4]]['callsign'] = \
-            message[10].strip()
-        self.database[message[4]]['current_altitude'] = \
-            message[11].strip()
-        self.database[message[4]]['current_groundspeed'] = \
-            message[12].strip()
-        self.database[message[4]]['current_track'] = \
-            message[13].strip()
-        self.database[message[4]]['current_latitude'] = \
-            message[14].strip()
-        self.database[message[4]]['current_longitude'] = \
-            message[15].strip()
-        self.database[message[4]]['current_verticalrate'] = \
-            message[16].strip()
-        self.database[message[4]]['squawk'] = \
-            message[17].strip()
-        self.database[message[4]]['alert_squawk_change'] = \
-            message[18].strip()
-        self.database[message[4]]['emergency'] = \
-            message[19].strip()
-        self.database[message[4]]['spi_ident'] = \
-            message[20].strip()
-        self.database[message[4]]['is_on_ground'] = \
-            message[21].strip()
-        self.log_aircraft(message[4], "Now receiving from this vessel", True)
 
-    def update_vessel_in_db(self, message):
+class UDPSink(SocketSink):
+    """
+    Sends line protocol to Telegraf's inputs.socket_listener as UDP
+    datagrams.
+
+    Each batch is packed into as few datagrams as will fit within the
+    path's MTU, splitting only between lines, so datagrams are never
+    fragmented and a lost datagram loses only the lines it held. A line
+    too long for one datagram is sent on its own.
+    """
+
+    def __init__(self, host, port, mtu=1500, verbose_logging=False):
         """
-        Update a vessel in the state database.
+        Instantiate instance of UDPSink.
 
         Parameters:
-        message (list): ADSB Message (split)
+        host (str): Host/IP of the socket_listener
+        port (int): UDP port of the socket_listener
+        mtu (int): MTU of the path to the socket_listener
+        verbose_logging (bool): Enable verbose logging
         """
+        SocketSink.__init__(
+            self, "udp://%s:%d" % (host, port), verbose_logging)
+        self.host = host
+        self.port = port
+        self.mtu = mtu
+        self.datagram_bytes = mtu
+
+    def connect(self):
+        family, _, _, _, address = socket.getaddrinfo(
+            self.host, self.port, type=socket.SOCK_DGRAM)[0]
+        sock = socket.socket(family, socket.SOCK_DGRAM)
+        sock.connect(address)
+        # Leave room for the IP and UDP headers
+        header_bytes = 48 if family == socket.AF_INET6 else 28
+        self.datagram_bytes = max(1, min(self.mtu, 65535) - header_bytes)
+        return sock
+
+    def send(self, line_protocol):
+        """
+        Send line protocol data as datagrams.
 
-        if self.current_message_datetime == None:
-            self.current_message_datetime = self.datetime_msg_generated(message)
-        
-        self.database[message[4]]['lastseen'] = \
-            self.current_message_datetime
+        Returns True if every datagram was sent.
 
-        if self.verbose_logging:
-            self.log("<%s> Updating lastseen for '%s' to '%s'" % \
-                (inspect.currentframe().f_code.co_name,
-                message[4], 
-                self.database[message[4]]['lastseen']))
+        Parameters:
+        line_protocol (bytes): Newline-separated line protocol to be sent
+        """
+        try:
+            sock = self.connected()
+        except OSError as e:
+            self.dropped(1, e)
+            return False
+
+        limit = self.datagram_bytes
+        end = len(line_protocol)
+        start = 0
+        sent = 0
+        dropped = 0
+        error = None
+        while start < end:
+            if end - start <= limit:
+                cut = end
+            else:
+                cut = line_protocol.rfind(b"\n", start, start + limit + 1)
+                if cut < 0:
+                    cut = line_protocol.find(b"\n", start + limit)
+                    if cut < 0:
+                        cut = end
+            try:
+                sock.send(line_protocol[start:cut])
+                sent += 1
+            except OSError as e:
+                dropped += 1
+                error = e
+            start = cut + 1
+
+        with self.stats_lock:
+            self.packets_sent += sent
+        if dropped:
+            self.dropped(dropped, error)
+        elif self.verbose_logging:
+            logger.debug(
+                "Sent %d bytes of line protocol in %d datagrams",
+                len(line_protocol), sent)
+        return not dropped
+
+
+class UnixSocketSink(SocketSink):
+    """
+    Streams line protocol to Telegraf's inputs.socket_listener over a Unix
+    domain socket.
+
+    Each batch is written to the stream as it is. If the socket_listener
+    goes away, the batch being written is dropped, and the connection is
+    made again for a later batch, at most once a second.
+    """
 
-        if message[10] != '':
-            self.database[message[4]]['callsign'] = \
-                message[10].strip()
+    def __init__(self, path, verbose_logging=False, timeout=10):
+        """
+        Instantiate instance of UnixSocketSink.
 
-        if message[11] != '':
-            # altitude is in ft
-            self.database[message[4]]['current_altitude'] = \
-                message[11].strip()
+        Parameters:
+        path (str): Path of the socket_listener's socket
+        verbose_logging (bool): Enable verbose logging
+        timeout (float): Seconds to wait for a write to the socket
+        """
+        SocketSink.__init__(self, "unix://" + path, verbose_logging)
+        self.path = path
+        self.timeout = timeout
+        self.retry_at = 0
+
+    def connect(self):
+        self.retry_at = time.monotonic() + 1
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        return sock
 
-        if message[12] != '':
-            self.database[message[4]]['current_groundspeed'] = \
-                message[12].strip()
+    def send(self, line_protocol):
+        """
+        Write line protocol data to the stream.
 
-        if message[13] != '':
-            self.database[message[4]]['current_track'] = \
-                message[13].strip()
+        Returns True if the data was written.
 
-        if message[14] != '':
-            self.database[message[4]]['current_latitude'] = \
-                message[14].strip()
+        Parameters:
+        line_protocol (bytes): Newline-separated line protocol to be sent
+        """
+        # Writes from several writer threads must not be interleaved
+        with self.lock:
+            if self.sock is None and time.monotonic() < self.retry_at:
+                # Only the failed connection attempt is logged
+                with self.stats_lock:
+                    self.packets_dropped += 1
+                if self.verbose_logging:
+                    logger.debug(
+                        "Dropped %d bytes of line protocol, not "
+                        "reconnecting yet", len(line_protocol))
+                return False
+            try:
+                if self.sock is None:
+                    self.sock = self.connect()
+                self.sock.sendall(line_protocol)
+                self.sock.sendall(b"\n")
+            except OSError as e:
+                if self.sock is not None:
+                    self.sock.close()
+                    self.sock = None
+                error = e
+            else:
+                error = None
+        if error is not None:
+            self.dropped(1, error)
+            return False
+        with self.stats_lock:
+            self.packets_sent += 1
+        if self.verbose_logging:
+            logger.debug(
+                "Wrote %d bytes of line protocol", len(line_protocol))
+        return True
 
-        if message[15] != '':
-            self.database[message[4]]['current_longitude'] = \
-                message[15].strip()
 
-        if message[16] != '':
-            self.database[message[4]]['current_verticalrate'] = \
-                message[16].strip()
+def socket_sink(url, mtu=1500, verbose_logging=False, timeout=10):
+    """
+    Return a sink for a socket_listener given as 'udp://host:port' or
+    'unix:///path'.
 
-        if message[17] != '':
-            self.database[message[4]]['squawk'] = \
-                message[17].strip()
+    Parameters:
+    url (str): URL of the socket_listener
+    mtu (int): MTU of the path to the socket_listener, for UDP
+    verbose_logging (bool): Enable verbose logging
+    timeout (float): Seconds to wait for a write to a Unix socket
+    """
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme == 'udp':
+        try:
+            port = parts.port
+        except ValueError:
+            port = None
+        if not parts.hostname or port is None:
+            raise ValueError("Output '%s' is not udp://host:port" % (url))
+        return UDPSink(
+            parts.hostname, port, mtu=mtu, verbose_logging=verbose_logging)
+    if parts.scheme == 'unix':
+        if parts.netloc or not parts.path:
+            raise ValueError("Output '%s' is not unix:///path" % (url))
+        return UnixSocketSink(
+            parts.path, verbose_logging=verbose_logging, timeout=timeout)
+    raise ValueError(
+        "Output '%s' is not udp://host:port or unix:///path" % (url))
+
+
+def line_protocol_timestamp(line):
+    """
+    Return the timestamp of a line of line protocol, or 0 if it has none.
 
-        if message[18] != '':
-            self.database[message[4]]['alert_squawk_change'] = \
-                message[18].strip()
+    Parameters:
+    line (str): Line of line protocol
+    """
+    try:
+        return int(line.rsplit(' ', 1)[1])
+    except (IndexError, ValueError):
+        return 0
 
-        if message[19] != '':
-            self.database[message[4]]['emergency'] = \
-                message[19].strip()
 
-        if message[20] != '':
-            self.database[message[4]]['spi_ident'] = \
-                message[20].strip()
+class Spool():
+    """
+    Append-only on-disk store for line protocol.
 
-        if message[21] != '':
-            self.database[message[4]]['is_on_ground'] = \
-                message[21].strip()
+    Lines are appended to numbered segment files in 'directory'. Once the
+    current segment reaches 'segment_max_bytes' it is closed and a new one
+    is started. Segments are read back oldest first, each sorted by
+    timestamp, and segments left over from a previous run are picked up
+    on start.
+    """
 
-    def handle_msg_type_3(self, message):
+    def __init__(self, directory, segment_max_bytes=4194304):
         """
-        Handle ADSB message type 3 (ES Airborne Position Message).
+        Instantiate instance of Spool.
 
         Parameters:
-        message (list): ADSB message (split)
+        directory (str): Directory to keep segment files in
+        segment_max_bytes (int): Start a new segment once the current
+                                 segment reaches this many bytes
         """
-
-        if self.current_message_datetime == None:
-            self.current_message_datetime = self.datetime_msg_generated(message)
-        
-        self.database[message[4]]['data_to_send'].append(
-            {'current_altitude': message[11],
-            'current_latitude': message[14],
-            'current_longitude': message[15],
-            'datetime': self.current_message_datetime,
-            })
-        
-        self.log_aircraft(message[4], "Alt: %s, Lat: %s, Long: %s" % (
-            message[11],
-            message[14],
-            message[15],
+        self.directory = directory
+        self.segment_max_bytes = max(1, segment_max_bytes)
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        # Pick up segments left over from a previous run
+        self.segments = collections.deque(sorted(
+            int(filename[:-3])
+            for filename in os.listdir(directory)
+            if filename.endswith('.lp') and filename[:-3].isdigit()
             ))
-
-    def handle_msg_type_4(self, message):
+        self.next_segment = self.segments[-1] + 1 if self.segments else 0
+        self.current = None
+        self.current_bytes = 0
+        if self.segments:
+            logger.info(
+                "SPOOL: Found %d segment(s) in '%s'",
+                len(self.segments), directory)
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, "%020d.lp" % (segment))
+
+    def _close_current(self):
+        if self.current is not None:
+            self.current.close()
+            self.current = None
+            self.current_bytes = 0
+
+    def append(self, lines):
         """
-        Handle ADSB message type 3 (ES Airborne Velocity Message).
+        Append lines of line protocol to the spool.
 
         Parameters:
-        message (list): ADSB message (split)
+        lines (list): Lines of line protocol
         """
+        data = ("\n".join(lines) + "\n").encode('UTF-8')
+        with self.lock:
+            if self.current is None:
+                segment = self.next_segment
+                self.next_segment += 1
+                self.segments.append(segment)
+                self.current = open(self._segment_path(segment), 'ab')
+            self.current.write(data)
+            self.current_bytes += len(data)
+            if self.current_bytes >= self.segment_max_bytes:
+                self._close_current()
+
+    def has_data(self):
+        """
+        Return True if the spool holds any segments.
+        """
+        return bool(self.segments)
 
-        if self.current_message_datetime == None:
-            self.current_message_datetime = self.datetime_msg_generated(message)
-
-        self.database[message[4]]['data_to_send'].append(
-            {'current_groundspeed': message[12],
-            'current_track': message[13],
-            'current_verticalrate': message[16],
-            'datetime': self.current_message_datetime,
-            })
-        
-        self.log_aircraft(
-            message[4],
-            "GroundSpeed: %s, Track: %s, VerticalRate: %s" % (
-                message[12],
-                message[13],
-                message[16]
-                ))
+    def oldest(self):
+        """
+        Return the oldest segment and its lines, sorted by timestamp.
 
-    def handle_msg_type_5(self, message):
+        If the oldest segment is still being written to, it is closed first.
+        The segment stays in the spool until 'remove' is called, so nothing
+        is lost if it can't be delivered. Returns (None, []) if the spool is
+        empty.
         """
-        Handle ADSB message type 5 (Surveillance Alt Message).
+        with self.lock:
+            if not self.segments:
+                return None, []
+            segment = self.segments[0]
+            if len(self.segments) == 1:
+                self._close_current()
+            with open(self._segment_path(segment), 'rb') as f:
+                data = f.read()
+        lines = data.decode('UTF-8').splitlines()
+        lines.sort(key=line_protocol_timestamp)
+        return segment, lines
+
+    def remove(self, segment):
+        """
+        Remove a segment from the spool once its lines have been delivered.
 
         Parameters:
-        message (list): ADSB message (split)
+        segment (int): Segment returned by 'oldest'
         """
+        with self.lock:
+            if segment in self.segments:
+                self.segments.remove(segment)
+            os.remove(self._segment_path(segment))
 
-        if self.current_message_datetime == None:
-            self.current_message_datetime = self.datetime_msg_generated(message)
+    def close(self):
+        """
+        Close the segment currently being written to.
+        """
+        with self.lock:
+            self._close_current()
 
-        self.database[message[4]]['data_to_send'].append(
-            {'current_altitude': message[11],
-            'datetime': self.current_message_datetime,
-            })
 
-        self.log_aircraft(message[4], "Alt: %s" % (message[11]))
+class WriteQueue(queue.Queue):
+    """
+    Queue of line protocol waiting to be sent, with an overflow policy.
 
-    def handle_msg_type_6(self, message):
-        """
-        Handle ADSB message type 6 (Surveillance ID Message).
+    When the queue is bounded and full, 'offer' applies one of:
 
-        Parameters:
-        message (list): ADSB message (split)
-        """
+    block:       wait for space (holds up the BaseStation reader)
+    drop-oldest: discard the oldest queued line to make room
+    drop-newest: discard the line being offered
+    spill:       append the line being offered to an on-disk Spool
 
-        if self.current_message_datetime == None:
-            self.current_message_datetime = self.datetime_msg_generated(message)
+    If 'wait_when_full' is False, 'block' is left to the caller, which
+    must stop offering lines until there is room. Lines offered in the
+    meantime are queued regardless, so the queue may briefly exceed its
+    maximum size.
+    """
 
-        self.database[message[4]]['data_to_send'].append(
-            {'current_altitude': message[11],
-            'datetime': self.current_message_datetime,
-            })
+    POLICIES = ('block', 'drop-oldest', 'drop-newest', 'spill')
 
-        self.log_aircraft(message[4], "Alt: %s" % (message[11]))
+    def __init__(self, maxsize=0, policy='block', spool=None):
+        """
+        Instantiate instance of WriteQueue.
 
-    def handle_msg_type_7(self, message):
+        Parameters:
+        maxsize (int): Maximum lines held in memory (0 for unbounded)
+        policy (str): Overflow policy, one of WriteQueue.POLICIES
+        spool (Spool): Spool to spill to when policy is 'spill'
         """
-        Handle ADSB message type 7 (Air To Air Message).
+        if policy not in self.POLICIES:
+            raise ValueError("Unknown queue policy '%s'" % (policy))
+        if policy == 'spill' and spool is None:
+            raise ValueError("Queue policy 'spill' requires a spool")
+        queue.Queue.__init__(self, maxsize)
+        self.policy = policy
+        self.spool = spool
+        self.wait_when_full = True
+        self.max_depth = 0
+        self.dropped_oldest = 0
+        self.dropped_newest = 0
+        self.spilled = 0
+
+    def offer(self, line):
+        """
+        Queue a line of line protocol, applying the overflow policy if full.
 
         Parameters:
-        message (list): ADSB message (split)
+        line (str): Line of line protocol
+        """
+        spill = False
+        with self.not_full:
+            if 0 < self.maxsize <= self._qsize():
+                if self.policy == 'drop-newest':
+                    self.dropped_newest += 1
+                    return
+                elif self.policy == 'drop-oldest':
+                    if self.queue[0] is None:
+                        # Never evict a writer's stop marker
+                        self.dropped_newest += 1
+                        return
+                    self._get()
+                    self.dropped_oldest += 1
+                elif self.policy == 'block':
+                    while (self.wait_when_full and
+                           self._qsize() >= self.maxsize):
+                        self.not_full.wait()
+                else:
+                    self.spilled += 1
+                    spill = True
+            if not spill:
+                self._put(line)
+                self.unfinished_tasks += 1
+                self.max_depth = max(self.max_depth, self._qsize())
+                self.not_empty.notify()
+                return
+
+        # Spill outside the queue's lock, so writers aren't held up by disk
+        self.spool.append([line])
+
+    def put_stop(self):
+        """
+        Queue a writer's stop marker (None), regardless of the maximum size.
+
+        The marker must not wait for room, as the writers that would make
+        room may be the ones being stopped.
         """
+        with self.not_full:
+            self._put(None)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
 
-        if self.current_message_datetime == None:
-            self.current_message_datetime = self.datetime_msg_generated(message)
 
-        self.database[message[4]]['data_to_send'].append(
-            {'current_altitude': message[11],
-            'datetime': self.current_message_datetime,
-            })
+class Histogram():
+    """
+    Counts observations into cumulative buckets, as Prometheus histograms do.
 
-        self.log_aircraft(message[4], "Alt: %s" % (message[11]))
+    Not thread safe, so updates must be made under the owner's lock.
+    """
 
-    def is_message_valid(self, message):
+    def __init__(self, bounds):
         """
-        Perform basic checks against ADSB message (unsplit).
+        Instantiate instance of Histogram.
 
         Parameters:
-        message (str): ADSB message (unsplit)
+        bounds (iterable): Upper bounds of the buckets, in increasing order
         """
-        # Check if we have data to process
-        if len(message) > 0:
-
-            # Check if the message contains at least one comma
-            if message.count(',') >= 1:
+        self.bounds = tuple(bounds)
+        self.buckets = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
 
-                # Split message into fields
-                message = message.split(',')
-
-                # Make sure there was data to split
-                # Valid messages will have at least 10 fields
-                if len(message) == 22:
+    def observe(self, value):
+        """
+        Record an observation.
 
-                    # If message type is MSG (TRANSMISSION MESSAGE)
-                    if message[0].upper() == "MSG":
+        Parameters:
+        value (float): Observed value
+        """
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
 
-                        if self.verbose_logging:
-                            self.log("<%s> Message is valid" % \
-                                (inspect.currentframe().f_code.co_name))
+    def cumulative(self):
+        """
+        Return a list of (upper bound, observations up to and including
+        it), ending with an infinite bound.
+        """
+        total = 0
+        result = []
+        for bound, count in zip(self.bounds + (float('inf'),), self.buckets):
+            total += count
+            result.append((bound, total))
+        return result
 
-                        return True
 
-        if self.verbose_logging:
-            self.log("<%s> Invalid message received" % \
-                (inspect.currentframe().f_code.co_name))
+class LineProtocolWriter():
+    """
+    Sends batches of line protocol to Telegraf.
 
-        return False
+    Lines put onto 'write_q' are drained by one or more writer threads into
+    batches. A batch is flushed to the sink as one newline-separated request
+    when it reaches 'batch_max_lines' lines or 'batch_max_bytes' bytes, or
+    when 'batch_linger' seconds have passed since its first line was dequeued.
+    """
 
-    def prepare_line_protocol(self, message, data_to_send):
+    def __init__(self, telegraf_url=None, verbose_logging=False,
+                 batch_max_lines=5000, batch_max_bytes=1048576,
+                 batch_linger=1.0, stats_interval=300, sink=None,
+                 writers=1, max_in_flight=None, timeout=10,
+                 queue_size=100000, queue_policy='block',
+                 spool_dir=None, spool_segment_bytes=4194304,
+                 spool_replay_rate=5000):
         """
-        Prepare line protocol to be sent to Telegraf.
+        Instantiate instance of LineProtocolWriter.
 
         Parameters:
-        message (list): ADSB Message (processed)
-        data_to_send (dict): Dictionary containing data to send
+        telegraf_url (str): URL of Telegraf's inputs.http_listener,
+                            used if no sink is given
+        verbose_logging (bool): Enable verbose logging
+        batch_max_lines (int): Flush a batch once it holds this many lines
+        batch_max_bytes (int): Flush a batch once it holds this many bytes
+        batch_linger (float): Flush a batch this many seconds after its
+                              first line was dequeued
+        stats_interval (int): Log batch statistics every this many seconds
+                              (0 to disable)
+        sink (object): Sink with a send(bytes) method returning True on
+                       success (defaults to a TelegrafSink)
+        writers (int): Number of writer threads
+        max_in_flight (int): Maximum concurrent requests to Telegraf
+        timeout (float): Seconds to wait for Telegraf to respond
+        queue_size (int): Maximum lines waiting to be sent (0 for unbounded)
+        queue_policy (str): What to do when the queue is full,
+                            one of WriteQueue.POLICIES
+        spool_dir (str): Directory to spool batches that could not be
+                         sent, and to spill to when queue_policy is 'spill'
+                         (None to disable). If it can't be created, the
+                         writer runs without a spool, and 'spill' falls
+                         back to 'block'.
+        spool_segment_bytes (int): Size of each spool segment file
+        spool_replay_rate (int): Maximum lines per second to replay from
+                                 the spool
         """
-        # generate line protocol
-        line_protocol = str()
-
-        # measurement
-        line_protocol += "piaware"
-        line_protocol += ","
-
-        # tags
-        # include hexident as every message should have one
-        line_protocol += "hexident="
-        line_protocol += message[4].strip()
+        if sink is None:
+            sink = TelegrafSink(
+                telegraf_url,
+                verbose_logging=verbose_logging,
+                pool_size=writers,
+                max_in_flight=max_in_flight,
+                timeout=timeout,
+                )
+        self.sink = sink
+        self.writers = max(1, writers)
+        self.verbose_logging = verbose_logging
+        self.batch_max_lines = max(1, batch_max_lines)
+        self.batch_max_bytes = max(1, batch_max_bytes)
+        self.batch_linger = max(0.0, batch_linger)
+        self.stats_interval = stats_interval
+        self.spool = None
+        if spool_dir:
+            try:
+                self.spool = Spool(
+                    spool_dir,
+                    segment_max_bytes=spool_segment_bytes,
+                    )
+            except OSError as e:
+                logger.error(
+                    "ERROR: could not use spool directory %r, "
+                    "running without a spool! %r", spool_dir, e)
+                if queue_policy == 'spill':
+                    queue_policy = 'block'
+        self.spool_replay_rate = max(1, spool_replay_rate)
+        self.sink_healthy = True
+        self.write_q = WriteQueue(queue_size, queue_policy, self.spool)
+        self.write_threads = []
+        self.stopping = threading.Event()
+
+        # Counters
+        self.stats_lock = threading.Lock()
+        self.points_sent = 0
+        self.batches_sent = 0
+        self.batch_lines_total = 0
+        self.batch_lines_max = 0
+        self.flush_latency_total = 0.0
+        self.flush_latency_max = 0.0
+        self.flush_latency = Histogram(
+            (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10))
+        self.bytes_sent = 0
+        self.points_failed = 0
+        self.points_spooled = 0
+        self.points_replayed = 0
+        self.stats_logged = time.monotonic()
+
+    def start(self):
+        """
+        Start the writer threads.
+        """
+        for _ in range(self.writers):
+            write_thread = threading.Thread(target=self.write_loop)
+            write_thread.daemon = True
+            write_thread.start()
+            self.write_threads.append(write_thread)
+        self.start_spool()
+
+    def start_spool(self):
+        """
+        Start the thread replaying spooled lines, if there is a spool.
+        """
+        if self.spool is not None:
+            self.spool_thread = threading.Thread(target=self.spool_loop)
+            self.spool_thread.daemon = True
+            self.spool_thread.start()
 
-        # include callsign if present
-        if self.database[message[4]]['callsign'] != '':
-            line_protocol += ","
-            line_protocol += "callsign="
-            line_protocol += \
-                self.database[message[4]]['callsign'].strip()
+    def stop(self):
+        """
+        Flush any queued lines and stop the writer threads.
+        """
+        self.stopping.set()
+        for _ in self.write_threads:
+            self.write_q.put_stop()
+        for write_thread in self.write_threads:
+            write_thread.join()
+        self.write_threads = []
+        if self.spool is not None:
+            self.spool_thread.join()
+            self.spool.close()
+        self.sink.close()
+
+    def spool_loop(self):
+        """
+        Replay spooled lines to the sink.
 
-        # include squawk if present
-        if self.database[message[4]]['squawk'] != '':
-            line_protocol += ","
-            line_protocol += "squawk="
-            line_protocol += \
-                self.database[message[4]]['squawk'].strip()
+        Segments are replayed oldest first, each in timestamp order, at no
+        more than 'spool_replay_rate' lines per second. Replay only runs
+        while the sink is accepting data and the write queue has drained,
+        so live data takes priority. While the sink is failing, a replay is
+        attempted every 10 seconds to find out when it has recovered.
+        """
+        low_water = self.write_q.maxsize // 2 or 1
+        last_attempt = 0
+        while not self.stopping.is_set():
+            if (not self.spool.has_data() or
+                    self.write_q.qsize() >= low_water or
+                    (not self.sink_healthy and
+                     time.monotonic() - last_attempt < 10)):
+                self.stopping.wait(1)
+                continue
+            last_attempt = time.monotonic()
+            segment, lines = self.spool.oldest()
+            if self.verbose_logging:
+                logger.debug(
+                    "SPOOL: Replaying %d lines from segment %d",
+                    len(lines), segment)
+            if self.replay(lines):
+                self.spool.remove(segment)
 
-        # spacer between tags & fields
-        line_protocol += " "
+    def replay(self, lines):
+        """
+        Send spooled lines to the sink at no more than 'spool_replay_rate'.
 
-        # fields
-        first = True
-        valid = False
-        for field in data_to_send.keys():
+        Returns True if every line was delivered. If delivery fails part way
+        through, the whole segment is kept and replayed again later.
+        InfluxDB overwrites points with the same series and timestamp, so
+        lines that are sent twice do not create duplicates.
 
-            if field == 'datetime':
-                continue
+        Parameters:
+        lines (list): Lines of line protocol, in timestamp order
+        """
+        chunk_size = min(self.batch_max_lines, self.spool_replay_rate)
+        for i in range(0, len(lines), chunk_size):
+            if self.stopping.is_set():
+                return False
+            chunk = lines[i:i + chunk_size]
+            started = time.monotonic()
+            payload = "\n".join(chunk).encode('UTF-8')
+            self.sink_healthy = self.sink.send(payload)
+            if not self.sink_healthy:
+                return False
+            with self.stats_lock:
+                self.points_sent += len(chunk)
+                self.bytes_sent += len(payload)
+                self.points_replayed += len(chunk)
+            pause = len(chunk) / self.spool_replay_rate
+            pause -= time.monotonic() - started
+            if pause > 0:
+                self.stopping.wait(pause)
+        return True
 
-            if data_to_send[field] != '':
-                if not first:
-                    line_protocol += ","
-                line_protocol += field.strip()
-                line_protocol += "="
-                line_protocol += data_to_send[field].strip()
-                first = False
-                valid = True
+    def write_loop(self):
+        while True:
+            batch = self.collect_batch()
+            if batch is None:
+                break
+            self.flush(batch)
+            self.maybe_log_stats()
 
-        # Unix nanosecond timestamp.
-        line_protocol += " %d" % (
-            datetime.datetime.timestamp(
-                data_to_send['datetime']
-            ) * 1000000000
-        )
+    def collect_batch(self):
+        """
+        Drain the write queue into a batch.
 
-        if self.verbose_logging:
-            self.log("<%s> Line protocol '%s', is valid: '%s'" % \
-                (inspect.currentframe().f_code.co_name,
-                 line_protocol,
-                 valid))
+        Blocks until at least one line is available, then keeps taking lines
+        until a batch limit is reached or the linger time runs out.
+        Returns None once the writer has been asked to stop and no lines
+        remain to be sent.
+        """
+        line = self.write_q.get()
+        if line is None:
+            return None
+
+        batch = [line]
+        batch_bytes = len(line) + 1
+        deadline = time.monotonic() + self.batch_linger
+
+        while (len(batch) < self.batch_max_lines and
+               batch_bytes < self.batch_max_bytes):
+            try:
+                line = self.write_q.get_nowait()
+            except queue.Empty:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    line = self.write_q.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            if line is None:
+                # Put the stop marker back so the next call returns None
+                # once this batch has been flushed.
+                self.write_q.put_stop()
+                break
+            batch.append(line)
+            batch_bytes += len(line) + 1
 
-        return valid, line_protocol
+        return batch
 
-    def send_data(self, message):
+    def flush(self, batch):
         """
-        Send data to Telegraf, if required.
+        Send a batch of line protocol to the sink and record its statistics.
 
         Parameters:
-        message (list): ADSB Message (processed)
+        batch (list): Lines of line protocol
         """
-        # Do we have data to send?
+        payload = "\n".join(batch).encode('UTF-8')
+        started = time.monotonic()
+        sent = self.sink.send(payload)
+        latency = time.monotonic() - started
+        self.sink_healthy = sent
+
+        if not sent and self.spool is not None:
+            self.spool.append(batch)
+
+        with self.stats_lock:
+            if sent:
+                self.points_sent += len(batch)
+                self.bytes_sent += len(payload)
+            elif self.spool is not None:
+                self.points_spooled += len(batch)
+            else:
+                self.points_failed += len(batch)
+            self.batches_sent += 1
+            self.batch_lines_total += len(batch)
+            self.batch_lines_max = max(self.batch_lines_max, len(batch))
+            self.flush_latency_total += latency
+            self.flush_latency_max = max(self.flush_latency_max, latency)
+            self.flush_latency.observe(latency)
 
         if self.verbose_logging:
-            self.log("<%s> Data to send: '%s'" % \
-                (inspect.currentframe().f_code.co_name,
-                 repr(self.database[message[4]]['data_to_send']),
-                 ))
+            logger.debug(
+                "Flushed batch of %d lines (%d bytes) in %.1f ms",
+                len(batch), len(payload), latency * 1000)
 
-        if len(self.database[message[4]]['data_to_send']) >= 1:
+    def maybe_log_stats(self):
+        """
+        Log batch statistics if 'stats_interval' seconds have passed.
+        """
+        if self.stats_interval <= 0:
+            return
+        now = time.monotonic()
+        if now - self.stats_logged < self.stats_interval:
+            return
+        self.stats_logged = now
+        with self.stats_lock:
+            batches = self.batches_sent
+            lines = self.batch_lines_total
+            lines_max = self.batch_lines_max
+            latency_total = self.flush_latency_total
+            latency_max = self.flush_latency_max
+        if batches == 0:
+            return
+        logger.info(
+            "STATS: batches: %d, avg batch: %.1f lines, max batch: %d lines, "
+            "avg flush: %.1f ms, max flush: %.1f ms, queued: %d "
+            "(max %d), dropped oldest: %d, dropped newest: %d, "
+            "spilled: %d, failed: %d, spooled: %d, replayed: %d",
+            batches,
+            lines / batches,
+            lines_max,
+            latency_total / batches * 1000,
+            latency_max * 1000,
+            self.write_q.qsize(),
+            self.write_q.max_depth,
+            self.write_q.dropped_oldest,
+            self.write_q.dropped_newest,
+            self.write_q.spilled,
+            self.points_failed,
+            self.points_spooled,
+            self.points_replayed)
+
+
+def sbs_int(value):
+    """
+    Convert a BaseStation field to an int, or None if the field is empty.
 
-            # Do we have a callsign?
+    Raises ValueError if the field isn't a finite number.
 
-            if self.verbose_logging:
-                self.log("<%s> Callsign / Squawk: '%s'/'%s'" % \
-                    (inspect.currentframe().f_code.co_name,
-                    repr(self.database[message[4]]['callsign']),
-                    repr(self.database[message[4]]['squawk'])
-                    ))
+    Parameters:
+    value (str): BaseStation field
+    """
+    if not value or value.isspace():
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return int(sbs_float(value))
 
-            # previously, this script would only send data if we had a callsign and squawk.
-            # changed on 5th June 2020 to send data regardless of this.
-            #
-            # if (
-            #         self.database[message[4]]['callsign'] != ''
-            #         and
-            #         self.database[message[4]]['squawk'] != ''
-            # ):
-            #
 
-            # iterate through data to send
-            for data_to_send in self.database[message[4]]['data_to_send']:
+def sbs_float(value):
+    """
+    Convert a BaseStation field to a float, or None if the field is empty.
 
-                valid, line_protocol = \
-                    self.prepare_line_protocol(message, data_to_send)
+    Raises ValueError if the field isn't a finite number, as float() accepts
+    'nan', 'inf' and overflowing numbers such as '1e999'.
 
-                # send line protocol
-                if valid:
-                    self.write_q.put(line_protocol)
+    Parameters:
+    value (str): BaseStation field
+    """
+    if not value or value.isspace():
+        return None
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError("not a finite number: %r" % (value))
+    return number
+
+
+def sbs_flag(value):
+    """
+    Convert a BaseStation flag field to a bool, or None if the field is empty.
+
+    BaseStation flags are '-1' (or '1') when set and '0' when not.
+
+    Parameters:
+    value (str): BaseStation field
+    """
+    value = value.strip()
+    if not value:
+        return None
+    return value != '0'
+
+
+class SBSMessage():
+    """
+    A BaseStation (SBS-1) transmission message, parsed into typed fields.
+
+    Fields not present in the message are None. Messages decoded from
+    Beast frames by BeastDecoder have no date or time, but are already
+    timestamped, and have the signal level they were received at in 'rssi'.
+    """
+
+    __slots__ = (
+        'transmission_type',
+        'hexident',
+        'date',
+        'time',
+        'callsign',
+        'altitude',
+        'groundspeed',
+        'track',
+        'latitude',
+        'longitude',
+        'verticalrate',
+        'squawk',
+        'alert_squawk_change',
+        'emergency',
+        'spi_ident',
+        'is_on_ground',
+        'timestamp',
+        'rssi',
+        )
+
+
+def parse_sbs_message(line):
+    """
+    Validate and parse a BaseStation message in a single pass.
+
+    Returns a tuple of (SBSMessage, None) if the message is valid,
+    or (None, reason) if it isn't, where reason is one of:
+
+    empty:             the line is empty
+    field_count:       the line doesn't have 22 comma separated fields
+    not_msg:           the message type isn't MSG (transmission message)
+    transmission_type: the transmission type isn't a number
+    hexident:          the hexident is missing
+    bad_number:        a numeric field couldn't be parsed
+
+    The 'timestamp' field is left for SBSTimestampParser to fill in.
+
+    Parameters:
+    line (str): ADSB Message (unparsed)
+    """
+    # Check if we have data to process
+    if not line:
+        return None, 'empty'
+
+    # Split message into fields
+    fields = line.split(',')
+    if len(fields) != 22:
+        return None, 'field_count'
+
+    # If message type is MSG (TRANSMISSION MESSAGE)
+    if fields[0].upper() != "MSG":
+        return None, 'not_msg'
+
+    message = SBSMessage()
+    try:
+        message.transmission_type = int(fields[1])
+    except ValueError:
+        return None, 'transmission_type'
+
+    message.hexident = fields[4].strip()
+    if not message.hexident:
+        return None, 'hexident'
+
+    message.date = fields[6]
+    message.time = fields[7]
+    message.callsign = fields[10].strip() or None
+    try:
+        message.altitude = sbs_int(fields[11])
+        message.groundspeed = sbs_float(fields[12])
+        message.track = sbs_float(fields[13])
+        message.latitude = sbs_float(fields[14])
+        message.longitude = sbs_float(fields[15])
+        message.verticalrate = sbs_int(fields[16])
+        message.squawk = sbs_int(fields[17])
+    except (ValueError, OverflowError):
+        return None, 'bad_number'
+    message.alert_squawk_change = sbs_flag(fields[18])
+    message.emergency = sbs_flag(fields[19])
+    message.spi_ident = sbs_flag(fields[20])
+    message.is_on_ground = sbs_flag(fields[21])
+    message.rssi = None
+
+    return message, None
+
+
+class SBSTimestampParser():
+    """
+    Converts BaseStation date and time fields to Unix nanoseconds.
+
+    Consecutive messages nearly always share the same date and second, so
+    the epoch of the last date and second seen is cached, and only the
+    fractional part of the time is parsed for each message. All of the
+    fractional digits are kept, up to nanoseconds.
+
+    Times are interpreted in the local timezone, which must match the
+    timezone of the BaseStation data source.
+    """
+
+    # Multiplier to convert a fraction of a second with this many digits
+    # to nanoseconds
+    FRACTION_SCALE = tuple(10 ** (9 - digits) for digits in range(10))
+
+    def __init__(self, tz):
+        """
+        Instantiate instance of SBSTimestampParser.
+
+        Parameters:
+        tz (tzinfo): Timezone of the BaseStation data source
+        """
+        self.tz = tz
+        self.cached_date = None
+        self.cached_second = None
+        self.cached_epoch_ns = 0
+
+    def parse(self, date, time_of_day):
+        """
+        Return the Unix nanosecond timestamp of a BaseStation date and time.
+
+        Raises ValueError if the date or time are not valid.
+
+        Parameters:
+        date (str): Date, e.g.: '2020/11/24'
+        time_of_day (str): Time, e.g.: '10:00:00.123'
+        """
+        second, _, fraction = time_of_day.partition('.')
+        if second != self.cached_second or date != self.cached_date:
+            msgdt = datetime.datetime.strptime(
+                "%sT%s" % (date, second),
+                '%Y/%m/%dT%H:%M:%S'
+                ).replace(tzinfo=self.tz)
+            self.cached_epoch_ns = int(msgdt.timestamp()) * 1000000000
+            self.cached_date = date
+            self.cached_second = second
+        if not fraction:
+            return self.cached_epoch_ns
+        fraction = fraction[:9]
+        return (self.cached_epoch_ns +
+                int(fraction) * self.FRACTION_SCALE[len(fraction)])
+
+
+# Mode S frame lengths for each Beast frame type ('2' short, '3' long),
+# not counting the 6 byte timestamp and 1 byte signal level
+BEAST_FRAME_LENGTHS = {0x32: 7, 0x33: 14}
+
+# Beast frame types that are skipped: '1' Mode A/C, '4' status
+BEAST_SKIPPED_LENGTHS = {0x31: 2, 0x34: 14}
+
+
+def unescape_beast(buffer, start, end, length):
+    """
+    Return the body of a Beast frame, with doubled 0x1a bytes undone, and
+    where the frame ends.
+
+    Returns (None, None) if the rest of the frame hasn't been received,
+    or (None, position) if it was cut short by another frame starting at
+    'position'.
+
+    Parameters:
+    buffer (bytearray): Data received
+    start (int): Where the frame's body starts
+    end (int): Where the data received ends
+    length (int): Length of the body
+    """
+    body = bytearray()
+    i = start
+    while len(body) < length:
+        if i >= end:
+            return None, None
+        byte = buffer[i]
+        if byte == 0x1a:
+            if i + 1 >= end:
+                return None, None
+            if buffer[i + 1] != 0x1a:
+                return None, i
+            i += 1
+        body.append(byte)
+        i += 1
+    return body, i
+
+
+def split_beast_frames(buffer):
+    """
+    Remove all complete Beast frames from a buffer and return them.
+
+    Frames start with 0x1a and a type byte, followed by a 6 byte timestamp,
+    a 1 byte signal level and the Mode S message, with any 0x1a in them
+    doubled. Each frame is returned as bytes holding the timestamp, the
+    signal level and the message. Mode A/C and status frames are skipped,
+    as is anything between frames, so a stream joined part way through
+    resynchronises at the next frame. Any partial frame is left in the
+    buffer.
+
+    Parameters:
+    buffer (bytearray): Data received
+    """
+    frames = []
+    end = len(buffer)
+    start = 0
+    while True:
+        start = buffer.find(b'\x1a', start)
+        if start < 0:
+            start = end
+            break
+        if start + 1 >= end:
+            break
+        frame_type = buffer[start + 1]
+        length = BEAST_FRAME_LENGTHS.get(frame_type)
+        if length is None:
+            length = BEAST_SKIPPED_LENGTHS.get(frame_type)
+            if length is None:
+                # Not the start of a frame, e.g. a doubled 0x1a
+                start += 2 if frame_type == 0x1a else 1
+                continue
+        length += 7
+        body_end = start + 2 + length
+        body = buffer[start + 2:body_end]
+        if len(body) < length or b'\x1a' in body:
+            body, body_end = unescape_beast(
+                buffer, start + 2, end, length)
+            if body_end is None:
+                # Keep the partial frame for when the rest arrives
+                break
+            if body is None:
+                start = body_end
+                continue
+        if frame_type in BEAST_FRAME_LENGTHS:
+            frames.append(bytes(body))
+        start = body_end
+    del buffer[:start]
+    return frames
+
+
+def _modes_crc_table():
+    table = []
+    for byte in range(256):
+        crc = byte << 16
+        for _ in range(8):
+            crc <<= 1
+            if crc & 0x1000000:
+                crc ^= 0x1fff409
+        table.append(crc)
+    return tuple(table)
+
+
+MODES_CRC_TABLE = _modes_crc_table()
+
+
+def modes_crc(data):
+    """
+    Return the Mode S CRC-24 of 'data'.
+
+    Parameters:
+    data (bytes): Mode S message, without its parity bytes
+    """
+    table = MODES_CRC_TABLE
+    crc = 0
+    for byte in data:
+        crc = ((crc << 8) & 0xffffff) ^ table[(crc >> 16) ^ byte]
+    return crc
+
+
+# Bits of a 13 bit identity (or Gillham altitude) field, and the bits they
+# become in 0xABCD octal digit order, as in the squawk '7700'
+ID13_BITS = (
+    (0x1000, 0x0010), (0x0800, 0x1000), (0x0400, 0x0020), (0x0200, 0x2000),
+    (0x0100, 0x0040), (0x0080, 0x4000), (0x0020, 0x0100), (0x0010, 0x0001),
+    (0x0008, 0x0200), (0x0004, 0x0002), (0x0002, 0x0400), (0x0001, 0x0004),
+    )
+
+
+def decode_id13(id13):
+    """
+    Return a 13 bit identity field as octal digits in hex, e.g.: 0x7700.
+
+    Parameters:
+    id13 (int): Identity field
+    """
+    digits = 0
+    for bit, digit in ID13_BITS:
+        if id13 & bit:
+            digits |= digit
+    return digits
+
+
+def gillham_altitude(digits):
+    """
+    Return a Gillham (100 ft) coded altitude in ft, or None if it isn't
+    valid.
+
+    Parameters:
+    digits (int): Altitude field as returned by decode_id13
+    """
+    if digits & 0xffff8889 or not digits & 0x00f0:
+        return None
+    hundreds = 0
+    if digits & 0x0010:
+        hundreds ^= 7
+    if digits & 0x0020:
+        hundreds ^= 3
+    if digits & 0x0040:
+        hundreds ^= 1
+    if hundreds & 5 == 5:
+        hundreds ^= 2
+    if hundreds > 5:
+        return None
+    five_hundreds = 0
+    for bit, gray in ((0x0002, 0xff), (0x0004, 0x7f), (0x1000, 0x3f),
+                      (0x2000, 0x1f), (0x4000, 0x0f), (0x0100, 0x07),
+                      (0x0200, 0x03), (0x0400, 0x01)):
+        if digits & bit:
+            five_hundreds ^= gray
+    if five_hundreds & 1:
+        hundreds = 6 - hundreds
+    return (five_hundreds * 5 + hundreds - 13) * 100
+
+
+def decode_ac13(ac13):
+    """
+    Return the altitude in ft of a 13 bit altitude code, or None if it is
+    not available or is metric.
+
+    Parameters:
+    ac13 (int): Altitude code, as in DF0, DF4, DF16 and DF20
+    """
+    if not ac13 or ac13 & 0x0040:
+        return None
+    if ac13 & 0x0010:
+        # 25 ft increments
+        return (((ac13 & 0x1f80) >> 2) | ((ac13 & 0x0020) >> 1) |
+                (ac13 & 0x000f)) * 25 - 1000
+    return gillham_altitude(decode_id13(ac13))
+
+
+def decode_ac12(ac12):
+    """
+    Return the altitude in ft of a 12 bit altitude code, or None if it is
+    not available.
+
+    Parameters:
+    ac12 (int): Altitude code, as in ADS-B airborne positions
+    """
+    if not ac12:
+        return None
+    if ac12 & 0x0010:
+        return (((ac12 & 0x0fe0) >> 1) | (ac12 & 0x000f)) * 25 - 1000
+    # Gillham coded, as a 13 bit code without the M bit
+    return gillham_altitude(
+        decode_id13(((ac12 & 0x0fc0) << 1) | (ac12 & 0x003f)))
+
+
+def _cpr_nl_table():
+    # Latitudes below which the number of longitude zones is 59, 58, ... 2
+    zones = 15
+    return tuple(
+        math.degrees(math.acos(math.sqrt(
+            (1 - math.cos(math.pi / (2 * zones))) /
+            (1 - math.cos(2 * math.pi / nl)))))
+        for nl in range(59, 1, -1))
+
+
+CPR_NL_TABLE = _cpr_nl_table()
+
+
+def cpr_nl(latitude):
+    """
+    Return the number of CPR longitude zones at a latitude.
+
+    Parameters:
+    latitude (float): Latitude
+    """
+    return 59 - bisect.bisect_left(CPR_NL_TABLE, abs(latitude))
+
+
+def cpr_global(even, odd, latest_odd):
+    """
+    Return the (latitude, longitude) of an airborne position from a pair
+    of even and odd CPR encoded positions, or None if they straddle a
+    longitude zone boundary.
+
+    Parameters:
+    even (tuple): (latitude, longitude) of the even frame, as fractions
+    odd (tuple): (latitude, longitude) of the odd frame, as fractions
+    latest_odd (bool): The odd frame is the latest of the two
+    """
+    lat0, lon0 = even
+    lat1, lon1 = odd
+    j = math.floor(59 * lat0 - 60 * lat1 + 0.5)
+    rlat0 = 6.0 * (j % 60 + lat0)
+    rlat1 = 360.0 / 59 * (j % 59 + lat1)
+    if rlat0 >= 270:
+        rlat0 -= 360
+    if rlat1 >= 270:
+        rlat1 -= 360
+    if not -90 <= rlat0 <= 90 or not -90 <= rlat1 <= 90:
+        return None
+    nl = cpr_nl(rlat0)
+    if nl != cpr_nl(rlat1):
+        return None
+    m = math.floor(lon0 * (nl - 1) - lon1 * nl + 0.5)
+    if latest_odd:
+        latitude = rlat1
+        zones = max(nl - 1, 1)
+        longitude = 360.0 / zones * (m % zones + lon1)
+    else:
+        latitude = rlat0
+        zones = max(nl, 1)
+        longitude = 360.0 / zones * (m % zones + lon0)
+    if longitude >= 180:
+        longitude -= 360
+    return latitude, longitude
+
+
+def cpr_local(cpr, odd, reference, surface):
+    """
+    Return the (latitude, longitude) of a single CPR encoded position,
+    relative to a reference position within 180 NM (45 NM on the surface).
+
+    Parameters:
+    cpr (tuple): (latitude, longitude) of the frame, as fractions
+    odd (bool): The frame is odd
+    reference (tuple): (latitude, longitude) near the position
+    surface (bool): The frame is a surface position
+    """
+    span = 90.0 if surface else 360.0
+    ref_lat, ref_lon = reference
+    cpr_lat, cpr_lon = cpr
+    dlat = span / (59 if odd else 60)
+    j = (math.floor(ref_lat / dlat) +
+         math.floor(0.5 + (ref_lat % dlat) / dlat - cpr_lat))
+    latitude = dlat * (j + cpr_lat)
+    if not -90 <= latitude <= 90:
+        return None
+    dlon = span / max(cpr_nl(latitude) - odd, 1)
+    m = (math.floor(ref_lon / dlon) +
+         math.floor(0.5 + (ref_lon % dlon) / dlon - cpr_lon))
+    longitude = dlon * (m + cpr_lon)
+    if longitude >= 180:
+        longitude -= 360
+    elif longitude < -180:
+        longitude += 360
+    return latitude, longitude
+
+
+# Characters of an ADS-B identification, 6 bits each
+MODES_CHARSET = (
+    "#ABCDEFGHIJKLMNOPQRSTUVWXYZ##### ###############0123456789######")
+
+
+def surface_speed(movement):
+    """
+    Return the speed in kt of an ADS-B surface movement field, or None if
+    it is not available.
+
+    Parameters:
+    movement (int): Movement field
+    """
+    if movement == 1:
+        return 0.0
+    if 2 <= movement <= 8:
+        return 0.125 * (movement - 1)
+    if 9 <= movement <= 12:
+        return 1 + 0.25 * (movement - 8)
+    if 13 <= movement <= 38:
+        return 2 + 0.5 * (movement - 12)
+    if 39 <= movement <= 93:
+        return 15.0 + (movement - 38)
+    if 94 <= movement <= 108:
+        return 70.0 + 2 * (movement - 93)
+    if 109 <= movement <= 123:
+        return 100.0 + 5 * (movement - 108)
+    if movement == 124:
+        return 175.0
+    return None
+
+
+# Signal level in dBFS for each Beast signal level byte
+BEAST_RSSI = (None,) + tuple(
+    round(20 * math.log10(level / 255.0), 1) for level in range(1, 256))
+
+
+class CPRState():
+    """
+    CPR decoding state kept for an aircraft by BeastDecoder.
+    """
+
+    __slots__ = (
+        'seen',
+        'even',
+        'odd',
+        'position',
+        )
+
+    def __init__(self):
+        self.seen = 0           # ns, last message with a checked CRC
+        self.even = None        # (cpr latitude, cpr longitude, ns)
+        self.odd = None         # (cpr latitude, cpr longitude, ns)
+        self.position = None    # (latitude, longitude, ns)
+
+
+class BeastDecoder():
+    """
+    Decodes Mode S messages from Beast frames into SBSMessages.
+
+    Messages are given the transmission type BaseStation would give them,
+    so they are handled by the same vessel state machine:
+
+    1: DF17/18 identification (callsign)
+    2: DF17/18 surface position (CPR decoded)
+    3: DF17/18 airborne position (CPR decoded)
+    4: DF17/18 airborne velocity (ground speed and track)
+    5: DF4/20 surveillance altitude reply
+    6: DF5/21 surveillance identity reply, DF17/18 emergency status
+    7: DF0/16 air-air surveillance
+    8: DF11 all-call reply
+
+    DF11, DF17 and DF18 carry the aircraft's address, and are dropped if
+    their CRC doesn't check. In other replies the address is overlaid on
+    the CRC, so they are only accepted from an address seen in one of
+    these within the last minute.
+
+    Positions are decoded from a pair of even and odd frames received
+    within 10 seconds, or from a single frame relative to the aircraft's
+    position decoded within the last minute. Surface positions are only
+    decoded relative to a previous position.
+
+    Each message is timestamped with the time it was received. Beast
+    frames carry the receiver's 12 MHz clock rather than a time of day, so
+    'receive' is called with the time each read's frames arrived, and the
+    last frame of the read is taken to have been received then. Earlier
+    frames are timestamped by how far their clock is behind it. Timestamps
+    are kept strictly increasing, so no two messages share one.
+    """
+
+    # Seconds, in ns, within which frames of an even/odd pair must arrive
+    PAIR_MAX_AGE = 10000000000
+    # Maximum age of a position to decode relative to, and of an address
+    # to accept replies from
+    RECENT = 60000000000
+    # Forget aircraft not heard from for this long
+    EXPIRE = 900000000000
+    # Most ticks of the 12 MHz clock a frame is taken to be behind the last
+    # frame of its read. Beyond this, the clock is assumed not to run at
+    # 12 MHz (or to have been reset), and the frame gets the read's time.
+    CLOCK_MAX_OFFSET = 120000000
+
+    def __init__(self):
+        # Time the frame being decoded was received
+        self.received = 0
+        self.read_time = 0
+        self.read_clock = 0
+        # hexident -> CPRState, in the order they were last seen
+        self.aircraft = collections.OrderedDict()
+        self.next_clean = 0
+
+    @staticmethod
+    def address(frame):
+        """
+        Return the address a frame is from, without checking its CRC, or
+        None if it has none.
+
+        Parameters:
+        frame (bytes): Beast frame, as returned by split_beast_frames
+        """
+        df = frame[7] >> 3
+        if df in (11, 17, 18):
+            return int.from_bytes(frame[8:11], 'big')
+        if df in (0, 4, 5, 16, 20, 21):
+            return (modes_crc(frame[7:-3]) ^
+                    int.from_bytes(frame[-3:], 'big'))
+        return None
+
+    def receive(self, frames, received):
+        """
+        Start decoding the frames from one read.
+
+        Parameters:
+        frames (list): Beast frames, as returned by split_beast_frames
+        received (int): Unix nanosecond time the frames were received
+        """
+        self.read_time = received
+        if frames:
+            self.read_clock = int.from_bytes(frames[-1][:6], 'big')
+
+    def message(self, transmission_type, hexident, rssi):
+        """
+        Return an SBSMessage with only its transmission type, hexident,
+        timestamp and signal level set.
+
+        Parameters:
+        transmission_type (int): BaseStation transmission type
+        hexident (str): hexident of vessel
+        rssi (float): Signal level, in dBFS
+        """
+        message = SBSMessage()
+        message.transmission_type = transmission_type
+        message.hexident = hexident
+        message.date = message.time = None
+        message.callsign = message.altitude = message.groundspeed = None
+        message.track = message.latitude = message.longitude = None
+        message.verticalrate = message.squawk = None
+        message.alert_squawk_change = message.emergency = None
+        message.spi_ident = message.is_on_ground = None
+        message.timestamp = self.received
+        message.rssi = rssi
+        return message
+
+    def decode(self, frame):
+        """
+        Validate and decode a Beast frame.
+
+        Returns a tuple of (SBSMessage, None) if the frame holds a message
+        that is used, or (None, reason) if it doesn't, where reason is one
+        of:
+
+        crc:         the CRC doesn't check
+        address:     a reply from an address that hasn't been seen
+        unsupported: a message type that isn't used
+
+        Parameters:
+        frame (bytes): Beast frame, as returned by split_beast_frames
+        """
+        # Received as long before the read as its clock is behind the
+        # read's last frame, in ticks of 1/12 us
+        offset = (self.read_clock -
+                  int.from_bytes(frame[:6], 'big')) & 0xffffffffffff
+        if offset > self.CLOCK_MAX_OFFSET:
+            offset = 0
+        now = self.read_time - offset * 1000 // 12
+        if now <= self.received:
+            now = self.received + 1
+        self.received = now
+
+        frame = frame[6:]
+        df = frame[1] >> 3
+        rssi = BEAST_RSSI[frame[0]]
+        if now >= self.next_clean:
+            self.clean()
+
+        if df == 17 or df == 18:
+            if (len(frame) != 15 or
+                    modes_crc(frame[1:12]) !=
+                    int.from_bytes(frame[12:], 'big')):
+                return None, 'crc'
+            # DF18 is also used by non-transponder devices and TIS-B, but
+            # only ADS-B with an ICAO address is used
+            if df == 18 and frame[1] & 7 != 0:
+                return None, 'unsupported'
+            hexident = "%06X" % (int.from_bytes(frame[2:5], 'big'))
+            return self.decode_extended_squitter(
+                frame, hexident, self.seen(hexident), rssi)
+
+        if df == 11:
+            # The parity may be overlaid with an interrogator code
+            if (len(frame) != 8 or
+                    (modes_crc(frame[1:5]) ^
+                     int.from_bytes(frame[5:], 'big')) & 0xffff80):
+                return None, 'crc'
+            hexident = "%06X" % (int.from_bytes(frame[2:5], 'big'))
+            self.seen(hexident)
+            message = self.message(8, hexident, rssi)
+            capability = frame[1] & 7
+            if capability == 4:
+                message.is_on_ground = True
+            elif capability == 5:
+                message.is_on_ground = False
+            return message, None
+
+        if df not in (0, 4, 5, 16, 20, 21):
+            return None, 'unsupported'
+        if len(frame) != (8 if df < 16 else 15):
+            return None, 'crc'
+        address = (modes_crc(frame[1:-3]) ^
+                   int.from_bytes(frame[-3:], 'big'))
+        hexident = "%06X" % (address)
+        state = self.aircraft.get(hexident)
+        if state is None or now - state.seen > self.RECENT:
+            return None, 'address'
+
+        field = ((frame[3] & 0x1f) << 8) | frame[4]
+        if df == 0 or df == 16:
+            message = self.message(7, hexident, rssi)
+            message.altitude = decode_ac13(field)
+            message.is_on_ground = bool(frame[1] & 0x04)
+            return message, None
+
+        if df == 4 or df == 20:
+            message = self.message(5, hexident, rssi)
+            message.altitude = decode_ac13(field)
+        else:
+            message = self.message(6, hexident, rssi)
+            message.squawk = int("%04x" % (decode_id13(field)))
+            message.emergency = message.squawk in (7500, 7600, 7700)
+        flight_status = frame[1] & 7
+        if flight_status < 4:
+            message.is_on_ground = flight_status in (1, 3)
+        message.alert_squawk_change = flight_status in (2, 3, 4)
+        message.spi_ident = flight_status in (4, 5)
+        return message, None
+
+    def seen(self, hexident):
+        """
+        Record that a message with a checked CRC was received from an
+        aircraft, and return its CPRState.
+
+        Parameters:
+        hexident (str): hexident of vessel
+        """
+        state = self.aircraft.get(hexident)
+        if state is None:
+            state = self.aircraft[hexident] = CPRState()
+        else:
+            self.aircraft.move_to_end(hexident)
+        state.seen = self.received
+        return state
+
+    def clean(self):
+        """
+        Forget aircraft not heard from for 'EXPIRE', at most once a second.
+        """
+        now = self.received
+        self.next_clean = now + 1000000000
+        cutoff = now - self.EXPIRE
+        aircraft = self.aircraft
+        while aircraft:
+            hexident, state = next(iter(aircraft.items()))
+            if state.seen >= cutoff:
+                break
+            del aircraft[hexident]
+
+    def decode_extended_squitter(self, frame, hexident, state, rssi):
+        """
+        Decode the ADS-B message of a DF17 or DF18 frame.
+
+        Parameters:
+        frame (bytes): Beast frame
+        hexident (str): hexident of vessel
+        state (CPRState): Decoding state of the aircraft
+        rssi (float): Signal level, in dBFS
+        """
+        me = int.from_bytes(frame[5:12], 'big')
+        type_code = me >> 51
+
+        if 1 <= type_code <= 4:
+            message = self.message(1, hexident, rssi)
+            chars = [
+                MODES_CHARSET[(me >> shift) & 0x3f]
+                for shift in range(42, -1, -6)]
+            message.callsign = "".join(chars).replace('#', '').strip() or None
+            return message, None
+
+        if 9 <= type_code <= 18 or 20 <= type_code <= 22:
+            message = self.message(3, hexident, rssi)
+            if type_code <= 18:
+                message.altitude = decode_ac12((me >> 36) & 0xfff)
+            message.is_on_ground = False
+            self.decode_position(message, state, me, False)
+            return message, None
+
+        if 5 <= type_code <= 8:
+            message = self.message(2, hexident, rssi)
+            message.is_on_ground = True
+            message.groundspeed = surface_speed((me >> 44) & 0x7f)
+            if (me >> 43) & 1:
+                message.track = round(((me >> 36) & 0x7f) * 360 / 128.0, 1)
+            self.decode_position(message, state, me, True)
+            return message, None
+
+        if type_code == 19:
+            message = self.message(4, hexident, rssi)
+            subtype = (me >> 48) & 7
+            if subtype == 1 or subtype == 2:
+                east_west = (me >> 32) & 0x3ff
+                north_south = (me >> 21) & 0x3ff
+                if east_west and north_south:
+                    scale = 4 if subtype == 2 else 1
+                    east = (east_west - 1) * scale
+                    north = (north_south - 1) * scale
+                    if (me >> 42) & 1:
+                        east = -east
+                    if (me >> 31) & 1:
+                        north = -north
+                    message.groundspeed = round(math.hypot(east, north), 1)
+                    message.track = round(
+                        math.degrees(math.atan2(east, north)) % 360, 1)
+            vertical_rate = (me >> 10) & 0x1ff
+            if vertical_rate:
+                vertical_rate = (vertical_rate - 1) * 64
+                message.verticalrate = (
+                    -vertical_rate if (me >> 19) & 1 else vertical_rate)
+            return message, None
+
+        if type_code == 28 and (me >> 48) & 7 == 1:
+            message = self.message(6, hexident, rssi)
+            message.emergency = bool((me >> 45) & 7)
+            id13 = (me >> 32) & 0x1fff
+            if id13:
+                message.squawk = int("%04x" % (decode_id13(id13)))
+            return message, None
+
+        return None, 'unsupported'
+
+    def decode_position(self, message, state, me, surface):
+        """
+        Decode an ADS-B position into 'message', if it can be.
+
+        Parameters:
+        message (SBSMessage): Message to set the latitude and longitude of
+        state (CPRState): Decoding state of the aircraft
+        me (int): ADS-B message
+        surface (bool): The position is a surface position
+        """
+        now = self.received
+        odd = (me >> 34) & 1
+        cpr = (((me >> 17) & 0x1ffff) / 131072.0,
+               (me & 0x1ffff) / 131072.0)
+        position = None
+        # Surface positions are only decoded locally, and are kept out of
+        # the even/odd pair so they are never mixed with airborne frames
+        if not surface:
+            if odd:
+                state.odd = cpr + (now,)
+                other = state.even
+            else:
+                state.even = cpr + (now,)
+                other = state.odd
+            if other is not None and now - other[2] <= self.PAIR_MAX_AGE:
+                position = cpr_global(
+                    state.even[:2], state.odd[:2], bool(odd))
+        if position is None:
+            last = state.position
+            if last is None or now - last[2] > self.RECENT:
+                return
+            position = cpr_local(cpr, odd, last[:2], surface)
+            if position is None:
+                return
+
+        state.position = position + (now,)
+        message.latitude = round(position[0], 5)
+        message.longitude = round(position[1], 5)
+
+
+class Vessel():
+    """
+    State tracked for a single vessel.
+
+    Fields are held as typed values (None until received) in slots rather
+    than as a dict of strings, to keep the per-vessel memory footprint small.
+    """
+
+    __slots__ = (
+        'hexident',
+        'callsign',
+        'current_altitude',
+        'current_groundspeed',
+        'current_track',
+        'current_latitude',
+        'current_longitude',
+        'current_verticalrate',
+        'squawk',
+        'alert_squawk_change',
+        'emergency',
+        'spi_ident',
+        'is_on_ground',
+        'lastseen',
+        'lastlogged',
+        'data_to_send',
+        'tagset',
+        'emitted',
+        )
+
+    def __init__(self, hexident):
+        """
+        Instantiate instance of Vessel.
+
+        Parameters:
+        hexident (str): hexident of vessel
+        """
+        self.hexident = hexident
+        self.callsign = ''
+        self.current_altitude = None        # int, ft
+        self.current_groundspeed = None     # float, kt
+        self.current_track = None           # float, degrees
+        self.current_latitude = None        # float
+        self.current_longitude = None       # float
+        self.current_verticalrate = None    # int, ft/min
+        self.squawk = None                  # int, digits as written
+        self.alert_squawk_change = None     # bool
+        self.emergency = None               # bool
+        self.spi_ident = None               # bool
+        self.is_on_ground = None            # bool
+        self.lastseen = None
+        self.lastlogged = None
+        self.data_to_send = []
+        self.tagset = None                  # see LineProtocolEncoder
+        self.emitted = None                 # see EmitFilter
+
+
+def escape_measurement(value):
+    """
+    Escape a measurement name for line protocol.
+
+    Parameters:
+    value (str): Measurement name
+    """
+    return value.replace(',', '\\,').replace(' ', '\\ ')
+
+
+def escape_key(value):
+    """
+    Escape a tag key, tag value or field key for line protocol.
+
+    Parameters:
+    value (str): Tag key, tag value or field key
+    """
+    return value.replace(
+        ',', '\\,').replace(
+        '=', '\\=').replace(
+        ' ', '\\ ')
+
+
+class LineProtocolEncoder():
+    """
+    Encodes vessel data as InfluxDB line protocol.
+
+    Each vessel's measurement and tag set ('piaware,hexident=...,callsign=...,
+    squawk=...') is escaped once and cached on the vessel in 'tagset'. The
+    cache is cleared whenever the vessel's callsign or squawk changes.
+
+    Field values are written according to their type. Integers are written
+    without the 'i' suffix, so InfluxDB stores them as floats like earlier
+    versions did, unless 'integer_fields' is set. Timestamps are integer
+    Unix nanoseconds.
+    """
+
+    def __init__(self, measurement='piaware', integer_fields=False):
+        """
+        Instantiate instance of LineProtocolEncoder.
+
+        Parameters:
+        measurement (str): Measurement name
+        integer_fields (bool): Write integer fields as InfluxDB integers
+                               ('i' suffix). Note that InfluxDB won't accept
+                               integers for fields that already hold floats.
+        """
+        self.measurement = escape_measurement(measurement)
+        self.int_format = "%di" if integer_fields else "%d"
+        # escaped field key and '=' for each field name seen
+        self.field_keys = {}
+
+    def tagset(self, vessel):
+        """
+        Return the vessel's escaped measurement and tag set, building it
+        if it isn't already cached.
+
+        Parameters:
+        vessel (Vessel): Vessel
+        """
+        if vessel.tagset is None:
+            tagset = [self.measurement]
+
+            # include hexident as every message should have one
+            tagset.append("hexident=" + escape_key(vessel.hexident))
+
+            # include callsign if present
+            if vessel.callsign != '':
+                tagset.append("callsign=" + escape_key(vessel.callsign))
+
+            # include squawk if present
+            if vessel.squawk is not None:
+                tagset.append("squawk=%04d" % (vessel.squawk))
+
+            vessel.tagset = ",".join(tagset)
+        return vessel.tagset
+
+    def encode(self, vessel, timestamp, fields, tags=""):
+        """
+        Encode a point as a line of line protocol.
+
+        Returns None if none of the fields have a value.
+
+        Parameters:
+        vessel (Vessel): Vessel the point relates to
+        timestamp (int): Unix nanosecond timestamp
+        fields (iterable): (field, value) pairs, values of None are skipped
+        tags (str): Escaped tags to add after the vessel's tag set,
+                    each preceded by ','
+        """
+        encoded = []
+        for field, value in fields:
+            if value is None:
+                continue
+            value_type = type(value)
+            if value_type is float:
+                # InfluxDB doesn't accept NaN or infinity
+                if value - value != 0:
+                    continue
+                value = repr(value)
+            elif value_type is int:
+                value = self.int_format % (value)
+            elif value_type is bool:
+                value = "true" if value else "false"
+            else:
+                value = '"%s"' % (
+                    str(value).replace('\\', '\\\\').replace('"', '\\"'))
+            key = self.field_keys.get(field)
+            if key is None:
+                key = self.field_keys[field] = escape_key(field) + "="
+            encoded.append(key + value)
+        if not encoded:
+            return None
+        return "%s%s %s %d" % (
+            vessel.tagset or self.tagset(vessel), tags, ",".join(encoded),
+            timestamp)
+
+
+class Feed():
+    """
+    A dump1090/readsb BaseStation feed, and the state kept for it.
+
+    Each feed has its own buffer of received data, so partial messages from
+    different receivers are never joined together. If the feed is named,
+    points from it are tagged 'receiver=<name>'. Vessel state is shared
+    between feeds.
+    """
+
+    def __init__(self, host, port, name=None):
+        """
+        Instantiate instance of Feed.
+
+        Parameters:
+        host (str): Host/IP for dump1090
+        port (int): TCP port for dump1090 BaseStation output
+        name (str): Receiver name to tag points with (None for no tag)
+        """
+        self.host = host
+        self.port = port
+        self.name = name
+        self.tags = "" if name is None else ",receiver=" + escape_key(name)
+        self.buffer = bytearray()
+        self.messages_processed = 0
+
+    @property
+    def label(self):
+        """
+        Name of the feed for logs and metrics, its host:port if unnamed.
+        """
+        if self.name is not None:
+            return self.name
+        return "%s:%s" % (self.host, self.port)
+
+
+def parse_feed(spec):
+    """
+    Parse a feed given as 'host:port[=name]'.
+
+    The receiver name defaults to the host.
+
+    Parameters:
+    spec (str): Feed specification
+    """
+    address, _, name = spec.partition('=')
+    host, _, port = address.rpartition(':')
+    if not host or not port.isdigit():
+        raise ValueError("Feed '%s' is not host:port[=name]" % (spec))
+    return Feed(host, int(port), name or host)
+
+
+class Deduplicator():
+    """
+    Drops points already received from another feed.
+
+    When receivers overlap, the same transmission is heard by several of
+    them. A point is a duplicate if a point with the same hexident and field
+    values arrived from a different feed within 'window' seconds, going by
+    the message timestamps.
+    """
+
+    def __init__(self, window):
+        """
+        Instantiate instance of Deduplicator.
+
+        Parameters:
+        window (float): Seconds within which points are duplicates
+        """
+        self.window = int(window * 1000000000)
+        # (hexident, fields) -> (timestamp, feed), oldest first
+        self.seen = collections.OrderedDict()
+        self.duplicates = 0
+
+    def duplicate(self, hexident, timestamp, fields, feed):
+        """
+        Return True if the point is a duplicate, otherwise remember it.
+
+        Parameters:
+        hexident (str): hexident of vessel
+        timestamp (int): Unix nanosecond timestamp
+        fields (tuple): (field, value) pairs
+        feed (Feed): Feed the point was received from
+        """
+        seen = self.seen
+        window = self.window
+
+        # Forget points that have left the window
+        cutoff = timestamp - window
+        while seen:
+            oldest = next(iter(seen.values()))
+            if oldest[0] >= cutoff:
+                break
+            seen.popitem(last=False)
+
+        key = (hexident, fields)
+        previous = seen.get(key)
+        if (previous is not None and
+                previous[1] is not feed and
+                abs(timestamp - previous[0]) <= window):
+            self.duplicates += 1
+            return True
+        seen[key] = (timestamp, feed)
+        seen.move_to_end(key)
+        return False
+
+
+def parse_deadband(spec):
+    """
+    Parse a deadband given as 'field=delta[:max_age]'.
+
+    Returns (field, delta, max_age), max_age is None if not given.
+
+    Parameters:
+    spec (str): Deadband specification
+    """
+    field, _, band = spec.partition('=')
+    delta, _, max_age = band.partition(':')
+    fields = [slot for slot in Vessel.__slots__ if slot.startswith('current_')]
+    if field not in fields:
+        raise ValueError("Deadband field '%s' is not one of: %s" % (
+            field, ", ".join(fields)))
+    try:
+        return field, float(delta), float(max_age) if max_age else None
+    except ValueError:
+        raise ValueError(
+            "Deadband '%s' is not field=delta[:max_age]" % (spec))
+
+
+class EmitFilter():
+    """
+    Suppresses points that add little to what was last written for a vessel.
+
+    The value and time each of a vessel's fields was last written is kept
+    in the vessel's 'emitted' state. A field is due to be written if:
+
+    * it hasn't been written for this vessel before, or
+    * 'min_interval' seconds have passed since it was last written, and
+      either it has no deadband, it has changed by at least its deadband's
+      delta, or its deadband's max age has passed.
+
+    A point is written, with all of its fields, if any of its fields are
+    due, so positions and velocities are never split up. Times are going
+    by the message timestamps.
+    """
+
+    def __init__(self, deadbands=(), min_interval=0):
+        """
+        Instantiate instance of EmitFilter.
+
+        Parameters:
+        deadbands (iterable): (field, delta, max_age) for each field with
+                              a deadband, max_age in seconds or None
+        min_interval (float): Minimum seconds between writes of a field
+        """
+        self.deadbands = {
+            field: (delta, None if max_age is None else int(max_age * 1e9))
+            for field, delta, max_age in deadbands
+            }
+        self.min_interval = int(min_interval * 1000000000)
+        self.suppressed = 0
+
+    def due(self, vessel, timestamp, fields):
+        """
+        Return True if the point should be written, and if so remember its
+        fields as written.
+
+        Parameters:
+        vessel (Vessel): Vessel the point relates to
+        timestamp (int): Unix nanosecond timestamp
+        fields (tuple): (field, value) pairs
+        """
+        emitted = vessel.emitted
+        if emitted is None:
+            emitted = vessel.emitted = {}
+        deadbands = self.deadbands
+        min_interval = self.min_interval
+
+        due = False
+        for field, value in fields:
+            last = emitted.get(field)
+            if last is None:
+                due = True
+                break
+            age = timestamp - last[1]
+            if age < min_interval:
+                continue
+            deadband = deadbands.get(field)
+            if (deadband is None or
+                    abs(value - last[0]) >= deadband[0] or
+                    (deadband[1] is not None and age >= deadband[1])):
+                due = True
+                break
+
+        if not due:
+            self.suppressed += 1
+            return False
+        for field, value in fields:
+            emitted[field] = (value, timestamp)
+        return True
+
+
+class Coalescer():
+    """
+    Merges points for the same vessel into one point per 'window' seconds.
+
+    Position, velocity and altitude arrive in separate messages, each of
+    which would otherwise be written as a point of its own. A point is held
+    back for 'window' seconds of message time, and the fields of points for
+    the same vessel that arrive meanwhile are merged into it. If a point
+    repeats a field with a different value, the held point is released
+    first, so no values are lost. The merged point has the timestamp of the
+    latest point merged into it, and the receiver of the first.
+    """
+
+    def __init__(self, window):
+        """
+        Instantiate instance of Coalescer.
+
+        Parameters:
+        window (float): Seconds to hold a point back for
+        """
+        self.window = int(window * 1000000000)
+        # hexident -> [vessel, first timestamp, latest timestamp,
+        #              {field: value}, [(field, value), ...], feed,
+        #              signal level of the latest message], oldest first
+        self.pending = collections.OrderedDict()
+        self.coalesced = 0
+
+    @staticmethod
+    def _point(pending):
+        vessel, _, timestamp, _, fields, feed, rssi = pending
+        return vessel, (timestamp, tuple(fields), rssi), feed
+
+    def add(self, vessel, data_to_send, feed):
+        """
+        Add a point, and return a list of (vessel, data_to_send, feed)
+        points that are ready to be written.
+
+        Parameters:
+        vessel (Vessel): Vessel the point relates to
+        data_to_send (tuple): Timestamp, (field, value) pairs and signal
+                              level (or None)
+        feed (Feed): Feed the point was received from
+        """
+        timestamp, fields, rssi = data_to_send
+        hexident = vessel.hexident
+        ready = []
+
+        pending = self.pending.get(hexident)
+        if pending is not None:
+            values = pending[3]
+            if (timestamp - pending[1] <= self.window and
+                    all(values.get(field, value) == value
+                        for field, value in fields)):
+                for field, value in fields:
+                    if field not in values:
+                        values[field] = value
+                        pending[4].append((field, value))
+                if timestamp >= pending[2]:
+                    pending[2] = timestamp
+                    pending[6] = rssi
+                self.coalesced += 1
+                return ready
+            del self.pending[hexident]
+            ready.append(self._point(pending))
+
+        self.pending[hexident] = [
+            vessel, timestamp, timestamp, dict(fields), list(fields), feed,
+            rssi]
+        return ready
+
+    def expire(self, timestamp):
+        """
+        Return a list of points whose window closed before 'timestamp'.
+
+        Parameters:
+        timestamp (int): Unix nanosecond timestamp of the latest message
+        """
+        ready = []
+        cutoff = timestamp - self.window
+        while self.pending:
+            pending = next(iter(self.pending.values()))
+            if pending[1] >= cutoff:
+                break
+            self.pending.popitem(last=False)
+            ready.append(self._point(pending))
+        return ready
+
+    def flush(self):
+        """
+        Return a list of all points held back.
+        """
+        ready = [self._point(pending) for pending in self.pending.values()]
+        self.pending.clear()
+        return ready
+
+
+class ReceiverGeometry():
+    """
+    Adds the range, bearing and elevation of positions from the receiver
+    to points, as the fields 'range' (NM), 'bearing' (degrees true) and
+    'elevation' (degrees above the horizon).
+
+    Points with a position are held back until flush(), which computes the
+    geometry of all of them at once with NumPy, if it is installed. Calling
+    into NumPy has a fixed cost that outweighs the per point saving for a
+    handful of points, so small batches are computed a point at a time, as
+    are all batches without NumPy. Elevation is computed from the vessel's
+    barometric altitude, so is approximate, and is left out while the
+    vessel's altitude isn't known.
+    """
+
+    # Mean radius of the Earth, in metres
+    EARTH_RADIUS = 6371008.8
+
+    # Fewest points worth computing with NumPy
+    NUMPY_MIN_POINTS = 12
+
+    def __init__(self, latitude, longitude, altitude=0):
+        """
+        Instantiate instance of ReceiverGeometry.
+
+        Parameters:
+        latitude (float): Latitude of the receiver
+        longitude (float): Longitude of the receiver
+        altitude (float): Altitude of the receiver, in ft
+        """
+        self.latitude = math.radians(latitude)
+        self.longitude = math.radians(longitude)
+        self.radius = self.EARTH_RADIUS + altitude * 0.3048
+        # [(vessel, data_to_send, feed, latitude, longitude, altitude)]
+        self.pending = []
+
+    @staticmethod
+    def valid(latitude, longitude):
+        """
+        Return whether a position is a finite latitude and longitude, in
+        range.
+
+        Parameters:
+        latitude (float): Latitude, or None
+        longitude (float): Longitude, or None
+        """
+        return (latitude is not None and longitude is not None and
+                -90 <= latitude <= 90 and -180 <= longitude <= 180)
+
+    def add(self, vessel, data_to_send, feed):
+        """
+        Hold back a point if it has a valid position, returning whether it
+        did. Points with an invalid position are left without geometry.
+
+        Parameters:
+        vessel (Vessel): Vessel the point relates to
+        data_to_send (tuple): Timestamp, (field, value) pairs and signal
+                              level (or None)
+        feed (Feed): Feed the point was received from
+        """
+        values = dict(data_to_send[1])
+        latitude = values.get('current_latitude')
+        longitude = values.get('current_longitude')
+        if not self.valid(latitude, longitude):
+            return False
+        altitude = values.get('current_altitude')
+        if altitude is None:
+            altitude = vessel.current_altitude
+        self.pending.append((
+            vessel, data_to_send, feed, latitude, longitude,
+            float('nan') if altitude is None else altitude))
+        return True
+
+    def flush(self):
+        """
+        Return a list of (vessel, data_to_send, feed) for the points held
+        back, with their range, bearing and elevation added.
+        """
+        if not self.pending:
+            return []
+        pending = self.pending
+        self.pending = []
+        _, _, _, latitudes, longitudes, altitudes = zip(*pending)
+        if numpy is not None and len(pending) >= self.NUMPY_MIN_POINTS:
+            geometry = zip(*self.compute_numpy(
+                latitudes, longitudes, altitudes))
+        else:
+            geometry = map(self.compute, latitudes, longitudes, altitudes)
+        return [
+            (vessel, (timestamp, fields + (
+                ('range', distance), ('bearing', bearing),
+                ('elevation', elevation)), rssi), feed)
+            for (vessel, (timestamp, fields, rssi), feed, _, _, _),
+            (distance, bearing, elevation) in zip(pending, geometry)]
+
+    def compute(self, latitude, longitude, altitude):
+        """
+        Return the (range, bearing, elevation) of one position, or None for
+        each if the position isn't valid.
+
+        Parameters:
+        latitude (float): Latitude of the vessel
+        longitude (float): Longitude of the vessel
+        altitude (float): Altitude of the vessel in ft, or NaN
+        """
+        if not self.valid(latitude, longitude):
+            return None, None, None
+        lat1 = self.latitude
+        lat2 = math.radians(latitude)
+        dlon = math.radians(longitude) - self.longitude
+        # Haversine, for the angle between the receiver and the vessel
+        a = (math.sin((lat2 - lat1) / 2) ** 2 +
+             math.cos(lat1) * math.cos(lat2) * math.sin(dlon / 2) ** 2)
+        angle = 2 * math.asin(math.sqrt(min(1.0, a)))
+        bearing = math.atan2(
+            math.sin(dlon) * math.cos(lat2),
+            math.cos(lat1) * math.sin(lat2) -
+            math.sin(lat1) * math.cos(lat2) * math.cos(dlon))
+        radius = self.EARTH_RADIUS + altitude * 0.3048
+        elevation = math.atan2(
+            radius * math.cos(angle) - self.radius,
+            radius * math.sin(angle))
+        return (
+            round(angle * self.EARTH_RADIUS / 1852, 2),
+            round(math.degrees(bearing) % 360, 1),
+            round(math.degrees(elevation), 2))
+
+    def compute_numpy(self, latitudes, longitudes, altitudes):
+        """
+        Return lists of the ranges, bearings and elevations of positions,
+        as compute() does, with NumPy. Each is None for a position that
+        isn't valid.
+
+        Parameters:
+        latitudes (sequence): Latitudes of the vessels
+        longitudes (sequence): Longitudes of the vessels
+        altitudes (sequence): Altitudes of the vessels in ft, or NaN
+        """
+        lat1 = self.latitude
+        latitudes = numpy.array(latitudes, dtype=float)
+        longitudes = numpy.array(longitudes, dtype=float)
+        # Comparisons with NaN are False, so NaN is invalid too
+        valid = ((latitudes >= -90) & (latitudes <= 90) &
+                 (longitudes >= -180) & (longitudes <= 180))
+        if not valid.all():
+            latitudes = numpy.where(valid, latitudes, 0.0)
+            longitudes = numpy.where(valid, longitudes, 0.0)
+        lat2 = numpy.radians(latitudes)
+        dlon = numpy.radians(longitudes) - self.longitude
+        cos_lat2 = numpy.cos(lat2)
+        a = (numpy.sin((lat2 - lat1) / 2) ** 2 +
+             math.cos(lat1) * cos_lat2 * numpy.sin(dlon / 2) ** 2)
+        angle = 2 * numpy.arcsin(numpy.sqrt(numpy.minimum(1.0, a)))
+        bearing = numpy.arctan2(
+            numpy.sin(dlon) * cos_lat2,
+            math.cos(lat1) * numpy.sin(lat2) -
+            math.sin(lat1) * cos_lat2 * numpy.cos(dlon))
+        radius = (self.EARTH_RADIUS +
+                  numpy.array(altitudes, dtype=float) * 0.3048)
+        elevation = numpy.arctan2(
+            radius * numpy.cos(angle) - self.radius,
+            radius * numpy.sin(angle))
+        # As lists of floats, which the encoder writes as it does any other
+        results = (
+            numpy.round(angle * (self.EARTH_RADIUS / 1852), 2).tolist(),
+            numpy.round(numpy.degrees(bearing) % 360, 1).tolist(),
+            numpy.round(numpy.degrees(elevation), 2).tolist())
+        if not valid.all():
+            for index in numpy.flatnonzero(~valid).tolist():
+                for values in results:
+                    values[index] = None
+        return results
+
+
+class Rollups():
+    """
+    Aggregates messages and points over fixed windows of message time, and
+    encodes the aggregates as measurements of their own once each window
+    closes, so long term dashboards needn't scan every point:
+
+    <measurement>_messages,msg_type=N count=    messages by transmission type
+    <measurement>_aircraft count=               aircraft heard from
+    <measurement>_range,sector=NNN max_range=   furthest position written
+                                                in each 10 degree sector of
+                                                bearing from the receiver
+    <measurement>_altitude,hexident=X           lowest and highest altitude
+        min_altitude=,max_altitude=             of each aircraft
+
+    Windows are aligned to multiples of 'interval', and points are
+    timestamped with the start of their window. A window is closed by the
+    first message of a later one, so nothing is written for a window
+    without messages.
+    """
+
+    def __init__(self, interval, measurement='piaware', integer_fields=False,
+                 tags=""):
+        """
+        Instantiate instance of Rollups.
+
+        Parameters:
+        interval (float): Seconds per window
+        measurement (str): Measurement name the rollups are named after
+        integer_fields (bool): Write altitudes as InfluxDB integers, as
+                               LineProtocolEncoder does
+        tags (str): Escaped tags to add to every point, each preceded by ','
+        """
+        self.interval = int(interval * 1000000000)
+        self.measurement = escape_measurement(measurement)
+        self.int_format = "%di" if integer_fields else "%d"
+        self.tags = tags
+        self.window = None
+        self.window_end = 0
+        self.message_types = collections.Counter()
+        self.aircraft = set()
+        # hexident -> [lowest, highest]
+        self.altitudes = {}
+        # sector -> furthest range
+        self.ranges = {}
+        self.points_written = 0
+
+    def add(self, message):
+        """
+        Add a message to the current window.
+
+        Parameters:
+        message (SBSMessage): ADSB message (parsed)
+        """
+        self.message_types[message.transmission_type] += 1
+        hexident = message.hexident
+        self.aircraft.add(hexident)
+        altitude = message.altitude
+        if altitude is not None:
+            extremes = self.altitudes.get(hexident)
+            if extremes is None:
+                self.altitudes[hexident] = [altitude, altitude]
+            elif altitude < extremes[0]:
+                extremes[0] = altitude
+            elif altitude > extremes[1]:
+                extremes[1] = altitude
+
+    def position(self, distance, bearing):
+        """
+        Add the range and bearing of a position to the current window,
+        unless either is missing or isn't finite.
+
+        Parameters:
+        distance (float): Range from the receiver, in NM, or None
+        bearing (float): Bearing from the receiver, in degrees, or None
+        """
+        if (distance is None or bearing is None or
+                not math.isfinite(distance) or not math.isfinite(bearing)):
+            return
+        sector = int(bearing // 10) % 36 * 10
+        if distance > self.ranges.get(sector, -1):
+            self.ranges[sector] = distance
+
+    def roll(self, timestamp):
+        """
+        Close the current window, and start the one holding 'timestamp'.
+        Returns the closed window's lines of line protocol.
+
+        Parameters:
+        timestamp (int): Unix nanosecond timestamp of the latest message
+        """
+        lines = self.flush()
+        self.window = timestamp - timestamp % self.interval
+        self.window_end = self.window + self.interval
+        return lines
+
+    def flush(self):
+        """
+        Close the current window, if there is one, and return its lines of
+        line protocol.
+        """
+        if self.window is None:
+            return []
+        measurement = self.measurement
+        tags = self.tags
+        suffix = " %d" % (self.window)
+        int_format = self.int_format
+
+        def altitude(value):
+            if type(value) is int:
+                return int_format % (value)
+            return repr(value)
+
+        lines = [
+            "%s_messages,msg_type=%d%s count=%di%s" % (
+                measurement, msg_type, tags, count, suffix)
+            for msg_type, count in sorted(self.message_types.items())]
+        lines.append("%s_aircraft%s count=%di%s" % (
+            measurement, tags, len(self.aircraft), suffix))
+        lines.extend(
+            "%s_range,sector=%03d%s max_range=%r%s" % (
+                measurement, sector, tags, distance, suffix)
+            for sector, distance in sorted(self.ranges.items()))
+        lines.extend(
+            "%s_altitude,hexident=%s%s min_altitude=%s,max_altitude=%s%s" % (
+                measurement, escape_key(hexident), tags, altitude(lowest),
+                altitude(highest), suffix)
+            for hexident, (lowest, highest) in self.altitudes.items())
+
+        self.window = None
+        self.window_end = 0
+        self.message_types.clear()
+        self.aircraft.clear()
+        self.altitudes.clear()
+        self.ranges.clear()
+        self.points_written += len(lines)
+        return lines
+
+
+class StageTimings():
+    """
+    Optional timing of the stages of an ADSB_Processor's pipeline.
+
+    While enabled, the method behind each stage is wrapped, on the instance
+    it belongs to, to record how long each call takes in a histogram.
+    While disabled the wrappers are removed, so timing costs nothing.
+
+    Stages nest: 'message' includes 'parse', 'timestamp', 'state', 'send'
+    and 'clean', and 'send' and 'geometry' include 'encode'. With worker
+    processes, only 'frame' runs in the main process, so only it is timed.
+    """
+
+    # (stage, attribute of the processor owning the method or None for
+    #  the processor itself, method)
+    STAGES = (
+        ('frame', None, 'frame'),
+        ('message', None, 'process_message'),
+        ('parse', None, 'parse_message'),
+        ('timestamp', 'timestamps', 'parse'),
+        ('state', None, 'update_state'),
+        ('send', None, 'send_data'),
+        ('encode', None, 'prepare_line_protocol'),
+        ('geometry', None, 'flush_geometry'),
+        ('clean', None, 'clean_database'),
+        )
+
+    BOUNDS = (
+        0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005,
+        0.0001, 0.00025, 0.0005, 0.001, 0.01, 0.1)
+
+    def __init__(self, processor):
+        """
+        Instantiate instance of StageTimings.
+
+        Parameters:
+        processor (ADSB_Processor): Processor whose stages to time
+        """
+        self.processor = processor
+        self.histograms = collections.OrderedDict(
+            (stage, Histogram(self.BOUNDS)) for stage, _, _ in self.STAGES)
+        self.logged = {
+            stage: (list(histogram.buckets), histogram.sum)
+            for stage, histogram in self.histograms.items()}
+        self.replaced = []
+
+    @property
+    def enabled(self):
+        return bool(self.replaced)
+
+    def enable(self):
+        """
+        Start timing each stage.
+        """
+        if self.enabled:
+            return
+        for stage, owner, name in self.STAGES:
+            owner = self.processor if owner is None else getattr(
+                self.processor, owner)
+            self.replaced.append((owner, name, vars(owner).get(name)))
+            setattr(owner, name, self.timed(
+                getattr(owner, name), self.histograms[stage]))
+        logger.info("TIMING: Stage timing enabled")
+
+    def disable(self):
+        """
+        Stop timing, restoring each stage's original method.
+        """
+        if not self.enabled:
+            return
+        for owner, name, original in self.replaced:
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self.replaced = []
+        logger.info("TIMING: Stage timing disabled")
+
+    def toggle(self):
+        """
+        Enable stage timing if it is disabled, and disable it if enabled.
+        """
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    @staticmethod
+    def timed(function, histogram):
+        """
+        Return a wrapper of 'function' recording its duration in 'histogram'.
+
+        Parameters:
+        function (callable): Function to time
+        histogram (Histogram): Histogram to record durations in
+        """
+        clock = time.perf_counter
+
+        def timed_function(*args, **kwargs):
+            started = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                histogram.observe(clock() - started)
+        return timed_function
+
+    def summary(self):
+        """
+        Return the number of calls, and average and 99th percentile duration,
+        of each stage called since the last summary, as text.
+        """
+        summaries = []
+        for stage, histogram in self.histograms.items():
+            buckets = list(histogram.buckets)
+            duration = histogram.sum
+            logged_buckets, logged_duration = self.logged[stage]
+            window = [
+                count - logged
+                for count, logged in zip(buckets, logged_buckets)]
+            self.logged[stage] = (buckets, duration)
+            calls = sum(window)
+            if calls == 0:
+                continue
+            # Upper bound of the bucket holding the 99th percentile
+            total = 0
+            for bound, count in zip(histogram.bounds + (None,), window):
+                total += count
+                if total >= calls * 0.99:
+                    break
+            summaries.append("%s: %d calls, avg %.1f us, p99 %s" % (
+                stage, calls,
+                (duration - logged_duration) / calls * 1e6,
+                "> %g us" % (histogram.bounds[-1] * 1e6) if bound is None
+                else "<= %g us" % (bound * 1e6)))
+        return ", ".join(summaries)
+
+
+class ADSB_Processor():
+    """
+    Receives ADSB information, converts to InfluxDB line protocol.
+
+    Sends line protocol data to InfluxDB via Telegraf.
+
+    As not all messages received contain sufficient data to send to InfluxDB,
+    this class keeps a small state database in memory so it is able to
+    construct a message to send to InfluxDB if insufficient data is received.
+
+    Also, every message contains the vessel's "ident" information,
+    but not all messages contain the callsign.
+
+    Once a callsign is received, it is kept in the state tracking database.
+
+    To keep the state tracking memory footprint small,
+    and to ensure information is up-to-date,
+    if no messages have been received from a vessel for a period of 15 minutes
+    or more, the vessel is ejected from the state tracking database.
+
+    For this reason, it is important to have your hosts'
+    clocks synchronised with NTP, and to have the correct timezone set.
+    """
+
+    def __init__(self, telegraf_url, verbose_logging=False,
+                 integer_fields=False, feeds=None, dedup_window=0,
+                 deadbands=(), min_emit_interval=0, coalesce_window=0,
+                 message_clock=False, input_format='sbs', receiver=None,
+                 rollup_interval=0, rollup_tags="", start_writer=True,
+                 **writer_options):
+        """
+        Instantiate instance of ADSB_Processor.
+
+        Parameters:
+        telegraf_url (str): URL of Telegraf's inputs.http_listener
+        verbose_logging (bool): Enable verbose logging
+        integer_fields (bool): Write integer fields as InfluxDB integers
+        feeds (list): Feeds data will be received from. Data added without
+                      a feed is treated as coming from the first.
+        dedup_window (float): Drop points received from another feed
+                              within this many seconds (0 to disable)
+        deadbands (iterable): (field, delta, max_age) deadbands for
+                              EmitFilter
+        min_emit_interval (float): Minimum seconds between writes of each
+                                   of a vessel's fields
+        coalesce_window (float): Merge each vessel's points within this
+                                 many seconds into one (0 to disable)
+        message_clock (bool): Expire vessels going by the time of the
+                              latest message, rather than the current time
+        input_format (str): Format of the data received, 'sbs'
+                            (BaseStation) or 'beast' (Beast binary)
+        receiver (tuple): (latitude, longitude, altitude in ft) of the
+                          receiver, to add the range, bearing and
+                          elevation of positions from it (None to disable)
+        rollup_interval (float): Write rollups of each window of this many
+                                 seconds (0 to disable)
+        rollup_tags (str): Escaped tags to add to rollups, each preceded
+                           by ','
+        start_writer (bool): Start the writer threads (False when the
+                             writer is driven by an AsyncRuntime)
+        writer_options: Passed through to LineProtocolWriter
+        """
+        self.feeds = feeds or [Feed(None, None)]
+        self.feed = self.feeds[0]
+        self.lock = threading.Lock()
+        self.database = collections.OrderedDict()
+        self.next_clean = 0
+        self.message_clock = message_clock
+        self.last_timestamp = 0
+        self.messages_processed = 0
+        self.parse_failures = collections.Counter()
+        self.message_types = collections.Counter()
+        self.stats_logged = time.monotonic()
+        self.telegraf_url = telegraf_url
+        self.verbose_logging = verbose_logging
+        self.tz = dateutil.tz.gettz()
+        self.timestamps = SBSTimestampParser(self.tz)
+        # Attributes rather than methods, so StageTimings can wrap them
+        self.beast = None
+        if input_format == 'beast':
+            self.beast = BeastDecoder()
+            self.frame = self.frame_beast
+            self.parse_message = self.beast.decode
+        else:
+            self.frame = self.frame_lines
+            self.parse_message = parse_sbs_message
+        self.encoder = LineProtocolEncoder(integer_fields=integer_fields)
+        self.dedup = None
+        if dedup_window > 0:
+            self.dedup = Deduplicator(dedup_window)
+        self.emit_filter = None
+        if deadbands or min_emit_interval > 0:
+            self.emit_filter = EmitFilter(deadbands, min_emit_interval)
+        self.coalescer = None
+        if coalesce_window > 0:
+            self.coalescer = Coalescer(coalesce_window)
+        self.geometry = None
+        if receiver is not None:
+            self.geometry = ReceiverGeometry(*receiver)
+        self.rollups = None
+        if rollup_interval > 0:
+            self.rollups = Rollups(
+                rollup_interval, integer_fields=integer_fields,
+                tags=rollup_tags)
+
+        # Called when lines are queued by a thread other than the reader's
+        self.on_queued = None
+
+        self.timings = StageTimings(self)
+
+        # Start the Telegraf writer
+        self.writer = LineProtocolWriter(
+            telegraf_url,
+            verbose_logging=verbose_logging,
+            **writer_options
+            )
+        self.write_q = self.writer.write_q
+        if start_writer:
+            self.writer.start()
+
+    @property
+    def points_sent(self):
+        return self.writer.points_sent
+
+    @property
+    def vessels(self):
+        return len(self.database)
+
+    @property
+    def duplicates(self):
+        return self.dedup.duplicates if self.dedup is not None else 0
+
+    @property
+    def suppressed(self):
+        if self.emit_filter is None:
+            return 0
+        return self.emit_filter.suppressed
+
+    @property
+    def coalesced(self):
+        return self.coalescer.coalesced if self.coalescer is not None else 0
+
+    def log_aircraft(self, hexident, text, *args, no_backoff=False):
+        """
+        Log a message relating to vessel.
+
+        Will only log an individual vessel once per minute, going by the
+        time of the vessel's messages, unless verbose logging is enabled.
+        The message is only formatted if it is going to be logged.
+
+        Parameters:
+        hexident (str): hexident of vessel
+        text (str): log message, with '%' placeholders for args
+        args: values for placeholders in text
+        no_backoff (bool): if true, ignore the once per minute rule
+        """
+        vessel = self.database[hexident]
+
+        # if we need to back off (ie: log once per minute)
+        if not (no_backoff or
+                self.verbose_logging or
+                vessel.lastlogged is None or
+                vessel.lastseen - vessel.lastlogged >= 60000000000):
+            return
+        vessel.lastlogged = vessel.lastseen
+
+        if vessel.callsign != "":
+            logger.info(
+                "[Ident: %s Callsign: %s] " + text,
+                hexident, vessel.callsign, *args)
+        else:
+            logger.info("[Ident: %s] " + text, hexident, *args)
+
+    def _clear_buffer(self, feed=None):
+        (feed or self.feed).buffer[:] = b''
+
+    def add_data_to_buffer(self, datareceived, feed=None):
+        """
+        Add raw ADSB data received to internal buffer.
+
+        May be called from a reader thread per feed.
+
+        Parameters:
+        datareceived (str): raw data received
+        feed (Feed): Feed the data was received from
+        """
+        feed = feed or self.feed
+        with self.lock:
+            feed.buffer.extend(datareceived)
+            self.process_buffer(feed)
+
+    def frame_lines(self, feed):
+        """
+        Remove all complete lines from the data buffer and return them.
+
+        The buffer is decoded and split in a single pass up to the last
+        line ending, and compacted once, rather than once per line.
+        Any partial line is left in the buffer so that when we receive
+        the remainder of the data we can assemble the message.
+        Lines may end in '\\r\\n' (BaseStation) or '\\n'.
+
+        Parameters:
+        feed (Feed): Feed whose buffer to frame
+        """
+        buffer = feed.buffer
+        last_newline = buffer.rfind(b'\n')
+        if last_newline < 0:
+            return []
+        with memoryview(buffer) as view:
+            lines = str(view[:last_newline], 'UTF-8', 'replace').splitlines()
+        del buffer[:last_newline + 1]
+        return lines
+
+    def frame_beast(self, feed):
+        """
+        Remove all complete Beast frames from the data buffer and return
+        them (see split_beast_frames).
+
+        Parameters:
+        feed (Feed): Feed whose buffer to frame
+        """
+        return split_beast_frames(feed.buffer)
+
+    def process_buffer(self, feed=None):
+        """
+        Process the data buffer.
+
+        Checks to see if any full ADSB messages have been received.
+        If so, process them.
+
+        Parameters:
+        feed (Feed): Feed whose buffer to process
+        """
+        feed = feed or self.feed
+        self.process_lines(self.frame(feed), feed)
+        self.maybe_log_stats()
+
+    def process_lines(self, lines, feed, received=None):
+        """
+        Process complete lines (or Beast frames) received from a feed.
+
+        Parameters:
+        lines (list): ADSB Messages (unparsed)
+        feed (Feed): Feed the lines were received from
+        received (int): Unix nanosecond time the lines were received,
+                        for Beast frames (defaults to now)
+        """
+        if self.beast is not None:
+            self.beast.receive(lines, received or int(time.time() * 1e9))
+        for line in lines:
+            if self.verbose_logging:
+                logger.debug("========== START PROCESSING MESSAGE ==========")
+            self.process_message(line, feed)
+            if self.verbose_logging:
+                logger.debug("========== FINISH PROCESSING MESSAGE ==========")
+            self.messages_processed += 1
+        feed.messages_processed += len(lines)
+        if self.geometry is not None:
+            self.flush_geometry()
+
+    def maybe_log_stats(self):
+        """
+        Log malformed message counts, stage timings if enabled, and messages
+        per feed if there is more than one, every 'stats_interval' seconds.
+        """
+        stats_interval = self.writer.stats_interval
+        if stats_interval <= 0:
+            return
+        now = time.monotonic()
+        if now - self.stats_logged < stats_interval:
+            return
+        self.stats_logged = now
+        if self.parse_failures:
+            logger.info("PARSE: malformed messages: %s", ", ".join(
+                "%s: %d" % (reason, count)
+                for reason, count in sorted(self.parse_failures.items())))
+        if self.emit_filter is not None or self.coalescer is not None:
+            logger.info(
+                "EMIT: points coalesced: %d, suppressed: %d",
+                self.coalesced, self.suppressed)
+        if self.timings.enabled:
+            logger.info("TIMING: %s", self.timings.summary())
+        if len(self.feeds) > 1:
+            logger.info(
+                "FEEDS: messages: %s, duplicates dropped: %d",
+                ", ".join(
+                    "%s: %d" % (feed.name, feed.messages_processed)
+                    for feed in self.feeds),
+                self.duplicates)
+
+    def clean_database(self, minutes_inactivity=15):
+        """
+        Remove stale entries from vessel database.
+
+        If a message hasn't been received from a vessel for
+        'minutes_inactivity', remove it from the state database.
+
+        The database is kept in the order vessels were last seen (see
+        'update_vessel_in_db'), so only vessels at the front of the
+        database need to be checked. This runs at most once per second.
+
+        If 'message_clock' is set (when replaying a capture), the time of
+        the latest message is used rather than the current time.
+
+        Parameters:
+        minutes_older_than (int): Expire vessel after this many minutes
+                                  of inactivity
+        """
+        if self.message_clock:
+            now = self.last_timestamp
+            if now < self.next_clean:
+                return
+            self.next_clean = now + 1000000000
+            cutoff = now - minutes_inactivity * 60000000000
+        else:
+            now = time.monotonic()
+            if now < self.next_clean:
+                return
+            self.next_clean = now + 1
+
+            # work out what was 15 mins ago,
+            # and clean out entries older than 15 minutes
+            cutoff = int(
+                (time.time() - minutes_inactivity * 60) * 1000000000)
+
+        while self.database:
+            hexident, vessel = next(iter(self.database.items()))
+            if vessel.lastseen >= cutoff:
+                break
+            if self.verbose_logging:
+                logger.debug(
+                    "Vessel '%s' lastseen: '%s', and cutoff: '%s'",
+                    hexident,
+                    vessel.lastseen,
+                    cutoff)
+            self.log_aircraft(
+                hexident,
+                "Expiring inactive vessel from state database",
+                no_backoff=True)
+            del self.database[hexident]
+
+    def add_vessel_to_db(self, message):
+        """
+        Add a vessel to the state database.
+
+        Parameters:
+        message (SBSMessage): ADSB Message (parsed)
+        """
+        vessel = Vessel(message.hexident)
+        self.database[message.hexident] = vessel
+
+        vessel.lastseen = message.timestamp
+
+        if self.verbose_logging:
+            logger.debug(
+                "Setting lastseen for '%s' to '%s'",
+                vessel.hexident,
+                vessel.lastseen)
+
+        self.update_vessel_fields(vessel, message)
+        self.log_aircraft(
+            message.hexident,
+            "Now receiving from this vessel",
+            no_backoff=True)
+
+    def update_vessel_in_db(self, message):
+        """
+        Update a vessel in the state database.
+
+        Parameters:
+        message (SBSMessage): ADSB Message (parsed)
+        """
+        vessel = self.database[message.hexident]
+
+        vessel.lastseen = message.timestamp
+
+        # keep the database in lastseen order for clean_database
+        self.database.move_to_end(message.hexident)
+
+        if self.verbose_logging:
+            logger.debug(
+                "Updating lastseen for '%s' to '%s'",
+                message.hexident,
+                vessel.lastseen)
+
+        self.update_vessel_fields(vessel, message)
+
+    def update_vessel_fields(self, vessel, message):
+        """
+        Update a vessel's state from the fields present in a message.
+
+        Parameters:
+        vessel (Vessel): Vessel to update
+        message (SBSMessage): ADSB Message (parsed)
+        """
+        # callsign and squawk are tags, so changing them means
+        # the vessel's cached tag set needs rebuilding
+        if (message.callsign is not None and
+                message.callsign != vessel.callsign):
+            vessel.callsign = message.callsign
+            vessel.tagset = None
+
+        if message.altitude is not None:
+            # altitude is in ft
+            vessel.current_altitude = message.altitude
+
+        if message.groundspeed is not None:
+            vessel.current_groundspeed = message.groundspeed
+
+        if message.track is not None:
+            vessel.current_track = message.track
+
+        if message.latitude is not None:
+            vessel.current_latitude = message.latitude
+
+        if message.longitude is not None:
+            vessel.current_longitude = message.longitude
+
+        if message.verticalrate is not None:
+            vessel.current_verticalrate = message.verticalrate
+
+        if message.squawk is not None and message.squawk != vessel.squawk:
+            vessel.squawk = message.squawk
+            vessel.tagset = None
+
+        if message.alert_squawk_change is not None:
+            vessel.alert_squawk_change = message.alert_squawk_change
+
+        if message.emergency is not None:
+            vessel.emergency = message.emergency
+
+        if message.spi_ident is not None:
+            vessel.spi_ident = message.spi_ident
+
+        if message.is_on_ground is not None:
+            vessel.is_on_ground = message.is_on_ground
+
+    def handle_msg_type_3(self, message):
+        """
+        Handle ADSB message type 3 (ES Airborne Position Message).
+
+        Parameters:
+        message (SBSMessage): ADSB message (parsed)
+        """
+
+        self.database[message.hexident].data_to_send.append((
+            message.timestamp,
+            (('current_altitude', message.altitude),
+             ('current_latitude', message.latitude),
+             ('current_longitude', message.longitude)),
+            message.rssi,
+            ))
+
+        self.log_aircraft(
+            message.hexident,
+            "Alt: %s, Lat: %s, Long: %s",
+            message.altitude,
+            message.latitude,
+            message.longitude)
+
+    def handle_msg_type_4(self, message):
+        """
+        Handle ADSB message type 3 (ES Airborne Velocity Message).
+
+        Parameters:
+        message (SBSMessage): ADSB message (parsed)
+        """
+
+        self.database[message.hexident].data_to_send.append((
+            message.timestamp,
+            (('current_groundspeed', message.groundspeed),
+             ('current_track', message.track),
+             ('current_verticalrate', message.verticalrate)),
+            message.rssi,
+            ))
+
+        self.log_aircraft(
+            message.hexident,
+            "GroundSpeed: %s, Track: %s, VerticalRate: %s",
+            message.groundspeed,
+            message.track,
+            message.verticalrate)
+
+    def handle_msg_type_5(self, message):
+        """
+        Handle ADSB message type 5 (Surveillance Alt Message).
+
+        Parameters:
+        message (SBSMessage): ADSB message (parsed)
+        """
+
+        self.database[message.hexident].data_to_send.append((
+            message.timestamp,
+            (('current_altitude', message.altitude),),
+            message.rssi,
+            ))
+
+        self.log_aircraft(message.hexident, "Alt: %s", message.altitude)
+
+    def handle_msg_type_6(self, message):
+        """
+        Handle ADSB message type 6 (Surveillance ID Message).
+
+        Parameters:
+        message (SBSMessage): ADSB message (parsed)
+        """
+
+        self.database[message.hexident].data_to_send.append((
+            message.timestamp,
+            (('current_altitude', message.altitude),),
+            message.rssi,
+            ))
+
+        self.log_aircraft(message.hexident, "Alt: %s", message.altitude)
+
+    def handle_msg_type_7(self, message):
+        """
+        Handle ADSB message type 7 (Air To Air Message).
+
+        Parameters:
+        message (SBSMessage): ADSB message (parsed)
+        """
+
+        self.database[message.hexident].data_to_send.append((
+            message.timestamp,
+            (('current_altitude', message.altitude),),
+            message.rssi,
+            ))
+
+        self.log_aircraft(message.hexident, "Alt: %s", message.altitude)
+
+    def prepare_line_protocol(self, vessel, data_to_send, feed=None):
+        """
+        Prepare line protocol to be sent to Telegraf.
+
+        Parameters:
+        vessel (Vessel): Vessel the data relates to
+        data_to_send (tuple): Timestamp, (field, value) pairs to send and
+                              signal level (or None)
+        feed (Feed): Feed the data was received from
+        """
+        timestamp, fields, rssi = data_to_send
+
+        # The signal level varies from message to message, so it is carried
+        # beside the fields, rather than being deduplicated, filtered or
+        # coalesced, and only added now
+        if rssi is not None:
+            fields = fields + (('rssi', rssi),)
+
+        line_protocol = self.encoder.encode(
+            vessel, timestamp, fields, (feed or self.feed).tags)
+        valid = line_protocol is not None
+
+        if self.verbose_logging:
+            logger.debug(
+                "Line protocol '%s', is valid: '%s'",
+                line_protocol,
+                valid)
+
+        return valid, line_protocol
+
+    def send_data(self, message, feed=None):
+        """
+        Send data to Telegraf, if required.
+
+        Parameters:
+        message (SBSMessage): ADSB Message (parsed)
+        feed (Feed): Feed the message was received from
+        """
+        vessel = self.database[message.hexident]
+
+        # Do we have data to send?
+
+        if self.verbose_logging:
+            logger.debug("Data to send: %r", vessel.data_to_send)
+
+        if len(vessel.data_to_send) >= 1:
+
+            # Do we have a callsign?
+
+            if self.verbose_logging:
+                logger.debug(
+                    "Callsign / Squawk: %r/%r",
+                    vessel.callsign,
+                    vessel.squawk)
+
+            # previously, this script would only send data if we had a callsign and squawk.
+            # changed on 5th June 2020 to send data regardless of this.
+            #
+            # if (
+            #         self.database[message[4]]['callsign'] != ''
+            #         and
+            #         self.database[message[4]]['squawk'] != ''
+            # ):
+            #
+
+            # iterate through data to send
+            for data_to_send in vessel.data_to_send:
+
+                # skip points already received from another feed
+                if self.dedup is not None and self.dedup.duplicate(
+                        message.hexident, data_to_send[0], data_to_send[1],
+                        feed or self.feed):
+                    if self.verbose_logging:
+                        logger.debug("Duplicate of another feed, skipping")
+                    continue
+
+                # merge with other points for this vessel, if coalescing
+                if self.coalescer is not None:
+                    for point in self.coalescer.add(
+                            vessel, data_to_send, feed or self.feed):
+                        self.write_point(*point)
+                else:
+                    self.write_point(vessel, data_to_send, feed)
 
             # remove entries we've already sent
-            self.database[message[4]]['data_to_send'] = list()
+            del vessel.data_to_send[:]
+
+    def write_point(self, vessel, data_to_send, feed=None):
+        """
+        Encode a point and queue it to be sent, unless within its deadbands.
+
+        Parameters:
+        vessel (Vessel): Vessel the data relates to
+        data_to_send (tuple): Timestamp, (field, value) pairs to send and
+                              signal level (or None)
+        feed (Feed): Feed the data was received from
+        """
+        # skip points within their deadbands
+        if self.emit_filter is not None and not self.emit_filter.due(
+                vessel, data_to_send[0], data_to_send[1]):
+            if self.verbose_logging:
+                logger.debug("Within deadband, skipping")
+            return
+
+        # positions are held back to add their geometry a batch at a time
+        if self.geometry is not None and self.geometry.add(
+                vessel, data_to_send, feed):
+            return
+
+        self.queue_point(vessel, data_to_send, feed)
+
+    def queue_point(self, vessel, data_to_send, feed=None):
+        """
+        Encode a point and queue it to be sent.
+
+        Parameters:
+        vessel (Vessel): Vessel the data relates to
+        data_to_send (tuple): Timestamp, (field, value) pairs to send and
+                              signal level (or None)
+        feed (Feed): Feed the data was received from
+        """
+        valid, line_protocol = \
+            self.prepare_line_protocol(vessel, data_to_send, feed)
+
+        # send line protocol
+        if valid:
+            self.write_q.offer(line_protocol)
+
+    def flush_geometry(self):
+        """
+        Add the receiver geometry to the positions held back, and queue
+        them to be sent.
+        """
+        for point in self.geometry.flush():
+            if self.rollups is not None:
+                # range and bearing are added ahead of elevation
+                fields = point[1][1]
+                self.rollups.position(fields[-3][1], fields[-2][1])
+            self.queue_point(*point)
+
+    def roll_up(self, timestamp):
+        """
+        Queue the rollups of the current window to be sent, and start the
+        window holding 'timestamp'.
+
+        Parameters:
+        timestamp (int): Unix nanosecond timestamp of the latest message
+        """
+        # positions held back belong to the window being closed
+        if self.geometry is not None:
+            self.flush_geometry()
+        for line in self.rollups.roll(timestamp):
+            self.write_q.offer(line)
+
+    def flush_pending(self):
+        """
+        Write any points held back for coalescing or for their geometry,
+        and the rollups of the current window.
+        """
+        if self.coalescer is not None:
+            for point in self.coalescer.flush():
+                self.write_point(*point)
+        if self.geometry is not None:
+            self.flush_geometry()
+        if self.rollups is not None:
+            for line in self.rollups.flush():
+                self.write_q.offer(line)
+
+    def process_message(self, line, feed=None):
+        """
+        Process an incoming ADSB message.
+
+        Parameters:
+        line (str): ADSB Message (unparsed)
+        feed (Feed): Feed the message was received from
+        """
+        message, reason = self.parse_message(line)
+
+        # Beast messages are timestamped as they are decoded
+        if message is not None and message.date is not None:
+            try:
+                message.timestamp = self.timestamps.parse(
+                    message.date, message.time)
+            except ValueError:
+                message, reason = None, 'timestamp'
+
+        if message is not None and message.timestamp > self.last_timestamp:
+            self.last_timestamp = message.timestamp
+
+        if message is None:
+            self.parse_failures[reason] += 1
+            if self.verbose_logging:
+                logger.debug("Invalid message received (%s)", reason)
+
+        else:
+
+            if self.verbose_logging:
+                logger.debug("Message contents: %r", line)
+
+            self.message_types[message.transmission_type] += 1
+
+            if self.rollups is not None:
+                if message.timestamp >= self.rollups.window_end:
+                    self.roll_up(message.timestamp)
+                self.rollups.add(message)
+
+            self.update_state(message)
+
+            # Send data to InfluxDB
+            self.send_data(message, feed)
+
+            # Send merged points whose window has closed
+            if self.coalescer is not None:
+                for point in self.coalescer.expire(message.timestamp):
+                    self.write_point(*point)
+
+        # Remove stale db entries if any exist
+        self.clean_database()
+
+    def update_state(self, message):
+        """
+        Update the state database from a message, queueing any data to send
+        on the vessel's data_to_send.
+
+        Parameters:
+        message (SBSMessage): ADSB Message (parsed)
+        """
+        # If the aircraft does not exist in our database,
+        # then create it
+        if message.hexident not in self.database:
+            self.add_vessel_to_db(message)
+
+        # If it does exist, then we update the values
+        else:
+            self.update_vessel_in_db(message)
+
+        # ES Identification and Category (callsign update)
+        if message.transmission_type == 1:
+            if self.verbose_logging:
+                logger.debug("Message type 1, nothing to do.")
+            pass
+
+        # ES Surface Position Message
+        # (Triggered by nose gear squat switch.)
+        elif message.transmission_type == 2:
+            if self.verbose_logging:
+                logger.debug("Message type 2, nothing to do.")
+            pass
+
+        # ES Airborne Position Message
+        elif (message.transmission_type == 3 and
+              message.altitude is not None and
+              message.latitude is not None and
+              message.longitude is not None):
+            if self.verbose_logging:
+                logger.debug("Message type 3, will process.")
+            self.handle_msg_type_3(message)
+
+        # ES Airborne Velocity Message
+        elif (message.transmission_type == 4 and
+              message.groundspeed is not None and
+              message.track is not None and
+              message.verticalrate is not None):
+            if self.verbose_logging:
+                logger.debug("Message type 4, will process.")
+            self.handle_msg_type_4(message)
+
+        # Surveillance Alt Message
+        # Triggered by ground radar. Not CRC secured.
+        # MSG,5 will only be output if  the aircraft has
+        # previously sent a MSG,1, 2, 3, 4 or 8 signal.
+        elif (message.transmission_type == 5 and
+              message.altitude is not None):
+            if self.verbose_logging:
+                logger.debug("Message type 5, will process.")
+            self.handle_msg_type_5(message)
+
+        # Surveillance ID Message
+        # Triggered by ground radar. Not CRC secured.
+        # MSG,6 will only be output if  the aircraft has
+        # previously sent a MSG,1, 2, 3, 4 or 8 signal.
+        elif (message.transmission_type == 6 and
+              message.altitude is not None):
+            if self.verbose_logging:
+                logger.debug("Message type 6, will process.")
+            self.handle_msg_type_6(message)
+
+        # Air To Air Message
+        # Triggered from TCAS.
+        # MSG,7 is now included in the SBS socket output.
+        elif (message.transmission_type == 7 and
+              message.altitude is not None):
+            if self.verbose_logging:
+                logger.debug("Message type 7, will process.")
+            self.handle_msg_type_7(message)
+
+        # All Call Reply
+        # Broadcast but also triggered by ground radar
+        elif message.transmission_type == 8:
+            if self.verbose_logging:
+                logger.debug("Message type 8, nothing to do.")
+            pass
+
+
+class LineList(list):
+    """
+    List of lines of line protocol, used by shard workers in place of a
+    WriteQueue.
+    """
+
+    offer = list.append
+
+
+def shard_worker(shard, shard_q, results_q, log_q, parent_pid, options):
+    """
+    Process lines for one shard of the vessel database, in a worker process.
+
+    Lists of lines are taken from 'shard_q', and the line protocol encoded
+    from each list is put onto 'results_q', along with the shard's counts
+    (see ShardedProcessor.COUNTS) and, at most once a second, counts of
+    malformed messages and of messages by transmission type. Log records
+    are sent to the parent process via 'log_q'.
+
+    Parameters:
+    shard (int): Shard number
+    shard_q (multiprocessing.Queue): (feed index, lines, time received)
+                                     to process
+    results_q (multiprocessing.Queue): Results for the parent process
+    log_q (multiprocessing.Queue): Log records for the parent process
+    parent_pid (int): Process ID of the parent, exit if it goes away
+    options (dict): Passed through to ADSB_Processor
+    """
+    logger.addHandler(logging.handlers.QueueHandler(log_q))
+    logger.setLevel(
+        logging.DEBUG if options.get('verbose_logging') else logging.INFO)
+    logger.propagate = False
+
+    # Each worker's rollups cover its own share of aircraft, so they are
+    # tagged with its shard to keep them from overwriting each other's
+    options = dict(options, rollup_tags="%s,shard=%d" % (
+        options['rollup_tags'], shard))
+    processor = ADSB_Processor(None, start_writer=False, **options)
+    processor.write_q = encoded = LineList()
+    feeds = processor.feeds
+    message_counts_sent = 0
+    message_counts_pending = False
+
+    while True:
+        try:
+            item = shard_q.get(timeout=1)
+        except queue.Empty:
+            if os.getppid() != parent_pid:
+                break
+            if not message_counts_pending:
+                continue
+            # Idle, so send the message counts held back while busy
+            message_counts_sent = 0
+            item = ()
+        if item is None:
+            processor.flush_pending()
+            message_counts_sent = 0
+        elif item:
+            feed_index, lines, received = item
+            processor.process_lines(lines, feeds[feed_index], received)
+
+        message_counts = None
+        now = time.monotonic()
+        if now - message_counts_sent >= 1:
+            message_counts = (
+                dict(processor.parse_failures),
+                dict(processor.message_types),
+                )
+            message_counts_sent = now
+        message_counts_pending = message_counts is None
+        counts = tuple(
+            getattr(processor, name) for name in ShardedProcessor.COUNTS)
+        results_q.put((shard, counts, message_counts, encoded[:]))
+        del encoded[:]
+
+        if item is None:
+            break
+
+
+class ShardedProcessor(ADSB_Processor):
+    """
+    Spreads ADSB processing across worker processes, sharded by hexident.
+
+    Received data is split into lines in this process, and each line is
+    sent to the worker that owns its hexident, so each worker holds its own
+    slice of the vessel database and every aircraft's messages are
+    processed in order. Lines are sent to workers in lists, one per shard
+    per read, rather than one at a time. Beast frames are sharded by the
+    address they are from, so the worker that decodes a reply relying on
+    an address is the one that has seen the address confirmed.
+
+    Workers parse messages, update vessel state and encode line protocol,
+    which is sent back to this process and queued for the writer as usual.
+    The same transmission heard by several receivers has the same hexident,
+    so duplicates are still dropped by the worker that owns it.
+    """
+
+    # Counts reported by each worker, summed over the workers
+    COUNTS = ('vessels', 'duplicates', 'suppressed', 'coalesced')
+
+    def __init__(self, telegraf_url, workers=2, verbose_logging=False,
+                 integer_fields=False, feeds=None, dedup_window=0,
+                 deadbands=(), min_emit_interval=0, coalesce_window=0,
+                 message_clock=False, input_format='sbs', receiver=None,
+                 rollup_interval=0, rollup_tags="", start_writer=True,
+                 **writer_options):
+        """
+        Instantiate instance of ShardedProcessor, and start its workers.
+
+        Parameters:
+        telegraf_url (str): URL of Telegraf's inputs.http_listener
+        workers (int): Number of worker processes
+        verbose_logging (bool): Enable verbose logging
+        integer_fields (bool): Write integer fields as InfluxDB integers
+        feeds (list): Feeds data will be received from
+        dedup_window (float): Drop points received from another feed
+                              within this many seconds (0 to disable)
+        deadbands (iterable): (field, delta, max_age) deadbands for
+                              EmitFilter
+        min_emit_interval (float): Minimum seconds between writes of each
+                                   of a vessel's fields
+        coalesce_window (float): Merge each vessel's points within this
+                                 many seconds into one (0 to disable)
+        message_clock (bool): Expire vessels going by the time of the
+                              latest message, rather than the current time
+        input_format (str): Format of the data received, 'sbs'
+                            (BaseStation) or 'beast' (Beast binary)
+        receiver (tuple): (latitude, longitude, altitude in ft) of the
+                          receiver, to add the range, bearing and
+                          elevation of positions from it (None to disable)
+        rollup_interval (float): Write rollups of each window of this many
+                                 seconds, tagged with the worker's shard
+                                 (0 to disable)
+        rollup_tags (str): Escaped tags to add to rollups, each preceded
+                           by ','
+        start_writer (bool): Start the writer threads
+        writer_options: Passed through to LineProtocolWriter
+        """
+        ADSB_Processor.__init__(
+            self,
+            telegraf_url,
+            verbose_logging=verbose_logging,
+            integer_fields=integer_fields,
+            feeds=feeds,
+            deadbands=deadbands,
+            min_emit_interval=min_emit_interval,
+            coalesce_window=coalesce_window,
+            message_clock=message_clock,
+            input_format=input_format,
+            start_writer=start_writer,
+            **writer_options
+            )
+        self.workers = max(1, workers)
+        self.feed_index = {feed: i for i, feed in enumerate(self.feeds)}
+
+        # Per shard counters, as last reported by each worker
+        self.shard_counts = [(0,) * len(self.COUNTS)] * self.workers
+        self.shard_message_counts = [({}, {})] * self.workers
+
+        # Spawn rather than fork, as this process already runs threads
+        context = multiprocessing.get_context('spawn')
+        # Bounded, so a writer that can't keep up holds up the readers
+        self.shard_queues = [context.Queue(64) for _ in range(self.workers)]
+        self.results_q = context.Queue(64 * self.workers)
+        self.log_q = context.Queue()
+
+        # Worker log records are handled as if they were logged here
+        self.log_listener = logging.handlers.QueueListener(self.log_q, logger)
+        self.log_listener.start()
+
+        options = {
+            'verbose_logging': verbose_logging,
+            'integer_fields': integer_fields,
+            'feeds': self.feeds,
+            'dedup_window': dedup_window,
+            'deadbands': deadbands,
+            'min_emit_interval': min_emit_interval,
+            'coalesce_window': coalesce_window,
+            'message_clock': message_clock,
+            'input_format': input_format,
+            'receiver': receiver,
+            'rollup_interval': rollup_interval,
+            'rollup_tags': rollup_tags,
+            }
+        self.worker_processes = []
+        for shard in range(self.workers):
+            worker = context.Process(
+                target=shard_worker,
+                args=(shard, self.shard_queues[shard], self.results_q,
+                      self.log_q, os.getpid(), options),
+                )
+            worker.daemon = True
+            worker.start()
+            self.worker_processes.append(worker)
+
+        self.results_thread = threading.Thread(target=self.results_loop)
+        self.results_thread.daemon = True
+        self.results_thread.start()
+
+    def _count(self, name):
+        index = self.COUNTS.index(name)
+        return sum(counts[index] for counts in self.shard_counts)
+
+    @property
+    def vessels(self):
+        return self._count('vessels')
+
+    @property
+    def duplicates(self):
+        return self._count('duplicates')
+
+    @property
+    def suppressed(self):
+        return self._count('suppressed')
+
+    @property
+    def coalesced(self):
+        return self._count('coalesced')
+
+    def process_buffer(self, feed=None):
+        """
+        Send complete lines in the data buffer to the workers.
+
+        Parameters:
+        feed (Feed): Feed whose buffer to process
+        """
+        feed = feed or self.feed
+        lines = self.frame(feed)
+        if not lines:
+            return
+
+        workers = self.workers
+        shards = [[] for _ in range(workers)]
+        received = None
+        if self.beast is not None:
+            received = int(time.time() * 1e9)
+            for frame in lines:
+                address = BeastDecoder.address(frame)
+                if address is not None:
+                    shards[address % workers].append(frame)
+                else:
+                    shards[0].append(frame)
+        else:
+            for line in lines:
+                fields = line.split(',', 5)
+                if len(fields) > 5:
+                    # Stripped as the parser strips the hexident, and case
+                    # insensitive, so padding or case can't send an
+                    # aircraft's messages to two workers
+                    shard = hash(fields[4].strip().upper()) % workers
+                    shards[shard].append(line)
+                else:
+                    # Not a message, but let a worker count it as malformed
+                    shards[0].append(line)
+
+        feed_index = self.feed_index[feed]
+        for shard, shard_lines in enumerate(shards):
+            if shard_lines:
+                self.shard_queues[shard].put(
+                    (feed_index, shard_lines, received))
+
+        self.messages_processed += len(lines)
+        feed.messages_processed += len(lines)
+        self.maybe_log_stats()
+
+    def results_loop(self):
+        """
+        Queue line protocol sent back by the workers for the writer.
+        """
+        write_q = self.write_q
+        while True:
+            item = self.results_q.get()
+            if item is None:
+                break
+            shard, counts, message_counts, lines = item
+            self.shard_counts[shard] = counts
+            if message_counts is not None:
+                self.shard_message_counts[shard] = message_counts
+                parse_failures = collections.Counter()
+                message_types = collections.Counter()
+                for failures, types in self.shard_message_counts:
+                    parse_failures.update(failures)
+                    message_types.update(types)
+                self.parse_failures = parse_failures
+                self.message_types = message_types
+            if lines:
+                for line in lines:
+                    write_q.offer(line)
+                if self.on_queued is not None:
+                    self.on_queued()
+
+    def stop_workers(self):
+        """
+        Stop the workers once they have processed all lines sent to them,
+        and queue the last of their line protocol for the writer.
+        """
+        for shard_q in self.shard_queues:
+            shard_q.put(None)
+        for worker in self.worker_processes:
+            worker.join()
+        self.results_q.put(None)
+        self.results_thread.join()
+        self.log_listener.stop()
+
+
+class Profiler():
+    """
+    Profiles the processing and sending of data with cProfile for a while,
+    and writes the statistics to a pstats file.
+
+    While profiling, the processor's add_data_to_buffer and the writer's
+    flush are wrapped on their instances, as StageTimings does, so every
+    thread reading or sending data is profiled, each with its own
+    cProfile.Profile, and profiling costs nothing the rest of the time.
+    Worker processes (see --workers) are not profiled.
+    """
+
+    def __init__(self, processor, directory):
+        """
+        Instantiate instance of Profiler.
+
+        Parameters:
+        processor (ADSB_Processor): Processor to profile
+        directory (str): Directory to write profiles to
+        """
+        self.processor = processor
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.running = False
+        self.replaced = []
+        self.profiles = []
+        self.active = 0
+        self.local = None
+
+    def start(self, seconds):
+        """
+        Profile for 'seconds' seconds, unless already profiling.
 
-    def process_message(self, message):
+        Parameters:
+        seconds (float): Seconds to profile for
         """
-        Process an incoming ADSB message.
+        with self.lock:
+            if self.running:
+                logger.info("PROFILE: Already profiling")
+                return
+            self.running = True
+            self.profiles = []
+            self.local = threading.local()
+        for owner, name in ((self.processor, 'add_data_to_buffer'),
+                            (self.processor.writer, 'flush')):
+            self.replaced.append((owner, name, vars(owner).get(name)))
+            setattr(owner, name, self.profiled(getattr(owner, name)))
+        logger.info("PROFILE: Profiling for %g s", seconds)
+        timer = threading.Timer(seconds, self.stop)
+        timer.daemon = True
+        timer.start()
+
+    def profiled(self, function):
+        """
+        Return a wrapper of 'function' profiling it in the calling thread.
 
         Parameters:
-        message (str): ADSB Message (unsplit)
+        function (callable): Function to profile
+        """
+        def profiled_function(*args, **kwargs):
+            profile = getattr(self.local, 'profile', None)
+            with self.lock:
+                if profile is None:
+                    profile = self.local.profile = cProfile.Profile()
+                    self.profiles.append(profile)
+                self.active += 1
+            profile.enable()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                profile.disable()
+                with self.lock:
+                    self.active -= 1
+        return profiled_function
+
+    def stop(self):
         """
-        if self.is_message_valid(message):
+        Stop profiling, and write the statistics gathered.
+        """
+        for owner, name, original in self.replaced:
+            if original is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, original)
+        self.replaced = []
 
-            # Split message into fields
-            message = message.split(',')
+        # Wait for calls still being profiled
+        deadline = time.monotonic() + 10
+        while self.active and time.monotonic() < deadline:
+            time.sleep(0.01)
 
-            if self.verbose_logging:
-                self.log("<%s> Message contents: '%s'" % \
-                    (inspect.currentframe().f_code.co_name,
-                    repr(message)))
+        path = os.path.join(
+            self.directory,
+            "piaware2influx-%s.pstats" % (time.strftime('%Y%m%d-%H%M%S')))
+        try:
+            if not self.profiles:
+                logger.info("PROFILE: Nothing was profiled")
+                return
+            stats = pstats.Stats(*self.profiles)
+            os.makedirs(self.directory, exist_ok=True)
+            stats.dump_stats(path)
+            logger.info(
+                "PROFILE: Wrote profile of %d function calls to '%s'",
+                stats.total_calls, path)
+        except OSError as e:
+            logger.error("ERROR: could not write profile! %r", e)
+        finally:
+            with self.lock:
+                self.running = False
+
+
+def in_thread(function, *args):
+    """
+    Return a signal handler calling 'function' with 'args' in a new thread.
 
-            # If the aircraft does not exist in our database,
-            # then create it
-            if message[4].upper() not in self.database.keys():
-                self.add_vessel_to_db(message)
+    Signal handlers interrupt the main thread, possibly while it holds a
+    lock that 'function' would need, so they do no more than this.
 
-            # If it does exist, then we update the values
-            else:
-                self.update_vessel_in_db(message)
+    Parameters:
+    function (callable): Function to call
+    args: Arguments to call it with
+    """
+    def handler(signum, frame):
+        handler_thread = threading.Thread(target=function, args=args)
+        handler_thread.daemon = True
+        handler_thread.start()
+    return handler
 
-            # ES Identification and Category (callsign update)
-            if message[1] == '1':
-                if self.verbose_logging:
-                    self.log("<%s> Message type 1, nothing to do." % \
-                        (inspect.currentframe().f_code.co_name))
-                pass
 
-            # ES Surface Position Message
-            # (Triggered by nose gear squat switch.)
-            elif message[1] == '2':
-                if self.verbose_logging:
-                    self.log("<%s> Message type 2, nothing to do." % \
-                        (inspect.currentframe().f_code.co_name))
-                pass
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves the metrics of the server's Metrics at /metrics.
+    """
 
-            # ES Airborne Position Message
-            elif (message[1] == '3' and
-                  message[11] != '' and
-                  message[14] != '' and
-                  message[15] != ''):
-                if self.verbose_logging:
-                    self.log("<%s> Message type 3, will process." % \
-                        (inspect.currentframe().f_code.co_name))
-                self.handle_msg_type_3(message)
-
-            # ES Airborne Velocity Message
-            elif (message[1] == '4' and
-                  message[12] != '' and
-                  message[13] != '' and
-                  message[16] != ''):
-                if self.verbose_logging:
-                    self.log("<%s> Message type 4, will process." % \
-                        (inspect.currentframe().f_code.co_name))
-                self.handle_msg_type_4(message)
-
-            # Surveillance Alt Message
-            # Triggered by ground radar. Not CRC secured.
-            # MSG,5 will only be output if  the aircraft has
-            # previously sent a MSG,1, 2, 3, 4 or 8 signal.
-            elif message[1] == '5' and message[11] != '':
-                if self.verbose_logging:
-                    self.log("<%s> Message type 5, will process." % \
-                        (inspect.currentframe().f_code.co_name))
-                self.handle_msg_type_5(message)
-
-            # Surveillance ID Message
-            # Triggered by ground radar. Not CRC secured.
-            # MSG,6 will only be output if  the aircraft has
-            # previously sent a MSG,1, 2, 3, 4 or 8 signal.
-            elif message[1] == '6' and message[11] != '':
-                if self.verbose_logging:
-                    self.log("<%s> Message type 6, will process." % \
-                        (inspect.currentframe().f_code.co_name))
-                self.handle_msg_type_6(message)
-
-            # Air To Air Message
-            # Triggered from TCAS.
-            # MSG,7 is now included in the SBS socket output.
-            elif message[1] == '7' and message[11] != '':
-                if self.verbose_logging:
-                    self.log("<%s> Message type 7, will process." % \
-                        (inspect.currentframe().f_code.co_name))
-                self.handle_msg_type_7(message)
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.metrics.prometheus().encode('UTF-8')
+        self.send_response(200)
+        self.send_header(
+            'Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
 
-            # All Call Reply
-            # Broadcast but also triggered by ground radar
-            elif message[1] == '8':
-                if self.verbose_logging:
-                    self.log("<%s> Message type 8, nothing to do." % \
-                        (inspect.currentframe().f_code.co_name))
-                pass
+    def log_message(self, format, *args):
+        logger.debug("METRICS: %s - %s", self.address_string(), format % args)
 
-            # Send data to InfluxDB
-            self.send_data(message)
 
-        # Remove stale db entries if any exist
-        self.clean_database()
+class MetricsServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    """
+    HTTP server for MetricsHandler, handling each request in a thread.
+    """
+
+    daemon_threads = True
+
+
+def escape_label(value):
+    """
+    Escape a label value for the Prometheus text format.
+
+    Parameters:
+    value (str): Label value
+    """
+    return value.replace(
+        '\\', '\\\\').replace(
+        '"', '\\"').replace(
+        '\n', '\\n')
+
+
+class Metrics():
+    """
+    Collects metrics from an ADSB_Processor and its writer.
+
+    Metrics can be served over HTTP in the Prometheus text format, and
+    written as line protocol (self-telemetry) alongside the vessel data.
+    Counters only ever increase, so rates (e.g. messages per second) are
+    worked out by whatever reads them, between two readings.
+
+    Each metric is collected as (name, type, help, samples), where each
+    sample is (suffix, labels, value) and labels is a tuple of
+    (name, value) pairs.
+    """
+
+    PREFIX = 'piaware2influx_'
+
+    def __init__(self, processor, measurement='piaware2influx'):
+        """
+        Instantiate instance of Metrics.
+
+        Parameters:
+        processor (ADSB_Processor): Processor to collect metrics from
+        measurement (str): Measurement to write self-telemetry to
+        """
+        self.processor = processor
+        self.measurement = escape_measurement(measurement)
+
+    def collect(self):
+        """
+        Return the current value of each metric.
+        """
+        processor = self.processor
+        writer = processor.writer
+        write_q = writer.write_q
+        sink = writer.sink
+
+        # Read without processor.lock, which a reader holds while it waits
+        # for room in a full write queue. Copying a dict is atomic under
+        # the GIL, and a histogram read mid-update is at most one
+        # observation out.
+        parse_failures = sorted(dict(processor.parse_failures).items())
+        message_types = sorted(dict(processor.message_types).items())
+        stage_samples = []
+        for stage, histogram in processor.timings.histograms.items():
+            if histogram.count:
+                stage_samples.extend(
+                    self.histogram_samples(histogram, (('stage', stage),)))
+        with writer.stats_lock:
+            points_sent = writer.points_sent
+            batches_sent = writer.batches_sent
+            bytes_sent = writer.bytes_sent
+            latency_samples = self.histogram_samples(writer.flush_latency)
+        status_codes = []
+        request_errors = None
+        if isinstance(sink, TelegrafSink):
+            with sink.stats_lock:
+                status_codes = sorted(sink.status_codes.items())
+                request_errors = sink.request_errors
+        packets = None
+        if isinstance(sink, SocketSink):
+            with sink.stats_lock:
+                packets = (sink.packets_sent, sink.packets_dropped)
+
+        metrics = [
+            ('messages_received_total', 'counter',
+             "Lines received from dump1090",
+             [('', (), processor.messages_processed)]),
+            ('feed_messages_received_total', 'counter',
+             "Lines received from dump1090, by receiver",
+             [('', (('receiver', feed.label),), feed.messages_processed)
+              for feed in processor.feeds]),
+            ('messages_parsed_total', 'counter',
+             "Valid messages, by transmission type",
+             [('', (('msg_type', str(msg_type)),), count)
+              for msg_type, count in message_types]),
+            ('parse_failures_total', 'counter',
+             "Malformed messages, by reason",
+             [('', (('reason', reason),), count)
+              for reason, count in parse_failures]),
+            ('vessels', 'gauge',
+             "Vessels in the state database",
+             [('', (), processor.vessels)]),
+            ('points_duplicate_total', 'counter',
+             "Points dropped as duplicates from another receiver",
+             [('', (), processor.duplicates)]),
+            ('points_suppressed_total', 'counter',
+             "Points suppressed by deadbands or the minimum emit interval",
+             [('', (), processor.suppressed)]),
+            ('points_coalesced_total', 'counter',
+             "Points merged into another point",
+             [('', (), processor.coalesced)]),
+            ('write_queue_depth', 'gauge',
+             "Points waiting to be sent",
+             [('', (), write_q.qsize())]),
+            ('write_queue_max_depth', 'gauge',
+             "Most points that have been waiting to be sent at once",
+             [('', (), write_q.max_depth)]),
+            ('write_queue_size', 'gauge',
+             "Maximum points waiting to be sent (0 for unbounded)",
+             [('', (), write_q.maxsize)]),
+            ('points_dropped_total', 'counter',
+             "Points dropped from a full queue, by which point was dropped",
+             [('', (('dropped', 'oldest'),), write_q.dropped_oldest),
+              ('', (('dropped', 'newest'),), write_q.dropped_newest)]),
+            ('points_spilled_total', 'counter',
+             "Points spilled to the spool from a full queue",
+             [('', (), write_q.spilled)]),
+            ('points_sent_total', 'counter',
+             "Points accepted by the sink",
+             [('', (), points_sent)]),
+            ('points_failed_total', 'counter',
+             "Points that could not be sent, and were discarded",
+             [('', (), writer.points_failed)]),
+            ('points_spooled_total', 'counter',
+             "Points that could not be sent, and were spooled",
+             [('', (), writer.points_spooled)]),
+            ('points_replayed_total', 'counter',
+             "Points replayed from the spool",
+             [('', (), writer.points_replayed)]),
+            ('batches_total', 'counter',
+             "Batches flushed to the sink",
+             [('', (), batches_sent)]),
+            ('sink_bytes_sent_total', 'counter',
+             "Bytes of line protocol accepted by the sink",
+             [('', (), bytes_sent)]),
+            ('sink_request_duration_seconds', 'histogram',
+             "Time taken to flush a batch to the sink",
+             latency_samples),
+            ]
+        if stage_samples:
+            metrics.append(
+                ('stage_duration_seconds', 'histogram',
+                 "Time taken by each call of a pipeline stage, while stage "
+                 "timing is enabled",
+                 stage_samples))
+        if request_errors is not None:
+            metrics.append(
+                ('sink_responses_total', 'counter',
+                 "Responses from Telegraf or InfluxDB, by HTTP status code",
+                 [('', (('code', str(code)),), count)
+                  for code, count in status_codes]))
+            metrics.append(
+                ('sink_request_errors_total', 'counter',
+                 "Requests to Telegraf or InfluxDB that got no response",
+                 [('', (), request_errors)]))
+        if packets is not None:
+            metrics.append(
+                ('sink_packets_total', 'counter',
+                 "Datagrams or stream writes to Telegraf's socket_listener, "
+                 "by whether they were sent or dropped",
+                 [('', (('result', 'sent'),), packets[0]),
+                  ('', (('result', 'dropped'),), packets[1])]))
+        return metrics
+
+    @staticmethod
+    def histogram_samples(histogram, labels=()):
+        """
+        Return the samples of a Histogram.
+
+        Parameters:
+        histogram (Histogram): Histogram
+        labels (tuple): (name, value) pairs to label the samples with
+        """
+        samples = [
+            ('_bucket',
+             labels + (('le', '+Inf' if math.isinf(bound) else
+                        repr(float(bound))),),
+             count)
+            for bound, count in histogram.cumulative()
+            ]
+        samples.append(('_sum', labels, histogram.sum))
+        samples.append(('_count', labels, histogram.count))
+        return samples
+
+    def prometheus(self):
+        """
+        Return the metrics in the Prometheus text format.
+        """
+        output = []
+        for name, metric_type, text, samples in self.collect():
+            name = self.PREFIX + name
+            output.append("# HELP %s %s\n" % (name, text))
+            output.append("# TYPE %s %s\n" % (name, metric_type))
+            for suffix, labels, value in samples:
+                if labels:
+                    output.append("%s%s{%s} %s\n" % (
+                        name, suffix,
+                        ",".join('%s="%s"' % (label, escape_label(label_value))
+                                 for label, label_value in labels),
+                        value))
+                else:
+                    output.append("%s%s %s\n" % (name, suffix, value))
+        return "".join(output)
+
+    def line_protocol(self, timestamp):
+        """
+        Return the metrics as lines of line protocol.
+
+        Samples with the same labels are written as fields of one point,
+        with the labels as tags. Histogram buckets are left out.
+
+        Parameters:
+        timestamp (int): Unix timestamp in nanoseconds
+        """
+        points = collections.OrderedDict()
+        for name, _, _, samples in self.collect():
+            for suffix, labels, value in samples:
+                if suffix == '_bucket':
+                    continue
+                points.setdefault(labels, []).append(
+                    "%s=%s" % (escape_key(name + suffix), float(value)))
+        lines = []
+        for labels, fields in points.items():
+            tags = "".join(
+                ",%s=%s" % (escape_key(label), escape_key(value))
+                for label, value in labels)
+            lines.append("%s%s %s %d" % (
+                self.measurement, tags, ",".join(fields), timestamp))
+        return lines
+
+    def start_server(self, port, address=''):
+        """
+        Serve metrics at http://address:port/metrics from a background
+        thread.
 
+        Parameters:
+        port (int): TCP port to listen on
+        address (str): Address to listen on (all addresses if empty)
+        """
+        server = MetricsServer((address, port), MetricsHandler)
+        server.metrics = self
+        server_thread = threading.Thread(target=server.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+        logger.info(
+            "METRICS: Serving metrics at http://%s:%d/metrics",
+            address or '0.0.0.0', port)
+        return server
+
+    def start_telemetry(self, interval):
+        """
+        Queue the metrics as line protocol every 'interval' seconds, from
+        a background thread.
+
+        Parameters:
+        interval (float): Seconds between writes
+        """
+        telemetry_thread = threading.Thread(
+            target=self.telemetry_loop, args=(interval,))
+        telemetry_thread.daemon = True
+        telemetry_thread.start()
+
+    def telemetry_loop(self, interval):
+        while True:
+            time.sleep(interval)
+            processor = self.processor
+            for line in self.line_protocol(int(time.time() * 1000000000)):
+                processor.write_q.offer(line)
+            if processor.on_queued is not None:
+                processor.on_queued()
 
-def setup_socket(host, port):
+
+def setup_socket(host, port, reconnect_max=60):
     """
-    Create and configures a socket to Telegraf.
+    Create and configures a socket to dump1090.
+
+    Retries with exponential backoff until connected.
 
     Parameters:
-    host (str): Host/IP for Telegraf inputs.http_listener
-    port (int): TCP port for Telegraf inputs.http_listener
+    host (str): Host/IP for dump1090
+    port (int): TCP port for dump1090 BaseStation output
+    reconnect_max (float): Maximum seconds to wait between attempts
     """
     logmessage = "CONNECT: Connecting to "
     logmessage += "%s:%s to receive dump1090 " % (host, port)
     logmessage += "TCP BaseStation output data"
-    D.log(logmessage)
+    logger.info(logmessage)
     skt = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     connected = False
+    delay = 1
     while not connected:
         try:
             skt.connect((host, port))
-            D.log("CONNECT: Connected OK, receiving data")
+            logger.info("CONNECT: Connected OK, receiving data")
         except:
             connected = False
-            D.log("CONNECT: Could not connect, retrying")
-            time.sleep(1)
+            logger.info("CONNECT: Could not connect, retrying in %d s", delay)
+            time.sleep(delay)
+            delay = min(delay * 2, max(1, reconnect_max))
         else:
             connected = True
     skt.setblocking(False)
@@ -764,6 +4660,355 @@ def setup_socket(host, port):
     return skt
 
 
+def read_feed(processor, feed, recv_size=16384, reconnect_max=60,
+              stopping=None):
+    """
+    Read BaseStation data from a feed and process it, until 'stopping' is
+    set (or forever, if it isn't given).
+
+    Reconnects whenever the connection is lost.
+
+    Parameters:
+    processor (ADSB_Processor): Processor to pass data to
+    feed (Feed): Feed to read
+    recv_size (int): Bytes to read from dump1090 at a time
+    reconnect_max (float): Maximum seconds to wait between attempts
+    stopping (threading.Event): Set to stop reading
+    """
+    s = setup_socket(feed.host, feed.port, reconnect_max)
+
+    while stopping is None or not stopping.is_set():
+        try:
+            data = s.recv(recv_size)
+            #s.send(bytes("\r\n", "UTF-8"))
+            if not data:
+                raise socket.error("Connection closed by dump1090")
+            processor.add_data_to_buffer(data, feed)
+        except socket.timeout:
+            # print("TIMEOUT!")
+            pass
+        except socket.error:
+            logger.info(
+                "CONNECT: Disconnected from dump1090 at %s:%s!",
+                feed.host, feed.port)
+            s.close()
+            processor._clear_buffer(feed)
+            time.sleep(1)
+            s = setup_socket(feed.host, feed.port, reconnect_max)
+    s.close()
+
+
+def open_capture(path):
+    """
+    Open a recorded BaseStation capture for reading, as bytes.
+
+    Plain, gzip and zstandard (if the zstandard module is installed) files
+    are recognised by their contents.
+
+    Parameters:
+    path (str): Capture file
+    """
+    capture = open(path, 'rb')
+    magic = capture.read(4)
+    capture.seek(0)
+    if magic[:2] == b'\x1f\x8b':
+        return gzip.GzipFile(fileobj=capture)
+    if magic == b'\x28\xb5\x2f\xfd':
+        if zstandard is None:
+            capture.close()
+            raise ValueError(
+                "'%s' is zstandard compressed, which needs the zstandard "
+                "module (pip3 install zstandard)" % (path))
+        return zstandard.ZstdDecompressor().stream_reader(capture)
+    return capture
+
+
+def replay_capture(processor, capture, speed=0, read_size=16384):
+    """
+    Stream a recorded BaseStation capture through a processor.
+
+    With 'speed' 0 the capture is read as fast as it can be processed.
+    Otherwise it is paced by the messages' timestamps, at 'speed' times
+    real time.
+
+    Parameters:
+    processor (ADSB_Processor): Processor to pass data to
+    capture (file): Capture, opened with open_capture
+    speed (float): Multiple of real time to replay at (0 for unpaced)
+    read_size (int): Bytes to read from the capture at a time
+    """
+    feed = processor.feed
+    read = functools.partial(capture.read, read_size)
+
+    if speed <= 0:
+        for data in iter(read, b''):
+            processor.add_data_to_buffer(data, feed)
+
+    else:
+        timestamps = SBSTimestampParser(processor.tz)
+        first = None
+        started = None
+        partial = b''
+        for data in iter(read, b''):
+            lines = (partial + data).split(b'\n')
+            partial = lines.pop()
+            start = 0
+            for i, line in enumerate(lines):
+                fields = line.split(b',', 8)
+                if len(fields) < 9:
+                    continue
+                try:
+                    timestamp = timestamps.parse(
+                        fields[6].decode('ascii'), fields[7].decode('ascii'))
+                except (ValueError, UnicodeDecodeError):
+                    continue
+                if first is None:
+                    first = timestamp
+                    started = time.monotonic()
+                delay = (started + (timestamp - first) / 1e9 / speed -
+                         time.monotonic())
+                if delay > 0.01:
+                    # pass on the lines so far, then wait for this one
+                    if i > start:
+                        processor.add_data_to_buffer(
+                            b'\n'.join(lines[start:i]) + b'\n', feed)
+                        start = i
+                    time.sleep(delay)
+            if start < len(lines):
+                processor.add_data_to_buffer(
+                    b'\n'.join(lines[start:]) + b'\n', feed)
+        processor.add_data_to_buffer(partial, feed)
+
+    # Process a final message with no line ending
+    processor.add_data_to_buffer(b'\n', feed)
+
+
+class AsyncRuntime():
+    """
+    Runs an ADSB_Processor on an asyncio event loop.
+
+    BaseStation data is read with an asyncio StreamReader and processed on
+    the event loop. Lines queued by the processor are collected into batches
+    on the event loop too, so no lock is contended between reading and
+    batching. Only the HTTP request to the sink runs off the loop, in a
+    small thread pool, with at most 'max_in_flight' batches in flight while
+    the next one is being collected.
+
+    Each of the processor's feeds is read by its own task. If the
+    connection to a feed can't be made or is lost, it is retried with
+    exponential backoff, from 1 second up to 'reconnect_max' seconds.
+    """
+
+    def __init__(self, processor, recv_size=16384, max_in_flight=1,
+                 reconnect_max=60):
+        """
+        Instantiate instance of AsyncRuntime.
+
+        Parameters:
+        processor (ADSB_Processor): Processor, created with
+                                    start_writer=False
+        recv_size (int): Bytes to read from dump1090 at a time
+        max_in_flight (int): Maximum batches being sent at once
+        reconnect_max (float): Maximum seconds to wait between attempts
+                               to connect to dump1090
+        """
+        self.processor = processor
+        self.writer = processor.writer
+        self.write_q = processor.write_q
+        self.recv_size = max(1, recv_size)
+        self.max_in_flight = max(1, max_in_flight)
+        self.reconnect_max = max(1, reconnect_max)
+        # A loop of our own, as get_event_loop() outside of a running loop
+        # is deprecated. It is set as the current loop so the semaphore and
+        # events below (and asyncio.gather in run()) use it on Python < 3.10
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.max_in_flight)
+        # Lines for shard workers are put on bounded multiprocessing queues,
+        # which block when a worker falls behind, so they are put from a
+        # thread of their own rather than from the loop
+        self.shard_executor = None
+        if isinstance(processor, ShardedProcessor):
+            self.shard_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=1)
+        self.in_flight = asyncio.Semaphore(self.max_in_flight)
+        self.queued = asyncio.Event()
+        self.drained = asyncio.Event()
+        self.stopping = False
+
+        # The reader waits for room itself, rather than blocking the loop
+        self.write_q.wait_when_full = False
+
+        # Line protocol from shard workers and self-telemetry is queued by
+        # other threads
+        processor.on_queued = functools.partial(
+            self.loop.call_soon_threadsafe, self.queued.set)
+
+    def run(self):
+        """
+        Read, process and send data until stopped by SIGINT or SIGTERM.
+        """
+        self.writer.start_spool()
+        read_task = asyncio.gather(*[
+            self.read_loop(feed) for feed in self.processor.feeds])
+        write_task = self.loop.create_task(self.write_loop())
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.loop.add_signal_handler(signum, read_task.cancel)
+        try:
+            self.loop.run_until_complete(read_task)
+        except asyncio.CancelledError:
+            pass
+        logger.info("Stopping, sending queued points")
+        if self.shard_executor is not None:
+            # Let lines already read reach the workers before stopping them
+            self.shard_executor.shutdown()
+            self.processor.stop_workers()
+        else:
+            self.processor.flush_pending()
+        self.stopping = True
+        self.queued.set()
+        self.loop.run_until_complete(write_task)
+        self.executor.shutdown()
+        self.writer.stop()
+        self.loop.close()
+
+    async def wait_for_room(self):
+        """
+        Wait until the write queue has room, if its policy is 'block'.
+        """
+        maxsize = self.write_q.maxsize
+        if self.write_q.policy != 'block' or maxsize <= 0:
+            return
+        while self.write_q.qsize() >= maxsize:
+            self.drained.clear()
+            await self.drained.wait()
+
+    async def read_loop(self, feed):
+        """
+        Read BaseStation data from a feed and process it.
+
+        Parameters:
+        feed (Feed): Feed to read
+        """
+        delay = 1
+        while True:
+            logger.info(
+                "CONNECT: Connecting to %s:%s to receive dump1090 "
+                "TCP BaseStation output data", feed.host, feed.port)
+            try:
+                reader, writer = await asyncio.open_connection(
+                    feed.host, feed.port)
+            except OSError:
+                logger.info(
+                    "CONNECT: Could not connect, retrying in %d s", delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.reconnect_max)
+                continue
+            logger.info("CONNECT: Connected OK, receiving data")
+            delay = 1
+            try:
+                while True:
+                    await self.wait_for_room()
+                    data = await reader.read(self.recv_size)
+                    if not data:
+                        break
+                    if self.shard_executor is not None:
+                        await self.loop.run_in_executor(
+                            self.shard_executor,
+                            self.processor.add_data_to_buffer, data, feed)
+                    else:
+                        self.processor.add_data_to_buffer(data, feed)
+                    if not self.write_q.empty():
+                        self.queued.set()
+            except OSError:
+                pass
+            finally:
+                writer.close()
+            # Don't join a partial line onto the next connection's data
+            self.processor._clear_buffer(feed)
+            logger.info(
+                "CONNECT: Disconnected from dump1090 at %s:%s!",
+                feed.host, feed.port)
+            await asyncio.sleep(1)
+
+    def drain(self, batch, batch_bytes):
+        """
+        Move lines from the write queue into a batch, up to the batch limits.
+
+        Returns the size of the batch in bytes.
+
+        Parameters:
+        batch (list): Batch to add lines to
+        batch_bytes (int): Size of the batch so far in bytes
+        """
+        writer = self.writer
+        write_q = self.write_q
+        while (len(batch) < writer.batch_max_lines and
+               batch_bytes < writer.batch_max_bytes):
+            try:
+                line = write_q.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(line)
+            batch_bytes += len(line) + 1
+        self.drained.set()
+        return batch_bytes
+
+    async def write_loop(self):
+        """
+        Collect queued lines into batches and send them.
+
+        A batch is sent once it is full, or 'batch_linger' seconds after it
+        was started. Returns once stopping and the queue has been emptied.
+        """
+        writer = self.writer
+        while True:
+            if self.write_q.empty():
+                if self.stopping:
+                    break
+                self.queued.clear()
+                await self.queued.wait()
+                continue
+
+            batch = []
+            batch_bytes = self.drain(batch, 0)
+            deadline = self.loop.time() + writer.batch_linger
+            while (len(batch) < writer.batch_max_lines and
+                   batch_bytes < writer.batch_max_bytes and
+                   not self.stopping):
+                timeout = deadline - self.loop.time()
+                if timeout <= 0:
+                    break
+                self.queued.clear()
+                try:
+                    await asyncio.wait_for(self.queued.wait(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch_bytes = self.drain(batch, batch_bytes)
+
+            await self.in_flight.acquire()
+            self.loop.create_task(self.flush(batch))
+
+        # Wait for batches still being sent
+        for _ in range(self.max_in_flight):
+            await self.in_flight.acquire()
+
+    async def flush(self, batch):
+        """
+        Send a batch to the sink from the thread pool.
+
+        Parameters:
+        batch (list): Lines of line protocol
+        """
+        try:
+            await self.loop.run_in_executor(
+                self.executor, self.writer.flush, batch)
+            self.writer.maybe_log_stats()
+        finally:
+            self.in_flight.release()
+
+
 if __name__ == "__main__":
 
     appdescription = 'Read dump1090/readsb TCP BaseStation data, '
@@ -782,6 +5027,15 @@ if __name__ == "__main__":
         default="30003",
         help="Port for dump1090 TCP BaseStation data [30003]"
         )
+    help_input_format = "Format of the data read from dump1090: sbs "
+    help_input_format += "(BaseStation, usually port 30003) or beast (Beast "
+    help_input_format += "binary, usually port 30005) [sbs]"
+    parser.add_argument(
+        '--input-format',
+        default='sbs',
+        choices=('sbs', 'beast'),
+        help=help_input_format
+        )
     help_telegraf_url = "URL for Telegraf inputs.http_listener "
     help_telegraf_url += "[http://127.0.0.1:8186/write]"
     parser.add_argument(
@@ -790,6 +5044,348 @@ if __name__ == "__main__":
         default="http://127.0.0.1:8186/write",
         help=help_telegraf_url
         )
+    help_influxdb_url = "Write to InfluxDB at this URL (e.g. "
+    help_influxdb_url += "http://influxdb:8086) rather than to Telegraf"
+    parser.add_argument(
+        '--influxdb-url',
+        help=help_influxdb_url
+        )
+    parser.add_argument(
+        '--influxdb-db',
+        default='piaware',
+        help="InfluxDB database to write to, with --influxdb-url [piaware]"
+        )
+    help_influxdb_rp = "InfluxDB retention policy to write to, with "
+    help_influxdb_rp += "--influxdb-url [the database's default]"
+    parser.add_argument(
+        '--influxdb-rp',
+        help=help_influxdb_rp
+        )
+    help_influxdb_user = "User name for InfluxDB, with --influxdb-url "
+    help_influxdb_user += "[$INFLUXDB_USER]"
+    parser.add_argument(
+        '--influxdb-user',
+        default=os.getenv('INFLUXDB_USER'),
+        help=help_influxdb_user
+        )
+    help_influxdb_password = "Password for InfluxDB, with --influxdb-url "
+    help_influxdb_password += "[$INFLUXDB_PASS]"
+    parser.add_argument(
+        '--influxdb-password',
+        default=os.getenv('INFLUXDB_PASS'),
+        help=help_influxdb_password
+        )
+    help_influxdb_gzip_level = "gzip compression level for requests to "
+    help_influxdb_gzip_level += "InfluxDB, 0 to send uncompressed [1]"
+    parser.add_argument(
+        '--influxdb-gzip-level',
+        default=1,
+        type=int,
+        choices=range(10),
+        metavar='{0-9}',
+        help=help_influxdb_gzip_level
+        )
+    help_feed = "Read BaseStation data from host:port, tagging points with "
+    help_feed += "receiver=name (defaults to host). Repeat for each "
+    help_feed += "receiver. Overrides --dump1090-server and --dump1090-port"
+    parser.add_argument(
+        '--feed',
+        action='append',
+        metavar='HOST:PORT[=NAME]',
+        help=help_feed
+        )
+    help_dedup_window = "With more than one --feed, drop points received "
+    help_dedup_window += "from another feed within this many seconds, "
+    help_dedup_window += "0 to disable [2.0]"
+    parser.add_argument(
+        '--dedup-window',
+        default=2.0,
+        type=float,
+        help=help_dedup_window
+        )
+    help_workers = "Number of worker processes to parse, track and encode "
+    help_workers += "messages in, sharded by hexident. 1 processes them in "
+    help_workers += "the main process [1]"
+    parser.add_argument(
+        '--workers',
+        default=1,
+        type=int,
+        help=help_workers
+        )
+    help_deadband = "Only write a point if FIELD changed by at least DELTA, "
+    help_deadband += "or MAX_AGE seconds have passed, since it was last "
+    help_deadband += "written for the vessel, e.g. current_altitude=25:10. "
+    help_deadband += "Repeat for each field"
+    parser.add_argument(
+        '--deadband',
+        action='append',
+        default=[],
+        metavar='FIELD=DELTA[:MAX_AGE]',
+        help=help_deadband
+        )
+    help_min_emit_interval = "Minimum seconds between writes of each of a "
+    help_min_emit_interval += "vessel's fields, 0 to disable [0]"
+    parser.add_argument(
+        '--min-emit-interval',
+        default=0,
+        type=float,
+        help=help_min_emit_interval
+        )
+    help_coalesce_window = "Merge each aircraft's position, velocity and "
+    help_coalesce_window += "altitude points within this many seconds into "
+    help_coalesce_window += "one point, 0 to disable [0]"
+    parser.add_argument(
+        '--coalesce-window',
+        default=0,
+        type=float,
+        help=help_coalesce_window
+        )
+    help_receiver_lat = "Latitude of the receiver. With --receiver-lon, "
+    help_receiver_lat += "adds range, bearing and elevation fields to "
+    help_receiver_lat += "position points"
+    parser.add_argument(
+        '--receiver-lat',
+        type=float,
+        help=help_receiver_lat
+        )
+    parser.add_argument(
+        '--receiver-lon',
+        type=float,
+        help="Longitude of the receiver"
+        )
+    parser.add_argument(
+        '--receiver-alt',
+        default=0,
+        type=float,
+        help="Altitude of the receiver's antenna, in ft [0]"
+        )
+    help_rollup_interval = "Write rollups (messages by type, aircraft seen, "
+    help_rollup_interval += "range by sector and altitude by aircraft) of "
+    help_rollup_interval += "each window of this many seconds, 0 to disable "
+    help_rollup_interval += "[0]"
+    parser.add_argument(
+        '--rollup-interval',
+        default=0,
+        type=float,
+        help=help_rollup_interval
+        )
+    help_rollup_rp = "Tag rollups with rp=RP, for Telegraf to write them to "
+    help_rollup_rp += "the InfluxDB retention policy RP"
+    parser.add_argument(
+        '--rollup-rp',
+        metavar='RP',
+        help=help_rollup_rp
+        )
+    parser.add_argument(
+        '--recv-size',
+        default=16384,
+        type=int,
+        help="Bytes to read from dump1090 at a time [16384]"
+        )
+    help_reconnect_max = "Maximum seconds to wait between attempts to "
+    help_reconnect_max += "connect to dump1090 [60]"
+    parser.add_argument(
+        '--reconnect-max',
+        default=60,
+        type=float,
+        help=help_reconnect_max
+        )
+    help_mode = "Run with a thread per writer (threads), or on an asyncio "
+    help_mode += "event loop (asyncio) [threads]"
+    parser.add_argument(
+        '--mode',
+        default='threads',
+        choices=('threads', 'asyncio'),
+        help=help_mode
+        )
+    help_integer_fields = "Write integer fields (altitude, vertical rate) as "
+    help_integer_fields += "InfluxDB integers. Only use with a new database, "
+    help_integer_fields += "as existing fields hold floats"
+    parser.add_argument(
+        '--integer-fields',
+        action='store_true',
+        help=help_integer_fields
+        )
+    parser.add_argument(
+        '--batch-lines',
+        default=5000,
+        type=int,
+        help="Maximum lines of line protocol per request to Telegraf [5000]"
+        )
+    parser.add_argument(
+        '--batch-bytes',
+        default=1048576,
+        type=int,
+        help="Maximum bytes of line protocol per request to Telegraf [1048576]"
+        )
+    help_batch_linger = "Seconds to wait for a batch to fill before "
+    help_batch_linger += "sending it to Telegraf [1.0]"
+    parser.add_argument(
+        '--batch-linger',
+        default=1.0,
+        type=float,
+        help=help_batch_linger
+        )
+    parser.add_argument(
+        '--writers',
+        default=1,
+        type=int,
+        help="Number of threads sending batches to Telegraf [1]"
+        )
+    help_max_in_flight = "Maximum concurrent requests to Telegraf "
+    help_max_in_flight += "[same as --writers]"
+    parser.add_argument(
+        '--max-in-flight',
+        default=None,
+        type=int,
+        help=help_max_in_flight
+        )
+    help_telegraf_timeout = "Seconds to wait for Telegraf (or InfluxDB, "
+    help_telegraf_timeout += "with --influxdb-url) to respond [10]"
+    parser.add_argument(
+        '--telegraf-timeout',
+        default=10,
+        type=float,
+        help=help_telegraf_timeout
+        )
+    help_queue_size = "Maximum points waiting to be sent to Telegraf, "
+    help_queue_size += "0 for unbounded [100000]"
+    parser.add_argument(
+        '--queue-size',
+        default=100000,
+        type=int,
+        help=help_queue_size
+        )
+    help_queue_policy = "What to do with new points when the queue is full "
+    help_queue_policy += "[block]"
+    parser.add_argument(
+        '--queue-policy',
+        default='block',
+        choices=WriteQueue.POLICIES,
+        help=help_queue_policy
+        )
+    help_spool_dir = "Directory to spool points that could not be sent, "
+    help_spool_dir += "or that were spilled from a full queue "
+    help_spool_dir += "[no spool]"
+    parser.add_argument(
+        '--spool-dir',
+        default=None,
+        help=help_spool_dir
+        )
+    parser.add_argument(
+        '--spool-segment-bytes',
+        default=4194304,
+        type=int,
+        help="Size of each spool segment file [4194304]"
+        )
+    parser.add_argument(
+        '--spool-replay-rate',
+        default=5000,
+        type=int,
+        help="Maximum points per second to replay from the spool [5000]"
+        )
+    help_no_spool = "Discard points that could not be sent, "
+    help_no_spool += "even if --spool-dir is given"
+    parser.add_argument(
+        '--no-spool',
+        action='store_true',
+        help=help_no_spool
+        )
+    help_replay = "Replay a recorded BaseStation capture (plain, gzip or "
+    help_replay += "zstandard) rather than reading from dump1090, then exit"
+    parser.add_argument(
+        '--replay',
+        metavar='FILE',
+        help=help_replay
+        )
+    help_replay_speed = "Replay at this multiple of real time, 0 for as fast "
+    help_replay_speed += "as possible [0]"
+    parser.add_argument(
+        '--replay-speed',
+        default=0,
+        type=float,
+        help=help_replay_speed
+        )
+    help_output_file = "Write line protocol to this file (gzip compressed if "
+    help_output_file += "it ends in .gz) rather than sending it to Telegraf"
+    parser.add_argument(
+        '--output-file',
+        metavar='FILE',
+        help=help_output_file
+        )
+    help_output = "Send line protocol to Telegraf's inputs.socket_listener "
+    help_output += "at udp://host:port or unix:///path rather than over HTTP"
+    parser.add_argument(
+        '--output',
+        metavar='URL',
+        help=help_output
+        )
+    help_output_mtu = "MTU of the path to Telegraf, for packing "
+    help_output_mtu += "--output udp:// datagrams [1500]"
+    parser.add_argument(
+        '--output-mtu',
+        default=1500,
+        type=int,
+        help=help_output_mtu
+        )
+    help_metrics_port = "Serve metrics in the Prometheus text format at "
+    help_metrics_port += "http://host:port/metrics, 0 to disable [0]"
+    parser.add_argument(
+        '--metrics-port',
+        default=0,
+        type=int,
+        help=help_metrics_port
+        )
+    help_metrics_address = "Address to serve metrics on "
+    help_metrics_address += "[all addresses]"
+    parser.add_argument(
+        '--metrics-address',
+        default='',
+        help=help_metrics_address
+        )
+    help_telemetry_interval = "Write piaware2influx's own metrics as line "
+    help_telemetry_interval += "protocol (measurement 'piaware2influx') "
+    help_telemetry_interval += "every this many seconds, 0 to disable [0]"
+    parser.add_argument(
+        '--telemetry-interval',
+        default=0,
+        type=float,
+        help=help_telemetry_interval
+        )
+    help_stage_timing = "Time each stage of processing, logging timings "
+    help_stage_timing += "every --stats-interval seconds. Toggle while "
+    help_stage_timing += "running with SIGUSR2"
+    parser.add_argument(
+        '--stage-timing',
+        action='store_true',
+        help=help_stage_timing
+        )
+    help_profile_dir = "Directory to write profiles to. Send SIGUSR1 to "
+    help_profile_dir += "profile for --profile-seconds [/tmp]"
+    parser.add_argument(
+        '--profile-dir',
+        default='/tmp',
+        help=help_profile_dir
+        )
+    parser.add_argument(
+        '--profile-seconds',
+        default=30,
+        type=float,
+        help="Seconds to profile for on SIGUSR1 [30]"
+        )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help="Profile for --profile-seconds from start up"
+        )
+    help_stats_interval = "Log writer statistics every this many seconds, "
+    help_stats_interval += "0 to disable [300]"
+    parser.add_argument(
+        '--stats-interval',
+        default=300,
+        type=int,
+        help=help_stats_interval
+        )
     parser.add_argument(
         '-v',
         '--verbose',
@@ -805,11 +5401,76 @@ if __name__ == "__main__":
         )
     args = parser.parse_args()
 
-    print(args)
-    print("piaware2influx.py version %s" % (__version__))
-
-    HOST = args.dump1090_server
-    PORT = int(args.dump1090_port)
+    if args.queue_policy == 'spill' and (args.no_spool or not args.spool_dir):
+        parser.error("--queue-policy spill needs --spool-dir")
+
+    try:
+        DEADBANDS = [parse_deadband(spec) for spec in args.deadband]
+    except ValueError as e:
+        parser.error(str(e))
+
+    RECEIVER = None
+    if (args.receiver_lat is None) != (args.receiver_lon is None):
+        parser.error("--receiver-lat and --receiver-lon must be used together")
+    if args.receiver_lat is not None:
+        if not -90 <= args.receiver_lat <= 90:
+            parser.error("--receiver-lat must be between -90 and 90")
+        if not -180 <= args.receiver_lon <= 180:
+            parser.error("--receiver-lon must be between -180 and 180")
+        RECEIVER = (args.receiver_lat, args.receiver_lon, args.receiver_alt)
+
+    ROLLUP_TAGS = ""
+    if args.rollup_rp:
+        if args.rollup_interval <= 0:
+            parser.error("--rollup-rp needs --rollup-interval")
+        if args.influxdb_url or args.output_file:
+            parser.error(
+                "--rollup-rp needs Telegraf, so can't be used with "
+                "--influxdb-url or --output-file")
+        ROLLUP_TAGS = ",rp=" + escape_key(args.rollup_rp)
+
+    if args.replay:
+        try:
+            CAPTURE = open_capture(args.replay)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+        # Replaying never drops points, and runs on the capture's clock
+        args.queue_policy = 'block'
+        args.mode = 'threads'
+        if args.input_format == 'beast' and args.replay_speed > 0:
+            parser.error(
+                "--replay-speed needs a BaseStation capture, Beast frames "
+                "aren't timestamped with the time of day")
+
+    if args.output_file and args.influxdb_url:
+        parser.error("--output-file can't be used with --influxdb-url")
+    if args.output and (args.output_file or args.influxdb_url):
+        parser.error(
+            "--output can't be used with --output-file or --influxdb-url")
+
+    SINK = None
+    if args.output_file:
+        try:
+            SINK = FileSink(args.output_file)
+        except OSError as e:
+            parser.error(str(e))
+        args.no_spool = True
+
+    if args.output:
+        if args.output_mtu < 68:
+            parser.error("--output-mtu must be at least 68")
+        # Delivery is fire-and-forget, so there is nothing to spool
+        args.no_spool = True
+
+    if args.feed:
+        try:
+            FEEDS = [parse_feed(spec) for spec in args.feed]
+        except ValueError as e:
+            parser.error(str(e))
+        if len(set(feed.name for feed in FEEDS)) < len(FEEDS):
+            parser.error("--feed receiver names must be unique")
+    else:
+        FEEDS = [Feed(args.dump1090_server, int(args.dump1090_port))]
 
     if os.getenv('VERBOSE_LOGGING', "").upper().strip() == 'TRUE':
         VERBOSE_LOGGING = True
@@ -818,23 +5479,154 @@ if __name__ == "__main__":
     else:
         VERBOSE_LOGGING = False
 
-    D = ADSB_Processor(
+    counters = setup_logging(VERBOSE_LOGGING)
+    logger.info("%s", argparse.Namespace(**dict(
+        vars(args),
+        influxdb_password='********' if args.influxdb_password else None)))
+    logger.info("piaware2influx.py version %s", __version__)
+
+    if args.influxdb_url:
+        SINK = InfluxDBSink(
+            args.influxdb_url,
+            args.influxdb_db,
+            retention_policy=args.influxdb_rp,
+            username=args.influxdb_user,
+            password=args.influxdb_password,
+            gzip_level=args.influxdb_gzip_level,
+            verbose_logging=VERBOSE_LOGGING,
+            pool_size=args.writers,
+            max_in_flight=args.max_in_flight,
+            timeout=args.telegraf_timeout,
+            )
+        logger.info(
+            "INFLUXDB: Writing to database '%s' at %s",
+            args.influxdb_db, SINK.influxdb_url)
+        SINK.create_database()
+    elif args.output:
+        try:
+            SINK = socket_sink(
+                args.output,
+                mtu=args.output_mtu,
+                verbose_logging=VERBOSE_LOGGING,
+                timeout=args.telegraf_timeout,
+                )
+        except ValueError as e:
+            parser.error(str(e))
+        logger.info("SOCKET: Sending line protocol to %s", SINK.address)
+
+    # Process messages in this process, or in worker processes
+    processor_class = ADSB_Processor
+    processor_options = {}
+    if args.workers > 1:
+        processor_class = ShardedProcessor
+        processor_options['workers'] = args.workers
+
+    D = processor_class(
         telegraf_url=args.telegraf_url,
         verbose_logging=VERBOSE_LOGGING,
+        integer_fields=args.integer_fields,
+        feeds=FEEDS,
+        dedup_window=args.dedup_window if len(FEEDS) > 1 else 0,
+        deadbands=DEADBANDS,
+        min_emit_interval=args.min_emit_interval,
+        coalesce_window=args.coalesce_window,
+        message_clock=bool(args.replay),
+        input_format=args.input_format,
+        receiver=RECEIVER,
+        rollup_interval=args.rollup_interval,
+        rollup_tags=ROLLUP_TAGS,
+        sink=SINK,
+        batch_max_lines=args.batch_lines,
+        batch_max_bytes=args.batch_bytes,
+        batch_linger=args.batch_linger,
+        stats_interval=args.stats_interval,
+        writers=args.writers,
+        max_in_flight=args.max_in_flight,
+        timeout=args.telegraf_timeout,
+        queue_size=args.queue_size,
+        queue_policy=args.queue_policy,
+        spool_dir=None if args.no_spool else args.spool_dir,
+        spool_segment_bytes=args.spool_segment_bytes,
+        spool_replay_rate=args.spool_replay_rate,
+        start_writer=args.mode == 'threads',
+        **processor_options
         )
+    counters.processor = D
 
-    s = setup_socket(HOST, PORT)
-
-    while True:
+    METRICS = Metrics(D)
+    if args.metrics_port:
         try:
-            data = s.recv(1024)
-            #s.send(bytes("\r\n", "UTF-8"))
-            D.add_data_to_buffer(data)
-        except socket.timeout:
-            # print("TIMEOUT!")
-            pass
-        except socket.error:
-            D.log("CONNECT: Disconnected from dump1090!")
-            s.close()
-            time.sleep(1)
-            s = setup_socket(HOST, PORT)
+            METRICS.start_server(args.metrics_port, args.metrics_address)
+        except OSError as e:
+            logger.error("ERROR: could not serve metrics! %r", e)
+    if args.telemetry_interval > 0:
+        METRICS.start_telemetry(args.telemetry_interval)
+
+    # Stage timing and profiling can be started without a restart
+    if args.stage_timing:
+        D.timings.enable()
+    PROFILER = Profiler(D, args.profile_dir)
+    if args.profile:
+        PROFILER.start(args.profile_seconds)
+    signal.signal(
+        signal.SIGUSR1, in_thread(PROFILER.start, args.profile_seconds))
+    signal.signal(signal.SIGUSR2, in_thread(D.timings.toggle))
+
+    if args.replay:
+        started = time.monotonic()
+        with CAPTURE:
+            replay_capture(D, CAPTURE, args.replay_speed, args.recv_size)
+        if isinstance(D, ShardedProcessor):
+            D.stop_workers()
+        else:
+            D.flush_pending()
+        D.writer.stop()
+        elapsed = time.monotonic() - started
+        logger.info(
+            "REPLAY: %d messages in %.1f s (%.0f messages/s), "
+            "%d points written",
+            D.messages_processed,
+            elapsed,
+            D.messages_processed / elapsed if elapsed > 0 else 0,
+            D.points_sent)
+        sys.exit(0)
+
+    if args.mode == 'asyncio':
+        runtime = AsyncRuntime(
+            D,
+            recv_size=args.recv_size,
+            max_in_flight=args.max_in_flight or args.writers,
+            reconnect_max=args.reconnect_max,
+            )
+        runtime.run()
+        sys.exit(0)
+
+    # Stop on SIGINT or SIGTERM, from a thread as D.lock may be held
+    STOPPING = threading.Event()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, in_thread(STOPPING.set))
+
+    # Read each feed in its own thread
+    read_threads = []
+    for feed in FEEDS:
+        read_thread = threading.Thread(
+            target=read_feed,
+            args=(D, feed, args.recv_size, args.reconnect_max, STOPPING),
+            )
+        read_thread.daemon = True
+        read_thread.start()
+        read_threads.append(read_thread)
+    STOPPING.wait()
+
+    logger.info("Stopping, sending queued points")
+    # Readers notice within a second, unless waiting to reconnect, in
+    # which case they stop before reading anything more
+    for read_thread in read_threads:
+        read_thread.join(2)
+    with D.lock:
+        if isinstance(D, ShardedProcessor):
+            D.stop_workers()
+        else:
+            D.flush_pending()
+    D.writer.stop()
+    sys.exit(0)
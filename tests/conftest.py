@@ -0,0 +1,12 @@
+"""
+Shared test set up.
+
+piaware2influx.py is a script rather than a package, so make it
+importable from rootfs/ for every test module.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', 'rootfs'))
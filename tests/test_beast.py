@@ -0,0 +1,177 @@
+"""
+Tests for splitting and decoding Beast binary frames.
+"""
+
+import pytest
+
+import piaware2influx as p2i
+
+
+SECOND = 1000000000
+
+# KLM1023 identification
+IDENTIFICATION = '8D4840D6202CC371C32CE0576098'
+# Even and odd airborne positions of 40621D
+EVEN = '8D40621D58C382D690C8AC2863A7'
+ODD = '8D40621D58C386435CC412692AD6'
+
+
+def frame(message, clock=0, signal=255):
+    """
+    Return a frame as split_beast_frames returns it.
+    """
+    return (clock.to_bytes(6, 'big') + bytes([signal]) +
+            bytes.fromhex(message))
+
+
+def escaped(body):
+    """
+    Return the Beast encoding of a frame body.
+    """
+    frame_type = b'3' if len(body) == 21 else b'2'
+    return b'\x1a' + frame_type + body.replace(b'\x1a', b'\x1a\x1a')
+
+
+def decode(decoder, frames, received=1000 * SECOND):
+    decoder.receive(frames, received)
+    return [decoder.decode(frame) for frame in frames]
+
+
+def all_call(address, signal):
+    data = bytes([(11 << 3) | 5]) + address.to_bytes(3, 'big')
+    return frame(
+        (data + p2i.modes_crc(data).to_bytes(3, 'big')).hex(), signal=signal)
+
+
+def test_crc():
+    message = bytes.fromhex(IDENTIFICATION)
+    assert p2i.modes_crc(message[:11]) == int.from_bytes(message[11:], 'big')
+
+
+def test_crc_mismatch():
+    message = bytearray.fromhex(IDENTIFICATION)
+    message[5] ^= 0x01
+    assert decode(p2i.BeastDecoder(), [frame(message.hex())]) == [
+        (None, 'crc')]
+
+
+def test_identification():
+    [(message, reason)] = decode(
+        p2i.BeastDecoder(), [frame(IDENTIFICATION)])
+    assert reason is None
+    assert message.transmission_type == 1
+    assert message.hexident == '4840D6'
+    assert message.callsign == 'KLM1023'
+
+
+def test_identity():
+    assert p2i.decode_id13(0x092D) == 0x1346
+
+
+def test_altitude_25ft():
+    assert p2i.decode_ac13(0x14B4) == 32300
+
+
+def test_gillham_altitudes():
+    # D2 D4 A1 A2 A4 B1 B2 B4 C1 C2 C4, in 0xABCD digit order
+    bits = (0x0002, 0x0004, 0x1000, 0x2000, 0x4000, 0x0100, 0x0200, 0x0400,
+            0x0010, 0x0020, 0x0040)
+    codes = {}
+    for n in range(1 << len(bits)):
+        digits = sum(bit for i, bit in enumerate(bits) if n >> i & 1)
+        altitude = p2i.gillham_altitude(digits)
+        if altitude is not None:
+            assert altitude not in codes
+            codes[altitude] = digits
+    assert sorted(codes) == list(range(-1200, 126800, 100))
+    # A Gray code: each 100 ft step changes a single bit
+    for altitude in range(-1200, 126700, 100):
+        changed = codes[altitude] ^ codes[altitude + 100]
+        assert changed & (changed - 1) == 0
+    # D2 is the most significant bit
+    assert all(altitude > 60000 for altitude, digits in codes.items()
+               if digits & 0x0002)
+
+
+def test_gillham_ac13():
+    # C1 and B1 with neither M nor Q set, as a 13 bit altitude code
+    ac13 = 0x1000 | 0x0020
+    assert p2i.decode_id13(ac13) == 0x0110
+    assert p2i.decode_ac13(ac13) == p2i.gillham_altitude(0x0110)
+    assert p2i.decode_ac13(ac13 | 0x0040) is None
+
+
+def test_cpr_pair():
+    decoder = p2i.BeastDecoder()
+    results = decode(decoder, [frame(ODD, 0), frame(EVEN, 12000000)])
+    # A single frame is only decoded once there is a pair
+    assert results[0][0].latitude is None
+    message, reason = results[1]
+    assert reason is None
+    assert message.transmission_type == 3
+    assert message.hexident == '40621D'
+    assert message.altitude == 38000
+    assert message.latitude == pytest.approx(52.2572, abs=0.0001)
+    assert message.longitude == pytest.approx(3.91937, abs=0.0001)
+
+
+def test_split_frames():
+    bodies = [frame(IDENTIFICATION, 0x1a1a1a1a1a1a, 0x1a),
+              frame('5D40621D' + '1a1a1a', 7)]
+    buffer = bytearray(b'junk' + b''.join(escaped(body) for body in bodies))
+    assert p2i.split_beast_frames(buffer) == bodies
+    assert buffer == b''
+
+
+def test_split_frames_skips_mode_ac():
+    body = frame(IDENTIFICATION)
+    buffer = bytearray(b'\x1a1' + bytes(9) + escaped(body))
+    assert p2i.split_beast_frames(buffer) == [body]
+
+
+def test_split_frames_keeps_partial_frame():
+    data = escaped(frame(IDENTIFICATION, 0x1a))
+    buffer = bytearray(data[:10])
+    assert p2i.split_beast_frames(buffer) == []
+    assert buffer == data[:10]
+    buffer.extend(data[10:])
+    assert p2i.split_beast_frames(buffer) == [frame(IDENTIFICATION, 0x1a)]
+
+
+def test_timestamps_from_clock():
+    decoder = p2i.BeastDecoder()
+    results = decode(decoder, [
+        frame(IDENTIFICATION, 0),
+        frame(IDENTIFICATION, 6000000),
+        frame(IDENTIFICATION, 12000000),
+        ])
+    assert [message.timestamp for message, _ in results] == [
+        999 * SECOND, 999 * SECOND + SECOND // 2, 1000 * SECOND]
+
+
+def test_timestamps_strictly_increase():
+    decoder = p2i.BeastDecoder()
+    first = decode(decoder, [frame(IDENTIFICATION, 5)] * 3)
+    # A clock that isn't running at 12 MHz, or a later read received
+    # at the same time
+    second = decode(decoder, [frame(IDENTIFICATION, 1 << 40),
+                              frame(IDENTIFICATION, 0)])
+    timestamps = [message.timestamp for message, _ in first + second]
+    assert timestamps == [1000 * SECOND + i for i in range(5)]
+
+
+def test_rssi_of_held_point():
+    processor = p2i.ADSB_Processor(
+        None, start_writer=False, input_format='beast',
+        receiver=(52.0, 4.0, 0))
+    # The position is held back for its geometry while a later message
+    # from the same aircraft arrives at another signal level
+    processor.process_lines(
+        [frame(ODD, 0, 200), frame(EVEN, 12000000, 128),
+         all_call(0x40621D, 64)],
+        processor.feed, 1000 * SECOND)
+    lines = []
+    while not processor.write_q.empty():
+        lines.append(processor.write_q.get_nowait())
+    [position] = [line for line in lines if 'current_latitude' in line]
+    assert ',rssi=%s ' % (p2i.BEAST_RSSI[128]) in position
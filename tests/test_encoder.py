@@ -0,0 +1,80 @@
+"""
+Tests for encoding points as line protocol.
+"""
+
+import pytest
+
+import piaware2influx as p2i
+
+
+def vessel(callsign='', squawk=None):
+    vessel = p2i.Vessel('7C6DB8')
+    vessel.callsign = callsign
+    vessel.squawk = squawk
+    return vessel
+
+
+def test_encode():
+    encoder = p2i.LineProtocolEncoder()
+    assert encoder.encode(
+        vessel('QFA123', 7700), 1792260342491000000,
+        (('current_altitude', 6700), ('current_latitude', -30.29652))
+        ) == ("piaware,hexident=7C6DB8,callsign=QFA123,squawk=7700 "
+              "current_altitude=6700,current_latitude=-30.29652 "
+              "1792260342491000000")
+
+
+@pytest.mark.parametrize('callsign, escaped', [
+    ('QFA 1', 'QFA\\ 1'),
+    ('QFA,1', 'QFA\\,1'),
+    ('QFA=1', 'QFA\\=1'),
+    ('A B,C=D', 'A\\ B\\,C\\=D'),
+    ])
+def test_tag_escaping(callsign, escaped):
+    encoder = p2i.LineProtocolEncoder()
+    encoded = encoder.encode(vessel(callsign), 1, (('current_track', 1.5),))
+    assert encoded == (
+        "piaware,hexident=7C6DB8,callsign=%s current_track=1.5 1" % (
+            escaped))
+
+
+def test_measurement_escaping():
+    encoder = p2i.LineProtocolEncoder(measurement='pi aware,x')
+    assert encoder.encode(vessel(), 1, (('current_track', 1.5),)) == (
+        "pi\\ aware\\,x,hexident=7C6DB8 current_track=1.5 1")
+
+
+def test_tagset_cached():
+    encoder = p2i.LineProtocolEncoder()
+    aircraft = vessel('QFA1')
+    encoder.encode(aircraft, 1, (('current_track', 1.5),))
+    assert aircraft.tagset == "piaware,hexident=7C6DB8,callsign=QFA1"
+
+
+def test_feed_tags():
+    encoder = p2i.LineProtocolEncoder()
+    feed = p2i.Feed('127.0.0.1', 30003, 'roof top')
+    assert encoder.encode(
+        vessel(), 1, (('current_track', 1.5),), feed.tags) == (
+        "piaware,hexident=7C6DB8,receiver=roof\\ top current_track=1.5 1")
+
+
+def test_field_types():
+    encoder = p2i.LineProtocolEncoder()
+    assert encoder.encode(vessel(), 1, (
+        ('a', 1), ('b', 1.5), ('c', True), ('d', 'x "y"'))) == (
+        'piaware,hexident=7C6DB8 a=1,b=1.5,c=true,d="x \\"y\\"" 1')
+
+
+def test_integer_fields():
+    encoder = p2i.LineProtocolEncoder(integer_fields=True)
+    assert encoder.encode(vessel(), 1, (('current_altitude', 6700),)) == (
+        "piaware,hexident=7C6DB8 current_altitude=6700i 1")
+
+
+def test_skips_missing_and_non_finite():
+    encoder = p2i.LineProtocolEncoder()
+    assert encoder.encode(vessel(), 1, (
+        ('a', None), ('b', float('nan')), ('c', float('inf')), ('d', 2))
+        ) == "piaware,hexident=7C6DB8 d=2 1"
+    assert encoder.encode(vessel(), 1, (('a', None),)) is None
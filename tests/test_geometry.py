@@ -0,0 +1,66 @@
+"""
+Tests for adding the range, bearing and elevation from the receiver.
+"""
+
+import math
+
+import pytest
+
+import piaware2influx as p2i
+
+
+INVALID_POSITIONS = [
+    (float('inf'), 115.0),
+    (-31.0, float('-inf')),
+    (float('nan'), 115.0),
+    (-31.0, float('nan')),
+    (91.0, 115.0),
+    (-31.0, 181.0),
+    ]
+
+
+def geometry():
+    return p2i.ReceiverGeometry(-31.95, 115.86, 100)
+
+
+def point(latitude, longitude):
+    vessel = p2i.Vessel('7C6DB8')
+    return vessel, (0, (('current_altitude', 30000),
+                        ('current_latitude', latitude),
+                        ('current_longitude', longitude)), None), None
+
+
+def test_compute():
+    distance, bearing, elevation = geometry().compute(-31.0, 115.86, 30000)
+    assert distance == pytest.approx(57.0, abs=0.1)
+    assert bearing == 0.0
+    assert elevation > 0
+
+
+@pytest.mark.parametrize('latitude, longitude', INVALID_POSITIONS)
+def test_compute_invalid(latitude, longitude):
+    assert geometry().compute(latitude, longitude, 30000) == (
+        None, None, None)
+
+
+@pytest.mark.parametrize('latitude, longitude', INVALID_POSITIONS)
+def test_add_invalid(latitude, longitude):
+    receiver = geometry()
+    assert not receiver.add(*point(latitude, longitude))
+    assert receiver.flush() == []
+
+
+def test_compute_numpy_invalid():
+    if p2i.numpy is None:
+        pytest.skip("NumPy isn't installed")
+    receiver = geometry()
+    latitudes = [-31.0] + [latitude for latitude, _ in INVALID_POSITIONS]
+    longitudes = [115.86] + [longitude for _, longitude in INVALID_POSITIONS]
+    altitudes = [30000] * len(latitudes)
+    results = list(zip(*receiver.compute_numpy(
+        latitudes, longitudes, altitudes)))
+    assert results[0] == receiver.compute(-31.0, 115.86, 30000)
+    assert results[1:] == [(None, None, None)] * len(INVALID_POSITIONS)
+    assert all(
+        value is None or math.isfinite(value)
+        for result in results for value in result)
@@ -0,0 +1,44 @@
+"""
+Tests for collecting metrics.
+"""
+
+import threading
+
+import piaware2influx as p2i
+
+
+LINE = ("MSG,3,1,1,7C6DB8,1,2026/10/17,18:05:42.461,2026/10/17,18:05:42.461,"
+        ",34800,,,-31.0,115.0,,,0,0,0,0\r\n")
+
+
+def samples(metrics, name):
+    for metric, _, _, metric_samples in metrics.collect():
+        if metric == name:
+            return metric_samples
+
+
+def test_collect():
+    processor = p2i.ADSB_Processor(None, start_writer=False)
+    processor.add_data_to_buffer(LINE.encode())
+    processor.add_data_to_buffer(b"MSG,3\r\n")
+    metrics = p2i.Metrics(processor)
+    assert samples(metrics, 'messages_received_total') == [('', (), 2)]
+    assert samples(metrics, 'messages_parsed_total') == [
+        ('', (('msg_type', '3'),), 1)]
+
+
+def test_collect_while_reader_holds_lock():
+    processor = p2i.ADSB_Processor(None, start_writer=False)
+    metrics = p2i.Metrics(processor)
+    collected = threading.Event()
+
+    def collect():
+        metrics.collect()
+        collected.set()
+
+    # As when a reader is waiting for room in a full write queue
+    with processor.lock:
+        thread = threading.Thread(target=collect)
+        thread.daemon = True
+        thread.start()
+        assert collected.wait(5)
@@ -0,0 +1,55 @@
+"""
+Tests for parsing BaseStation messages.
+"""
+
+import pytest
+
+import piaware2influx as p2i
+
+
+LINE = ("MSG,3,1,1,7C6DB8,1,2026/10/17,18:05:42.461,2026/10/17,18:05:42.461,"
+        ",34800,,,-30.53428,114.55173,,,0,0,0,0")
+
+# Field index of each numeric field
+NUMERIC_FIELDS = {
+    'altitude': 11,
+    'groundspeed': 12,
+    'track': 13,
+    'latitude': 14,
+    'longitude': 15,
+    'verticalrate': 16,
+    'squawk': 17,
+    }
+
+
+def with_field(index, value):
+    fields = LINE.split(',')
+    fields[index] = value
+    return ",".join(fields)
+
+
+def test_parse_valid():
+    message, reason = p2i.parse_sbs_message(LINE)
+    assert reason is None
+    assert message.hexident == '7C6DB8'
+    assert message.altitude == 34800
+    assert message.latitude == -30.53428
+    assert message.longitude == 114.55173
+
+
+@pytest.mark.parametrize('field', sorted(NUMERIC_FIELDS))
+@pytest.mark.parametrize('value', ['inf', '-inf', 'nan', '1e999', 'Infinity'])
+def test_parse_non_finite(field, value):
+    message, reason = p2i.parse_sbs_message(
+        with_field(NUMERIC_FIELDS[field], value))
+    assert message is None
+    assert reason == 'bad_number'
+
+
+@pytest.mark.parametrize('value', ['inf', 'nan', '1e999'])
+def test_process_non_finite(value):
+    processor = p2i.ADSB_Processor(None, start_writer=False)
+    processor.add_data_to_buffer(
+        (with_field(NUMERIC_FIELDS['altitude'], value) + "\r\n").encode())
+    assert processor.parse_failures['bad_number'] == 1
+    assert processor.vessels == 0
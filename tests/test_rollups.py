@@ -0,0 +1,58 @@
+"""
+Tests for rollups of each window of messages.
+"""
+
+import pytest
+
+import piaware2influx as p2i
+
+
+LINE = ("MSG,3,1,1,7C6DB8,1,2026/10/17,18:05:42.461,2026/10/17,18:05:42.461,"
+        ",34800,,,%s,%s,,,0,0,0,0")
+
+
+def test_position():
+    rollups = p2i.Rollups(60)
+    rollups.roll(0)
+    rollups.position(50.0, 95.0)
+    rollups.position(40.0, 99.9)
+    assert rollups.ranges == {90: 50.0}
+
+
+@pytest.mark.parametrize('distance, bearing', [
+    (float('nan'), 90.0),
+    (50.0, float('nan')),
+    (float('inf'), 90.0),
+    (50.0, float('inf')),
+    (None, None),
+    ])
+def test_position_not_finite(distance, bearing):
+    rollups = p2i.Rollups(60)
+    rollups.roll(0)
+    rollups.position(distance, bearing)
+    assert rollups.ranges == {}
+    assert not any(
+        line.startswith('piaware_range') for line in rollups.flush())
+
+
+@pytest.mark.parametrize('latitude, longitude', [
+    ('nan', '115.0'),
+    ('-31.0', 'inf'),
+    ('91.0', '115.0'),
+    ('-31.0', '115.0'),
+    ])
+def test_process_position(latitude, longitude):
+    processor = p2i.ADSB_Processor(
+        None, start_writer=False, receiver=(-31.95, 115.86, 0),
+        rollup_interval=60)
+    processor.add_data_to_buffer(
+        (LINE % (latitude, longitude) + "\r\n").encode())
+    processor.flush_pending()
+    lines = []
+    while not processor.write_q.empty():
+        lines.append(processor.write_q.get_nowait())
+    ranges = [line for line in lines if line.startswith('piaware_range')]
+    if (latitude, longitude) == ('-31.0', '115.0'):
+        assert len(ranges) == 1
+    else:
+        assert ranges == []
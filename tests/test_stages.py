@@ -0,0 +1,158 @@
+"""
+Tests for the stages between vessel state and encoding: deduplication,
+deadbands and coalescing.
+"""
+
+import piaware2influx as p2i
+
+
+SECOND = 1000000000
+
+POSITION = (('current_latitude', -31.0), ('current_longitude', 115.0))
+VELOCITY = (('current_groundspeed', 400.0), ('current_track', 90.0))
+
+
+def feeds():
+    return p2i.Feed('a', 30003, 'a'), p2i.Feed('b', 30003, 'b')
+
+
+def test_duplicate_from_other_feed():
+    dedup = p2i.Deduplicator(2)
+    a, b = feeds()
+    assert not dedup.duplicate('7C6DB8', 0, POSITION, a)
+    assert dedup.duplicate('7C6DB8', SECOND, POSITION, b)
+    assert dedup.duplicates == 1
+
+
+def test_not_duplicate_from_same_feed():
+    dedup = p2i.Deduplicator(2)
+    a, _ = feeds()
+    assert not dedup.duplicate('7C6DB8', 0, POSITION, a)
+    assert not dedup.duplicate('7C6DB8', SECOND, POSITION, a)
+
+
+def test_not_duplicate_outside_window():
+    dedup = p2i.Deduplicator(2)
+    a, b = feeds()
+    assert not dedup.duplicate('7C6DB8', 0, POSITION, a)
+    assert not dedup.duplicate('7C6DB8', 3 * SECOND, POSITION, b)
+    assert dedup.duplicates == 0
+
+
+def test_not_duplicate_different_values_or_vessel():
+    dedup = p2i.Deduplicator(2)
+    a, b = feeds()
+    assert not dedup.duplicate('7C6DB8', 0, POSITION, a)
+    assert not dedup.duplicate('7C6DB8', 0, VELOCITY, b)
+    assert not dedup.duplicate('7C6DB9', 0, POSITION, b)
+
+
+def test_dedup_forgets_old_points():
+    dedup = p2i.Deduplicator(2)
+    a, _ = feeds()
+    for second in range(10):
+        dedup.duplicate('7C6DB8', second * SECOND, (('n', second),), a)
+    assert len(dedup.seen) == 3
+
+
+def test_emit_first_point():
+    emit = p2i.EmitFilter(min_interval=10)
+    vessel = p2i.Vessel('7C6DB8')
+    assert emit.due(vessel, 0, POSITION)
+
+
+def test_emit_min_interval():
+    emit = p2i.EmitFilter(min_interval=10)
+    vessel = p2i.Vessel('7C6DB8')
+    assert emit.due(vessel, 0, (('current_track', 90.0),))
+    assert not emit.due(vessel, 5 * SECOND, (('current_track', 95.0),))
+    assert emit.due(vessel, 10 * SECOND, (('current_track', 95.0),))
+    assert emit.suppressed == 1
+
+
+def test_emit_deadband():
+    emit = p2i.EmitFilter([('current_altitude', 100, None)])
+    vessel = p2i.Vessel('7C6DB8')
+    assert emit.due(vessel, 0, (('current_altitude', 1000),))
+    assert not emit.due(vessel, SECOND, (('current_altitude', 1050),))
+    assert emit.due(vessel, 2 * SECOND, (('current_altitude', 1100),))
+    # Measured from the last value written, not the last seen
+    assert not emit.due(vessel, 3 * SECOND, (('current_altitude', 1150),))
+
+
+def test_emit_deadband_max_age():
+    emit = p2i.EmitFilter([('current_altitude', 100, 10)])
+    vessel = p2i.Vessel('7C6DB8')
+    assert emit.due(vessel, 0, (('current_altitude', 1000),))
+    assert not emit.due(vessel, 5 * SECOND, (('current_altitude', 1000),))
+    assert emit.due(vessel, 10 * SECOND, (('current_altitude', 1000),))
+
+
+def test_emit_any_field_due():
+    emit = p2i.EmitFilter([('current_altitude', 100, None)])
+    vessel = p2i.Vessel('7C6DB8')
+    assert emit.due(vessel, 0, (('current_altitude', 1000),))
+    # A new field is due, so the whole point is written
+    assert emit.due(vessel, SECOND, (
+        ('current_altitude', 1000), ('current_track', 90.0)))
+
+
+def test_parse_deadband():
+    assert p2i.parse_deadband('current_altitude=25:10') == (
+        'current_altitude', 25.0, 10.0)
+    assert p2i.parse_deadband('current_track=2') == (
+        'current_track', 2.0, None)
+
+
+def test_coalesce_within_window():
+    coalescer = p2i.Coalescer(1)
+    vessel = p2i.Vessel('7C6DB8')
+    a, b = feeds()
+    assert coalescer.add(vessel, (0, POSITION, -10.0), a) == []
+    assert coalescer.add(vessel, (SECOND // 2, VELOCITY, -20.0), b) == []
+    assert coalescer.coalesced == 1
+    assert coalescer.flush() == [
+        (vessel, (SECOND // 2, POSITION + VELOCITY, -20.0), a)]
+
+
+def test_coalesce_keeps_latest_signal_level():
+    coalescer = p2i.Coalescer(1)
+    vessel = p2i.Vessel('7C6DB8')
+    a, _ = feeds()
+    coalescer.add(vessel, (SECOND // 2, POSITION, -10.0), a)
+    coalescer.add(vessel, (0, VELOCITY, -20.0), a)
+    assert coalescer.flush() == [
+        (vessel, (SECOND // 2, POSITION + VELOCITY, -10.0), a)]
+
+
+def test_coalesce_conflicting_value_releases():
+    coalescer = p2i.Coalescer(1)
+    vessel = p2i.Vessel('7C6DB8')
+    a, _ = feeds()
+    coalescer.add(vessel, (0, (('current_track', 90.0),), None), a)
+    ready = coalescer.add(vessel, (1, (('current_track', 91.0),), None), a)
+    assert ready == [(vessel, (0, (('current_track', 90.0),), None), a)]
+    assert coalescer.flush() == [
+        (vessel, (1, (('current_track', 91.0),), None), a)]
+
+
+def test_coalesce_outside_window():
+    coalescer = p2i.Coalescer(1)
+    vessel = p2i.Vessel('7C6DB8')
+    a, _ = feeds()
+    coalescer.add(vessel, (0, POSITION, None), a)
+    ready = coalescer.add(vessel, (2 * SECOND, VELOCITY, None), a)
+    assert ready == [(vessel, (0, POSITION, None), a)]
+
+
+def test_coalesce_expire():
+    coalescer = p2i.Coalescer(1)
+    first = p2i.Vessel('7C6DB8')
+    second = p2i.Vessel('7C6DB9')
+    a, _ = feeds()
+    coalescer.add(first, (0, POSITION, None), a)
+    coalescer.add(second, (SECOND, POSITION, None), a)
+    assert coalescer.expire(SECOND) == []
+    assert coalescer.expire(SECOND + 1) == [(first, (0, POSITION, None), a)]
+    assert coalescer.flush() == [(second, (SECOND, POSITION, None), a)]
+    assert coalescer.flush() == []
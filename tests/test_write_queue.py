@@ -0,0 +1,207 @@
+"""
+Tests for the write queue's overflow policies and the on-disk spool.
+"""
+
+import threading
+
+import pytest
+
+import piaware2influx as p2i
+
+
+class RecordingSink():
+    """
+    Sink that records what it is sent, and can be made to fail.
+    """
+
+    def __init__(self, healthy=True):
+        self.healthy = healthy
+        self.payloads = []
+
+    def send(self, line_protocol):
+        if not self.healthy:
+            return False
+        self.payloads.append(line_protocol)
+        return True
+
+    def close(self):
+        pass
+
+
+def line(timestamp):
+    return "piaware,hexident=7C6DB8 current_altitude=%d %d" % (
+        timestamp, timestamp)
+
+
+def drain(write_q):
+    lines = []
+    while not write_q.empty():
+        lines.append(write_q.get_nowait())
+    return lines
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        p2i.WriteQueue(2, 'drop-everything')
+
+
+def test_spill_needs_spool():
+    with pytest.raises(ValueError):
+        p2i.WriteQueue(2, 'spill')
+
+
+def test_drop_oldest():
+    write_q = p2i.WriteQueue(2, 'drop-oldest')
+    for timestamp in range(4):
+        write_q.offer(line(timestamp))
+    assert drain(write_q) == [line(2), line(3)]
+    assert write_q.dropped_oldest == 2
+    assert write_q.max_depth == 2
+
+
+def test_drop_oldest_keeps_stop_marker():
+    write_q = p2i.WriteQueue(1, 'drop-oldest')
+    write_q.offer(line(0))
+    write_q.get_nowait()
+    write_q.put_stop()
+    write_q.offer(line(1))
+    assert drain(write_q) == [None]
+    assert write_q.dropped_newest == 1
+
+
+def test_stop_marker_ignores_bound():
+    write_q = p2i.WriteQueue(1, 'block')
+    write_q.offer(line(0))
+    write_q.put_stop()
+    assert drain(write_q) == [line(0), None]
+
+
+def test_drop_newest():
+    write_q = p2i.WriteQueue(2, 'drop-newest')
+    for timestamp in range(4):
+        write_q.offer(line(timestamp))
+    assert drain(write_q) == [line(0), line(1)]
+    assert write_q.dropped_newest == 2
+
+
+def test_unbounded():
+    write_q = p2i.WriteQueue(0, 'drop-newest')
+    for timestamp in range(100):
+        write_q.offer(line(timestamp))
+    assert write_q.qsize() == 100
+    assert write_q.dropped_newest == 0
+
+
+def test_block_waits_for_room():
+    write_q = p2i.WriteQueue(1, 'block')
+    write_q.offer(line(0))
+    offered = threading.Event()
+
+    def offer():
+        write_q.offer(line(1))
+        offered.set()
+
+    thread = threading.Thread(target=offer)
+    thread.daemon = True
+    thread.start()
+    assert not offered.wait(0.1)
+    assert write_q.get_nowait() == line(0)
+    assert offered.wait(5)
+    assert drain(write_q) == [line(1)]
+
+
+def test_block_left_to_caller():
+    write_q = p2i.WriteQueue(1, 'block')
+    write_q.wait_when_full = False
+    write_q.offer(line(0))
+    write_q.offer(line(1))
+    assert drain(write_q) == [line(0), line(1)]
+
+
+def test_spill(tmp_path):
+    spool = p2i.Spool(str(tmp_path))
+    write_q = p2i.WriteQueue(1, 'spill', spool)
+    for timestamp in range(3):
+        write_q.offer(line(timestamp))
+    assert drain(write_q) == [line(0)]
+    assert write_q.spilled == 2
+    segment, lines = spool.oldest()
+    assert lines == [line(1), line(2)]
+
+
+def test_spool_sorts_by_timestamp(tmp_path):
+    spool = p2i.Spool(str(tmp_path))
+    spool.append([line(3), line(1)])
+    spool.append([line(2)])
+    segment, lines = spool.oldest()
+    assert lines == [line(1), line(2), line(3)]
+    spool.remove(segment)
+    assert not spool.has_data()
+    assert spool.oldest() == (None, [])
+
+
+def test_spool_segments(tmp_path):
+    spool = p2i.Spool(str(tmp_path), segment_max_bytes=1)
+    spool.append([line(1)])
+    spool.append([line(2)])
+    segment, lines = spool.oldest()
+    assert lines == [line(1)]
+    spool.remove(segment)
+    segment, lines = spool.oldest()
+    assert lines == [line(2)]
+
+
+def test_spool_picks_up_leftovers(tmp_path):
+    spool = p2i.Spool(str(tmp_path))
+    spool.append([line(1)])
+    spool.close()
+    spool = p2i.Spool(str(tmp_path))
+    assert spool.has_data()
+    spool.append([line(2)])
+    assert spool.oldest()[1] == [line(1)]
+
+
+def test_writer_spools_and_replays(tmp_path):
+    sink = RecordingSink(healthy=False)
+    writer = p2i.LineProtocolWriter(
+        sink=sink, spool_dir=str(tmp_path), stats_interval=0)
+    batch = [line(2), line(1)]
+    writer.flush(batch)
+    assert writer.points_spooled == 2
+    assert writer.points_sent == 0
+
+    sink.healthy = True
+    segment, lines = writer.spool.oldest()
+    assert writer.replay(lines)
+    writer.spool.remove(segment)
+    assert sink.payloads == [("\n".join([line(1), line(2)])).encode()]
+    assert writer.points_replayed == 2
+    assert not writer.spool.has_data()
+
+
+def test_writer_stops_with_full_queue():
+    sink = RecordingSink()
+    writer = p2i.LineProtocolWriter(
+        sink=sink, queue_size=2, stats_interval=0, batch_linger=0)
+    writer.write_q.offer(line(0))
+    writer.write_q.offer(line(1))
+    writer.start()
+    writer.stop()
+    assert sink.payloads == [("\n".join([line(0), line(1)])).encode()]
+
+
+def test_writer_runs_without_unusable_spool(tmp_path):
+    not_a_directory = tmp_path / 'spool'
+    not_a_directory.write_text('')
+    writer = p2i.LineProtocolWriter(
+        sink=RecordingSink(), spool_dir=str(not_a_directory),
+        queue_policy='spill', stats_interval=0)
+    assert writer.spool is None
+    assert writer.write_q.policy == 'block'
+
+
+def test_writer_without_spool_counts_failures():
+    writer = p2i.LineProtocolWriter(
+        sink=RecordingSink(healthy=False), stats_interval=0)
+    writer.flush([line(1)])
+    assert writer.points_failed == 1